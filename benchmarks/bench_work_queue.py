@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Time the work-queue, retention and dedup queries with and without the indexes.
+
+Creates a scratch database per size, fills it with message groups of which
+90% already have a cleaned listing (the oldest ones, as in production) and
+times each query as it ran before and after the add_work_queue_columns
+migration. Usage:
+    python -m benchmarks.bench_work_queue --sizes 10000 100000 1000000
+"""
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from sqlalchemy import create_engine, insert, text
+
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.database.models import Base, MessageGroup, CleanedListing, STATE_PENDING, STATE_DONE
+from src.database.migrations.add_work_queue_columns import INDEXES
+
+INSERT_BATCH = 50000
+PROCESSED_SHARE = 0.9
+CHANNELS = 50
+
+# Query name -> (query before the migration, query after it)
+QUERIES = {
+    'next unprocessed': (
+        "SELECT message_groups.id FROM message_groups "
+        "LEFT OUTER JOIN cleaned_listings ON message_groups.id = cleaned_listings.group_id "
+        "WHERE cleaned_listings.id IS NULL ORDER BY message_groups.id LIMIT 1",
+        "SELECT id FROM message_groups WHERE processing_state = 'pending' ORDER BY id LIMIT 1",
+    ),
+    'retention chunk': (
+        "SELECT id FROM message_groups WHERE posted_date < :cutoff ORDER BY id LIMIT 1000",
+    ) * 2,
+    'duplicate check': (
+        "SELECT id FROM message_groups WHERE channel_id = :channel_id AND group_id = :group_id",
+    ) * 2,
+    'listing of group': (
+        "SELECT id FROM cleaned_listings WHERE group_id = :group_id",
+    ) * 2,
+}
+
+def populate(engine, size):
+    """Insert `size` groups; the oldest PROCESSED_SHARE of them are processed."""
+    processed = int(size * PROCESSED_SHARE)
+    start = datetime(2024, 1, 1)
+    with engine.begin() as conn:
+        for offset in range(0, size, INSERT_BATCH):
+            ids = range(offset + 1, min(size, offset + INSERT_BATCH) + 1)
+            conn.execute(insert(MessageGroup), [
+                {
+                    'id': i,
+                    'channel_id': i % CHANNELS,
+                    'group_id': i,
+                    'combined_text': 'listing',
+                    'posted_date': start + timedelta(minutes=i),
+                    'processing_state': STATE_DONE if i <= processed else STATE_PENDING,
+                }
+                for i in ids
+            ])
+            conn.execute(insert(CleanedListing), [
+                {'group_id': i, 'original_text': 'listing'} for i in ids if i <= processed
+            ])
+    return start + timedelta(minutes=size // 2)
+
+def time_query(engine, sql, params, repeats):
+    """Return the median duration of a query in milliseconds."""
+    durations = []
+    with engine.connect() as conn:
+        for _ in range(repeats):
+            started = time.perf_counter()
+            conn.execute(text(sql), params).fetchall()
+            durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations)
+
+def run(size, repeats):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(f"sqlite:///{Path(tmp) / 'bench.db'}")
+        Base.metadata.create_all(engine)
+        started = time.perf_counter()
+        cutoff = populate(engine, size)
+        print(f"\n{size:,} groups (populated in {time.perf_counter() - started:.1f}s)")
+        params = {'cutoff': cutoff, 'channel_id': size % CHANNELS, 'group_id': size}
+
+        after = {name: time_query(engine, queries[1], params, repeats) for name, queries in QUERIES.items()}
+        with engine.begin() as conn:
+            for name in INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        before = {name: time_query(engine, queries[0], params, repeats) for name, queries in QUERIES.items()}
+        engine.dispose()
+
+    print(f"{'query':<20}{'before ms':>12}{'after ms':>12}")
+    for name in QUERIES:
+        print(f"{name:<20}{before[name]:>12.3f}{after[name]:>12.3f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark work-queue queries before and after indexing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10000, 100000, 1000000], help="Numbers of groups")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per query, the median is reported")
+    args = parser.parse_args()
+    for size in args.sizes:
+        run(size, args.repeats)
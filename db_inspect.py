@@ -2,6 +2,7 @@
 from sqlalchemy import func
 from src.database.engine import get_db
 from src.database.models import MessageGroup, Message, MediaItem, ChannelState
+from src.storage.blob_store import media_counts_query
 from tabulate import tabulate
 
 def print_table(rows, headers):
@@ -32,20 +33,21 @@ def inspect_db():
     )
     
     if groups_with_media:
+        # Media are counted in the database, without loading any media rows
+        media_summary = {}
+        for group_id, media_type, count in db.execute(media_counts_query(g.id for g in groups_with_media)):
+            media_summary.setdefault(group_id, {})[media_type] = count
+        
         rows = []
         for g in groups_with_media:
-            media_items = db.query(MediaItem).filter(MediaItem.group_id == g.id).all()
-            media_summary = {}
-            for m in media_items:
-                media_summary[m.media_type] = media_summary.get(m.media_type, 0) + 1
-            
-            media_info = [f"{type}: {count}" for type, count in media_summary.items()]
+            counts = media_summary.get(g.id, {})
+            media_info = [f"{type}: {count}" for type, count in counts.items()]
             rows.append([
                 g.channel_name,
                 g.group_id,
                 g.combined_text[:50] + '...' if len(g.combined_text) > 50 else g.combined_text,
                 g.posted_date,
-                len(media_items),
+                sum(counts.values()),
                 ', '.join(media_info)
             ])
         print_table(rows, ['Channel', 'Group ID', 'Text Preview', 'Posted Date', 'Media Count', 'Media Types'])
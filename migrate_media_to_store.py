@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+from sqlalchemy import inspect, text, update
+from src.database.engine import engine, SessionLocal
+from src.database.models import MediaItem
+from src.storage.blob_store import get_blob_store
+from src.config.settings import DATABASE_URL
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 100
+
+def add_content_hash_column():
+    """Add media_items.content_hash if the table predates the media store."""
+    columns = {column['name'] for column in inspect(engine).get_columns('media_items')}
+    if 'content_hash' in columns:
+        return
+    logger.info("Adding media_items.content_hash column")
+    with engine.begin() as conn:
+        conn.execute(text("ALTER TABLE media_items ADD COLUMN content_hash VARCHAR(64)"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_media_items_content_hash ON media_items (content_hash)"))
+
+def migrate_media():
+    """Move media bytes from media_items.file_url into the media store.
+
+    Only the columns involved are read and written, so the script runs on
+    databases that predate the other media_items columns as well.
+    """
+    logger.info(f"Moving media bytes to the media store using {DATABASE_URL}")
+    add_content_hash_column()
+    store = get_blob_store()
+    moved = 0
+
+    db = SessionLocal()
+    try:
+        while True:
+            # Each batch clears file_url, so the next query returns the next rows
+            items = (
+                db.query(MediaItem.id, MediaItem.file_url)
+                .filter(MediaItem.file_url.isnot(None), MediaItem.content_hash.is_(None))
+                .order_by(MediaItem.id)
+                .limit(BATCH_SIZE)
+                .all()
+            )
+            if not items:
+                break
+            db.execute(update(MediaItem), [
+                {'id': item_id, 'content_hash': store.put(file_url), 'file_url': None}
+                for item_id, file_url in items
+            ])
+            db.commit()
+            moved += len(items)
+            logger.info(f"Moved {moved} media items")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Migration failed: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+    logger.info(f"Migration completed successfully, {moved} media items moved")
+
+if __name__ == "__main__":
+    migrate_media()
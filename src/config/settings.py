@@ -41,3 +41,110 @@ if not SESSION_STRING:
 
 # Database configuration
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///telegram_parser.db')
+
+# Parser concurrency
+# Number of channels parsed concurrently; 1 keeps the sequential behaviour
+PARSER_CHANNEL_WORKERS = int(os.getenv('PARSER_CHANNEL_WORKERS', '1'))
+# Upper bound on Telegram requests in flight across all channel workers
+PARSER_MAX_INFLIGHT_REQUESTS = int(os.getenv('PARSER_MAX_INFLIGHT_REQUESTS', '8'))
+
+# Media downloads
+# Maximum media downloads running at the same time across all channels
+PARSER_MEDIA_CONCURRENCY = int(os.getenv('PARSER_MEDIA_CONCURRENCY', '8'))
+# Maximum expected bytes being downloaded at the same time
+PARSER_MEDIA_BYTES_IN_FLIGHT = int(os.getenv('PARSER_MEDIA_BYTES_IN_FLIGHT', str(64 * 1024 * 1024)))
+# Number of message groups whose media is downloaded ahead of the DB writes
+PARSER_MEDIA_PREFETCH_GROUPS = int(os.getenv('PARSER_MEDIA_PREFETCH_GROUPS', '4'))
+
+# Media storage
+# Backend of the content-addressed media store ('local' is the only one so far)
+MEDIA_STORE_BACKEND = os.getenv('MEDIA_STORE_BACKEND', 'local')
+# Root directory of the local media store
+MEDIA_STORE_PATH = os.getenv('MEDIA_STORE_PATH', 'media_store')
+
+# Media server
+# Prefix of the photo URLs stored with cleaned listings; empty keeps them
+# relative (/media/<hash>), to be resolved against wherever the server runs
+MEDIA_BASE_URL = os.getenv('MEDIA_BASE_URL', '')
+# Address the media server listens on
+MEDIA_SERVER_HOST = os.getenv('MEDIA_SERVER_HOST', '127.0.0.1')
+MEDIA_SERVER_PORT = int(os.getenv('MEDIA_SERVER_PORT', '8080'))
+
+# Photo processing
+# Photos get a JPEG thumbnail of at most MEDIA_THUMBNAIL_SIZE pixels per side
+# and a 64-bit perceptual hash, computed in MEDIA_IMAGE_WORKERS processes
+# (0 processes them in a thread)
+MEDIA_THUMBNAIL_SIZE = int(os.getenv('MEDIA_THUMBNAIL_SIZE', '320'))
+MEDIA_IMAGE_WORKERS = int(os.getenv('MEDIA_IMAGE_WORKERS', '2'))
+# Keep full-size photos next to their thumbnails; 0 stores thumbnails only
+MEDIA_STORE_ORIGINALS = os.getenv('MEDIA_STORE_ORIGINALS', '1') == '1'
+# Photos whose hashes differ in at most this many bits count as the same image
+MEDIA_HASH_MAX_DISTANCE = int(os.getenv('MEDIA_HASH_MAX_DISTANCE', '4'))
+# Seconds after which the in-memory index of photo hashes is reloaded
+MEDIA_HASH_INDEX_REFRESH = int(os.getenv('MEDIA_HASH_INDEX_REFRESH', '3600'))
+
+# Telegram request pacing
+# Initial, lowest and highest request rate in requests per second
+TELEGRAM_RATE = float(os.getenv('TELEGRAM_RATE', '5'))
+TELEGRAM_MIN_RATE = float(os.getenv('TELEGRAM_MIN_RATE', '0.2'))
+TELEGRAM_MAX_RATE = float(os.getenv('TELEGRAM_MAX_RATE', '20'))
+# Requests allowed back to back before pacing kicks in
+TELEGRAM_BURST = int(os.getenv('TELEGRAM_BURST', '5'))
+# Retries of a request after FloodWait errors, and the longest wait to sit out
+TELEGRAM_FLOOD_RETRIES = int(os.getenv('TELEGRAM_FLOOD_RETRIES', '3'))
+TELEGRAM_MAX_FLOOD_WAIT = int(os.getenv('TELEGRAM_MAX_FLOOD_WAIT', '600'))
+
+# Historical backfill
+# Request pacing of backfills, separate from live polling so they never starve it
+BACKFILL_RATE = float(os.getenv('BACKFILL_RATE', '1'))
+BACKFILL_BURST = int(os.getenv('BACKFILL_BURST', '2'))
+# Messages fetched per history page (Telegram returns at most 100 per request)
+BACKFILL_PAGE_SIZE = int(os.getenv('BACKFILL_PAGE_SIZE', '100'))
+# Seconds between checks for requested backfills in the service
+BACKFILL_CHECK_INTERVAL = int(os.getenv('BACKFILL_CHECK_INTERVAL', '60'))
+
+# Channel entity cache
+# Hours a resolved channel id/access_hash is trusted before it is refreshed
+ENTITY_CACHE_TTL_HOURS = float(os.getenv('ENTITY_CACHE_TTL_HOURS', '24'))
+
+# Ingestion mode
+# 'poll' parses every PARSER_POLL_INTERVAL seconds; 'events' saves new posts as
+# Telegram pushes them and polls every PARSER_GAP_REPAIR_INTERVAL seconds to
+# repair gaps left by disconnects
+PARSER_MODE = os.getenv('PARSER_MODE', 'poll')
+PARSER_POLL_INTERVAL = int(os.getenv('PARSER_POLL_INTERVAL', '300'))
+PARSER_GAP_REPAIR_INTERVAL = int(os.getenv('PARSER_GAP_REPAIR_INTERVAL', '3600'))
+# Messages fetched per request when catching up on a channel; the channel
+# state is committed after each page (Telegram returns at most 100 per request)
+PARSER_PAGE_SIZE = int(os.getenv('PARSER_PAGE_SIZE', '100'))
+
+# Relevance classifier
+# Groups scoring below RELEVANCE_MIN_SCORE (the probability of being a rental
+# listing) are saved as skipped and never sent to the LLM; 0 keeps every group
+RELEVANCE_MIN_SCORE = float(os.getenv('RELEVANCE_MIN_SCORE', '0.1'))
+# Model trained with `python -m src.parser.relevance train`; built-in keyword
+# weights are used while the file does not exist
+RELEVANCE_MODEL_PATH = os.getenv('RELEVANCE_MODEL_PATH', 'relevance_model.json')
+
+# Near-duplicate listings
+# Groups whose texts share at least LISTING_CLUSTER_THRESHOLD of their word
+# 3-grams (estimated with MinHash) belong to the same listing cluster
+LISTING_CLUSTER_THRESHOLD = float(os.getenv('LISTING_CLUSTER_THRESHOLD', '0.7'))
+# Seconds after which the in-memory index of text signatures is reloaded
+LISTING_CLUSTER_INDEX_REFRESH = int(os.getenv('LISTING_CLUSTER_INDEX_REFRESH', '3600'))
+
+# Database connection pool (PostgreSQL only; SQLite uses its default pool)
+# Connections kept open per engine, and extra connections allowed under load
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+# Seconds to wait for a free connection, and age after which connections are replaced
+DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+
+# Retention
+# Message groups posted more than RETENTION_HOURS ago are deleted, with their
+# messages, media and cleaned listings, every RETENTION_INTERVAL seconds
+RETENTION_HOURS = float(os.getenv('RETENTION_HOURS', '48'))
+RETENTION_INTERVAL = int(os.getenv('RETENTION_INTERVAL', '3600'))
+# Groups deleted per transaction
+RETENTION_CHUNK_SIZE = int(os.getenv('RETENTION_CHUNK_SIZE', '1000'))
@@ -1,16 +1,76 @@
-from sqlalchemy import create_engine, MetaData
+from sqlalchemy import create_engine, event, MetaData
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker, declarative_base
-from src.config.settings import DATABASE_URL
+from src.config.settings import (
+    DATABASE_URL, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE
+)
 import os
 
-# Create the engine
-engine = create_engine(DATABASE_URL)
+# Drivers used by the async engine for each database backend
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+}
+
+def sync_database_url(url):
+    """Return the URL for the synchronous engine.
+
+    Railway sets postgres:// URLs, which SQLAlchemy no longer accepts.
+    """
+    if url.startswith('postgres://'):
+        return 'postgresql://' + url[len('postgres://'):]
+    return url
+
+def async_database_url(url):
+    """Return the URL for the async engine, with the backend's async driver.
+
+    Args:
+        url (str): Database URL as configured, with or without a driver
+    """
+    url = sync_database_url(url)
+    scheme, rest = url.split('://', 1)
+    backend = scheme.split('+', 1)[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}://{rest}"
+
+def pool_options(url):
+    """Connection pool settings; SQLite uses the dialect's default pool."""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': DB_POOL_SIZE,
+        'max_overflow': DB_MAX_OVERFLOW,
+        'pool_timeout': DB_POOL_TIMEOUT,
+        'pool_recycle': DB_POOL_RECYCLE,
+        'pool_pre_ping': True,
+    }
+
+def enable_sqlite_foreign_keys(engine):
+    """Enforce foreign keys, and with them ON DELETE CASCADE, on SQLite connections."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def _set_pragma(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute('PRAGMA foreign_keys=ON')
+        cursor.close()
+
+# Create the engine used by scripts and migrations
+engine = create_engine(sync_database_url(DATABASE_URL), **pool_options(DATABASE_URL))
+
+# Create the engine used by the parser and the LLM service
+async_engine = create_async_engine(async_database_url(DATABASE_URL), **pool_options(DATABASE_URL))
+
+enable_sqlite_foreign_keys(engine)
+enable_sqlite_foreign_keys(async_engine.sync_engine)
 
 # Create declarative base
 Base = declarative_base()
 
-# Create session factory
+# Create session factories
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Objects stay usable after commit; async sessions cannot lazily reload them
+async_session = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
 
 def get_db():
     """Get database session."""
@@ -22,16 +82,23 @@ def get_db():
 
 def init_db(drop_all=False):
     """Initialize database.
-    
+
     Args:
         drop_all (bool): If True, drop all tables before creating them
     """
     # Import all models to ensure they are registered
-    from src.database.models import ChannelState, MessageGroup, Message, MediaItem
-    
+    from src.database.models import ChannelState, ChannelEntity, MessageGroup, Message, MediaItem
+
     if drop_all:
         print("Dropping all tables...")
         Base.metadata.drop_all(bind=engine)
-        
+
     print("Creating tables...")
     Base.metadata.create_all(bind=engine)
+
+async def init_async_db():
+    """Create missing tables through the async engine."""
+    from src.database import models
+
+    async with async_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""Add the listing cluster and text signature of message groups.
+
+Run once against an existing database with:
+    python -m src.database.migrations.add_listing_clusters
+Groups saved before are signed and clustered in ID order, the same way the
+parser clusters new groups.
+"""
+from sqlalchemy import inspect, text, Integer, LargeBinary, bindparam
+import logging
+
+from src.parser.near_duplicates import MinHashIndex, minhash_signature
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 1000
+
+# Column name -> SQLAlchemy type, compiled for the database's dialect
+COLUMNS = {
+    'cluster_id': Integer(),
+    'minhash': LargeBinary(),
+}
+
+def upgrade(bind=None):
+    """Add message_groups.cluster_id and minhash, and cluster the groups saved before.
+
+    Skipped groups are not listings and get no signature.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    columns = {column['name'] for column in inspect(bind).get_columns('message_groups')}
+    with bind.begin() as conn:
+        for name, column_type in COLUMNS.items():
+            if name not in columns:
+                logger.info(f"Adding message_groups.{name}")
+                conn.execute(text(f"ALTER TABLE message_groups ADD COLUMN {name} {column_type.compile(dialect=bind.dialect)}"))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_message_groups_cluster_id ON message_groups (cluster_id)"))
+
+    index = MinHashIndex()
+    statement = text(
+        "UPDATE message_groups SET minhash = :minhash, cluster_id = :cluster_id WHERE id = :id"
+    ).bindparams(bindparam('minhash', type_=LargeBinary()))
+    last_id = 0
+    clustered = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, combined_text, cluster_id FROM message_groups "
+                "WHERE id > :last_id AND processing_state != 'skipped' ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+            if not rows:
+                break
+            params = []
+            for group_id, combined_text, cluster_id in rows:
+                signature = minhash_signature(combined_text)
+                if signature is None:
+                    continue
+                if cluster_id is None:
+                    cluster_id = index.cluster_of(signature) or group_id
+                index.add(group_id, cluster_id, signature)
+                clustered += cluster_id != group_id
+                params.append({'minhash': signature, 'cluster_id': cluster_id, 'id': group_id})
+            if params:
+                conn.execute(statement, params)
+            last_id = rows[-1][0]
+    logger.info(f"Signed {len(index)} message groups, {clustered} of them repeat an earlier listing")
+
+def downgrade(bind=None):
+    """Drop the cluster and signature columns."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_message_groups_cluster_id"))
+        for name in COLUMNS:
+            conn.execute(text(f"ALTER TABLE message_groups DROP COLUMN {name}"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""Add the billed price share of LLM calls.
+
+Run once against a database whose llm_calls table predates it with:
+    python -m src.database.migrations.add_llm_call_price_factor
+"""
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Column name -> DDL type
+COLUMNS = {
+    'price_factor': 'FLOAT DEFAULT 1.0',
+}
+
+def upgrade(bind=None):
+    """Add llm_calls.price_factor; calls recorded before were all billed at the list price.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    columns = {column['name'] for column in inspect(bind).get_columns('llm_calls')}
+    with bind.begin() as conn:
+        for name, ddl in COLUMNS.items():
+            if name not in columns:
+                logger.info(f"Adding llm_calls.{name}")
+                conn.execute(text(f"ALTER TABLE llm_calls ADD COLUMN {name} {ddl}"))
+    logger.info("LLM call price column is in place")
+
+def downgrade(bind=None):
+    """Drop the price share of LLM calls."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        for name in COLUMNS:
+            conn.execute(text(f"ALTER TABLE llm_calls DROP COLUMN {name}"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""Add the thumbnail and perceptual hash columns of media items.
+
+Run once against an existing database with:
+    python -m src.database.migrations.add_media_image_columns
+"""
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Column name -> DDL type
+COLUMNS = {
+    'thumbnail_hash': 'VARCHAR(64)',
+    'phash': 'BIGINT',
+}
+
+def upgrade(bind=None):
+    """Add media_items.thumbnail_hash and phash; photos saved before keep them empty.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    columns = {column['name'] for column in inspect(bind).get_columns('media_items')}
+    with bind.begin() as conn:
+        for name, ddl in COLUMNS.items():
+            if name not in columns:
+                logger.info(f"Adding media_items.{name}")
+                conn.execute(text(f"ALTER TABLE media_items ADD COLUMN {name} {ddl}"))
+    logger.info("Media image columns are in place")
+
+def downgrade(bind=None):
+    """Drop the thumbnail and perceptual hash columns; thumbnails stay in the media store."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        for name in COLUMNS:
+            conn.execute(text(f"ALTER TABLE media_items DROP COLUMN {name}"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Merge duplicate message groups and make (channel_id, group_id) unique.
+
+Requires add_work_queue_columns. Run once against an existing database with:
+    python -m src.database.migrations.add_message_group_upsert
+"""
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Oldest group with the same (channel_id, group_id) as the group `g`
+KEEPER = (
+    "(SELECT MIN(k.id) FROM message_groups k "
+    "WHERE k.channel_id = g.channel_id AND k.group_id = g.group_id)"
+)
+DUPLICATES = f"SELECT g.id FROM message_groups g WHERE g.id > {KEEPER}"
+
+def upgrade(bind=None):
+    """Fold duplicate groups into their oldest copy and create the unique indexes.
+
+    Messages and media of duplicates move to the kept group, members stored
+    twice are dropped, and kept groups that received rows go back to the
+    LLM work queue.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    unique = {
+        index['name'] for table in ('message_groups', 'messages')
+        for index in inspect(bind).get_indexes(table) if index['unique']
+    }
+    with bind.begin() as conn:
+        duplicates = conn.execute(text(f"SELECT COUNT(*) FROM ({DUPLICATES}) d")).scalar()
+        if duplicates:
+            logger.info(f"Merging {duplicates} duplicate message groups")
+            conn.execute(text(
+                f"UPDATE message_groups SET processing_state = 'pending', attempts = 0 "
+                f"WHERE id IN (SELECT {KEEPER} FROM message_groups g WHERE g.id IN ({DUPLICATES}))"
+            ))
+            conn.execute(text(
+                "DELETE FROM cleaned_listings WHERE group_id IN "
+                f"(SELECT {KEEPER} FROM message_groups g WHERE g.id IN ({DUPLICATES})) "
+                f"OR group_id IN ({DUPLICATES})"
+            ))
+            for table in ('messages', 'media_items'):
+                conn.execute(text(
+                    f"UPDATE {table} SET group_id = "
+                    f"(SELECT {KEEPER} FROM message_groups g WHERE g.id = {table}.group_id) "
+                    f"WHERE group_id IN ({DUPLICATES})"
+                ))
+            conn.execute(text(f"DELETE FROM message_groups WHERE id IN ({DUPLICATES})"))
+        conn.execute(text(
+            "DELETE FROM messages WHERE id NOT IN (SELECT MIN(id) FROM messages GROUP BY group_id, message_id)"
+        ))
+        conn.execute(text(
+            "DELETE FROM media_items WHERE id NOT IN (SELECT MIN(id) FROM media_items GROUP BY group_id, file_id)"
+        ))
+
+        if 'ix_message_groups_channel_group' not in unique:
+            conn.execute(text("DROP INDEX IF EXISTS ix_message_groups_channel_group"))
+            conn.execute(text(
+                "CREATE UNIQUE INDEX ix_message_groups_channel_group ON message_groups (channel_id, group_id)"
+            ))
+        if 'ix_messages_group_message' not in unique:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX ix_messages_group_message ON messages (group_id, message_id)"
+            ))
+    logger.info("Message groups are unique per channel")
+
+def downgrade(bind=None):
+    """Make the group and message keys non-unique again; merged groups stay merged."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_messages_group_message"))
+        conn.execute(text("DROP INDEX IF EXISTS ix_message_groups_channel_group"))
+        conn.execute(text("CREATE INDEX ix_message_groups_channel_group ON message_groups (channel_id, group_id)"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""Add the relevance score of message groups.
+
+Run once against an existing database with:
+    python -m src.database.migrations.add_relevance_score
+Pending groups saved before can then be classified with:
+    python -m src.parser.relevance apply
+"""
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Column name -> DDL type
+COLUMNS = {
+    'relevance_score': 'FLOAT',
+}
+
+def upgrade(bind=None):
+    """Add message_groups.relevance_score; groups saved before keep it empty.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    columns = {column['name'] for column in inspect(bind).get_columns('message_groups')}
+    with bind.begin() as conn:
+        for name, ddl in COLUMNS.items():
+            if name not in columns:
+                logger.info(f"Adding message_groups.{name}")
+                conn.execute(text(f"ALTER TABLE message_groups ADD COLUMN {name} {ddl}"))
+    logger.info("Relevance column is in place")
+
+def downgrade(bind=None):
+    """Drop the relevance score; skipped groups stay skipped."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        for name in COLUMNS:
+            conn.execute(text(f"ALTER TABLE message_groups DROP COLUMN {name}"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
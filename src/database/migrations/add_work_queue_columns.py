@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""Add work-queue columns and the indexes used by queue, dedup and retention queries.
+
+Run once against an existing database with:
+    python -m src.database.migrations.add_work_queue_columns
+"""
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Index name -> (table, columns)
+INDEXES = {
+    'ix_message_groups_posted_date': ('message_groups', 'posted_date'),
+    'ix_message_groups_channel_group': ('message_groups', 'channel_id, group_id'),
+    'ix_message_groups_state_id': ('message_groups', 'processing_state, id'),
+    'ix_cleaned_listings_group_id': ('cleaned_listings', 'group_id'),
+    'ix_messages_group_id': ('messages', 'group_id'),
+    'ix_media_items_group_id': ('media_items', 'group_id'),
+}
+
+def upgrade(bind=None):
+    """Add processing_state/claimed_at, mark already processed groups done and create the indexes.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    columns = {column['name'] for column in inspect(bind).get_columns('message_groups')}
+    with bind.begin() as conn:
+        if 'processing_state' not in columns:
+            logger.info("Adding message_groups.processing_state and claimed_at")
+            conn.execute(text(
+                "ALTER TABLE message_groups ADD COLUMN processing_state VARCHAR(16) NOT NULL DEFAULT 'pending'"
+            ))
+            conn.execute(text("ALTER TABLE message_groups ADD COLUMN claimed_at TIMESTAMP"))
+            conn.execute(text(
+                "UPDATE message_groups SET processing_state = 'done' "
+                "WHERE id IN (SELECT group_id FROM cleaned_listings)"
+            ))
+        for name, (table, indexed) in INDEXES.items():
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({indexed})"))
+    logger.info("Work queue columns and indexes are in place")
+
+def downgrade(bind=None):
+    """Drop the indexes and work-queue columns."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        for name in INDEXES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+        conn.execute(text("ALTER TABLE message_groups DROP COLUMN claimed_at"))
+        conn.execute(text("ALTER TABLE message_groups DROP COLUMN processing_state"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""Add lease and retry columns to message_groups and make cleaned_listings.group_id unique.
+
+Requires add_work_queue_columns. Run once against an existing database with:
+    python -m src.database.migrations.add_work_queue_leases
+"""
+from sqlalchemy import inspect, text
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Column name -> DDL type
+COLUMNS = {
+    'lease_owner': 'VARCHAR',
+    'lease_expires_at': 'TIMESTAMP',
+    'attempts': 'INTEGER NOT NULL DEFAULT 0',
+    'next_attempt_at': 'TIMESTAMP',
+}
+
+def upgrade(bind=None):
+    """Add the lease columns and replace the cleaned_listings.group_id index with a unique one.
+
+    Duplicate cleaned listings left by concurrent workers are removed first,
+    keeping the oldest listing of each group.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    inspector = inspect(bind)
+    columns = {column['name'] for column in inspector.get_columns('message_groups')}
+    unique = any(
+        index['name'] == 'ix_cleaned_listings_group_id' and index['unique']
+        for index in inspector.get_indexes('cleaned_listings')
+    )
+    with bind.begin() as conn:
+        for name, ddl in COLUMNS.items():
+            if name not in columns:
+                logger.info(f"Adding message_groups.{name}")
+                conn.execute(text(f"ALTER TABLE message_groups ADD COLUMN {name} {ddl}"))
+        if not unique:
+            result = conn.execute(text(
+                "DELETE FROM cleaned_listings WHERE id NOT IN "
+                "(SELECT MIN(id) FROM cleaned_listings GROUP BY group_id)"
+            ))
+            logger.info(f"Removed {result.rowcount} duplicate cleaned listings")
+            conn.execute(text("DROP INDEX IF EXISTS ix_cleaned_listings_group_id"))
+            conn.execute(text("CREATE UNIQUE INDEX ix_cleaned_listings_group_id ON cleaned_listings (group_id)"))
+    logger.info("Work queue leases are in place")
+
+def downgrade(bind=None):
+    """Drop the lease columns and make the cleaned_listings.group_id index non-unique again."""
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    with bind.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS ix_cleaned_listings_group_id"))
+        conn.execute(text("CREATE INDEX ix_cleaned_listings_group_id ON cleaned_listings (group_id)"))
+        for name in COLUMNS:
+            conn.execute(text(f"ALTER TABLE message_groups DROP COLUMN {name}"))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
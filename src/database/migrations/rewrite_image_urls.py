@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""Replace hex-encoded image bytes in cleaned_listings.image_urls with media URLs.
+
+The media store is content addressed, so the URL of hex-encoded bytes follows
+from their hash; the photos themselves are already in the store with their
+media items. Run once against an existing database with:
+    python -m src.database.migrations.rewrite_image_urls
+"""
+from sqlalchemy import text
+import json
+import logging
+import re
+
+from src.storage.blob_store import content_hash, media_url
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 50  # Rows still holding image bytes can be megabytes each
+HEX_BYTES = re.compile(r'^(?:[0-9a-f]{2})+$')
+
+def to_url(value):
+    """Return the media URL of a hex-encoded image, or the value itself if it is a URL already."""
+    if isinstance(value, str) and HEX_BYTES.match(value):
+        return media_url(content_hash(bytes.fromhex(value)))
+    return value
+
+def upgrade(bind=None):
+    """Rewrite image_urls of all cleaned listings, one batch per transaction.
+
+    Args:
+        bind: Engine to migrate, defaults to the configured database
+    """
+    if bind is None:
+        from src.database.engine import engine as bind
+
+    last_id = 0
+    rewritten = 0
+    while True:
+        with bind.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, image_urls FROM cleaned_listings "
+                "WHERE id > :last_id AND image_urls IS NOT NULL ORDER BY id LIMIT :limit"
+            ), {'last_id': last_id, 'limit': BATCH_SIZE}).all()
+            if not rows:
+                break
+            for listing_id, image_urls in rows:
+                urls = json.loads(image_urls)
+                new_urls = [to_url(url) for url in urls]
+                if new_urls != urls:
+                    conn.execute(
+                        text("UPDATE cleaned_listings SET image_urls = :image_urls WHERE id = :id"),
+                        {'image_urls': json.dumps(new_urls), 'id': listing_id}
+                    )
+                    rewritten += 1
+            last_id = rows[-1][0]
+    logger.info(f"Rewrote image_urls of {rewritten} cleaned listings")
+
+def downgrade(bind=None):
+    """Image bytes are not copied back into listings; they stay in the media store."""
+    raise NotImplementedError("rewrite_image_urls cannot be reverted")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    upgrade()
@@ -1,8 +1,23 @@
 from datetime import datetime, timezone as tz
-from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, LargeBinary, Text, Float, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, ForeignKey, LargeBinary, Text, Float, Boolean, Index
+from sqlalchemy.orm import relationship, deferred
+from sqlalchemy.types import TypeDecorator
 from src.database.engine import Base
 
+class UTCDateTime(TypeDecorator):
+    """DateTime stored as naive UTC.
+
+    asyncpg refuses timezone-aware values for TIMESTAMP WITHOUT TIME ZONE
+    columns, so aware datetimes are converted to UTC and stripped on the way in.
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(tz.utc).replace(tzinfo=None)
+        return value
+
 class ChannelState(Base):
     __tablename__ = 'channel_states'
 
@@ -10,10 +25,49 @@ class ChannelState(Base):
     channel_id = Column(Integer, unique=True)
     channel_name = Column(String)
     last_message_id = Column(Integer)
-    last_parsed_date = Column(DateTime)
+    last_parsed_date = Column(UTCDateTime)
+
+class ChannelEntity(Base):
+    __tablename__ = 'channel_entities'
+
+    id = Column(Integer, primary_key=True)
+    channel_name = Column(String, unique=True)  # Name as configured in CHANNEL_NAMES
+    channel_id = Column(BigInteger)
+    access_hash = Column(BigInteger)
+    username = Column(String)
+    title = Column(String)
+    resolved_date = Column(UTCDateTime)
+
+class BackfillCheckpoint(Base):
+    """Progress of a historical backfill of a channel, walked from new to old."""
+    __tablename__ = 'backfill_checkpoints'
+
+    id = Column(Integer, primary_key=True)
+    channel_name = Column(String, unique=True)  # Name as given to the backfill command
+    channel_id = Column(BigInteger)
+    min_date = Column(UTCDateTime)  # Stop at messages posted before this date
+    min_message_id = Column(Integer)  # Stop at messages with this ID or lower
+    next_offset_id = Column(Integer)  # Resume below this message ID; None = start at the newest
+    groups_saved = Column(Integer, default=0, nullable=False)
+    requested_date = Column(UTCDateTime, default=lambda: datetime.now(tz.utc))
+    updated_date = Column(UTCDateTime)
+    completed_date = Column(UTCDateTime)  # None while the backfill is pending
+
+# Processing states of a message group in the LLM work queue
+STATE_PENDING = 'pending'
+STATE_CLAIMED = 'claimed'
+STATE_DONE = 'done'
+STATE_FAILED = 'failed'  # Gave up after the maximum number of attempts
+STATE_SKIPPED = 'skipped'  # Not a listing according to the relevance classifier; never claimed
 
 class MessageGroup(Base):
     __tablename__ = 'message_groups'
+    __table_args__ = (
+        # One row per Telegram group; also serves lookups by channel_id alone
+        Index('ix_message_groups_channel_group', 'channel_id', 'group_id', unique=True),
+        # Work queue: next pending groups in ID order
+        Index('ix_message_groups_state_id', 'processing_state', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     channel_id = Column(Integer)
@@ -21,21 +75,36 @@ class MessageGroup(Base):
     group_id = Column(BigInteger)
     first_message_id = Column(Integer)
     combined_text = Column(Text)
-    posted_date = Column(DateTime)
-    parsed_date = Column(DateTime, default=lambda: datetime.now(tz.utc))
+    posted_date = Column(UTCDateTime, index=True)  # Retention cutoff
+    parsed_date = Column(UTCDateTime, default=lambda: datetime.now(tz.utc))
     message_link = Column(String)  # Link to the first message in the group
+    processing_state = Column(String(16), default=STATE_PENDING, nullable=False)
+    claimed_at = Column(UTCDateTime)  # When a worker claimed the group
+    lease_owner = Column(String)  # Worker holding the claim
+    lease_expires_at = Column(UTCDateTime)  # Claim is reclaimable after this time
+    attempts = Column(Integer, default=0, nullable=False)  # Claims so far
+    next_attempt_at = Column(UTCDateTime)  # Earliest retry after a failure
+    relevance_score = Column(Float)  # Probability of being a listing, from the relevance classifier
+    cluster_id = Column(Integer, index=True)  # ID of the first group of the same apartment
+    minhash = Column(LargeBinary)  # MinHash signature of the normalized text, None for non-listings
     
-    messages = relationship("Message", back_populates="group", cascade="all, delete-orphan")
-    media_items = relationship("MediaItem", back_populates="group", cascade="all, delete-orphan")
-    cleaned_listing = relationship("CleanedListing", back_populates="message_group", uselist=False)
+    # Children are removed by ON DELETE CASCADE, without loading them first
+    messages = relationship("Message", back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
+    media_items = relationship("MediaItem", back_populates="group", cascade="all, delete-orphan", passive_deletes=True)
+    cleaned_listing = relationship("CleanedListing", back_populates="message_group", uselist=False,
+                                   cascade="all, delete-orphan", passive_deletes=True)
 
 class Message(Base):
     __tablename__ = 'messages'
+    __table_args__ = (
+        # A message is stored once per group, however often its album is fetched
+        Index('ix_messages_group_message', 'group_id', 'message_id', unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     message_id = Column(Integer)
     text = Column(Text)
-    group_id = Column(BigInteger, ForeignKey('message_groups.id'))
+    group_id = Column(BigInteger, ForeignKey('message_groups.id', ondelete='CASCADE'), index=True)
     
     group = relationship("MessageGroup", back_populates="messages")
 
@@ -43,12 +112,17 @@ class MediaItem(Base):
     __tablename__ = 'media_items'
 
     id = Column(Integer, primary_key=True)
-    group_id = Column(BigInteger, ForeignKey('message_groups.id'))
+    group_id = Column(BigInteger, ForeignKey('message_groups.id', ondelete='CASCADE'), index=True)
     media_type = Column(String)  # photo, video, document, etc.
     file_id = Column(String)
     mime_type = Column(String)
     file_size = Column(Integer)
-    file_url = Column(LargeBinary)  # Store raw bytes
+    # Legacy raw bytes, empty once moved to the media store. Never loaded with
+    # the row; undefer() it or use load_legacy_blobs where the bytes are needed
+    file_url = deferred(Column(LargeBinary), raiseload=True)
+    content_hash = Column(String(64), index=True)  # SHA-256 key in the media store
+    thumbnail_hash = Column(String(64))  # Media store key of the photo's thumbnail
+    phash = Column(BigInteger)  # 64-bit perceptual hash of the photo
     
     group = relationship("MessageGroup", back_populates="media_items")
 
@@ -56,9 +130,9 @@ class CleanedListing(Base):
     __tablename__ = 'cleaned_listings'
 
     id = Column(Integer, primary_key=True)
-    group_id = Column(BigInteger, ForeignKey('message_groups.id'))
+    group_id = Column(BigInteger, ForeignKey('message_groups.id', ondelete='CASCADE'), index=True, unique=True)
     original_text = Column(Text)
-    processed_date = Column(DateTime, default=lambda: datetime.now(tz.utc))
+    processed_date = Column(UTCDateTime, default=lambda: datetime.now(tz.utc))
     
     # Basic Details
     layout = Column(String)  # Stored as enum string value
@@ -107,3 +181,32 @@ class CleanedListing(Base):
     image_urls = Column(Text)  # JSON array of image URLs
     
     message_group = relationship("MessageGroup", back_populates="cleaned_listing")
+
+class ExtractionCacheEntry(Base):
+    __tablename__ = 'extraction_cache'
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(String(64), unique=True)  # SHA-256 of model, prompt version and normalized text
+    model_name = Column(String)
+    prompt_version = Column(String)
+    property_json = Column(Text)  # Extracted Property as JSON
+    created_date = Column(UTCDateTime, default=lambda: datetime.now(tz.utc))
+    last_hit_date = Column(UTCDateTime)
+    hit_count = Column(Integer, default=0)
+
+class LLMCall(Base):
+    __tablename__ = 'llm_calls'
+
+    id = Column(Integer, primary_key=True)
+    # Kept when retention deletes the group, so costs per channel stay measurable
+    group_id = Column(BigInteger, ForeignKey('message_groups.id', ondelete='SET NULL'), index=True)
+    channel_name = Column(String, index=True)
+    model_name = Column(String)
+    prompt_tokens = Column(Integer)  # None when the request failed
+    completion_tokens = Column(Integer)
+    latency_ms = Column(Integer)
+    original_chars = Column(Integer)  # Length of the group's text
+    prompt_chars = Column(Integer)  # Length of the prepared text sent to the LLM
+    succeeded = Column(Boolean)  # A valid Property was extracted
+    price_factor = Column(Float, default=1.0)  # Share of the list price billed, e.g. 0.5 for batch jobs
+    created_date = Column(UTCDateTime, default=lambda: datetime.now(tz.utc), index=True)
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone as tz, timedelta
+from sqlalchemy import select, delete
+from src.database.models import MessageGroup, Message, MediaItem, CleanedListing
+from src.storage.blob_store import referenced_hashes_query, collect_garbage
+
+logger = logging.getLogger(__name__)
+
+# Child tables are emptied before their groups, so expired data is removed
+# even on databases whose foreign keys were created without ON DELETE CASCADE
+CHILD_TABLES = (
+    ('media_items', MediaItem),
+    ('messages', Message),
+    ('cleaned_listings', CleanedListing),
+)
+
+
+class RetentionEngine:
+    """Removes message groups older than the retention window with set-based deletes.
+
+    Expired groups are deleted in chunks of primary keys: one DELETE per
+    table and chunk, each chunk in its own transaction, so no row and no
+    media blob is ever loaded into memory. Media blobs that are no longer
+    referenced afterwards are removed from the media store.
+    """
+
+    def __init__(self, session_factory, retention_hours, chunk_size=1000, blob_store=None):
+        """Initialize engine.
+
+        Args:
+            session_factory: Factory of async database sessions
+            retention_hours: Age in hours after which a group is deleted, by posted_date
+            chunk_size: Groups deleted per transaction
+            blob_store: BlobStore to collect unreferenced media from, None to skip
+        """
+        self.session_factory = session_factory
+        self.retention = timedelta(hours=retention_hours)
+        self.chunk_size = max(1, chunk_size)
+        self.blob_store = blob_store
+
+    async def run(self, now=None):
+        """Delete all expired groups.
+
+        Args:
+            now: Reference time, defaults to the current time
+
+        Returns:
+            dict: Rows deleted per table, chunks, blobs removed and elapsed seconds
+        """
+        cutoff = (now or datetime.now(tz.utc)) - self.retention
+        stats = {table: 0 for table, _ in CHILD_TABLES}
+        stats.update(message_groups=0, chunks=0, blobs=0)
+        started = time.monotonic()
+        logger.info(f"Running retention for groups posted before {cutoff.isoformat()}")
+
+        candidates = set()
+        while True:
+            deleted = await self._delete_chunk(cutoff, stats, candidates)
+            if deleted < self.chunk_size:
+                break
+
+        if candidates and self.blob_store is not None:
+            stats['blobs'] = await self._collect_blobs(candidates)
+
+        stats['elapsed_seconds'] = round(time.monotonic() - started, 3)
+        logger.info(f"Retention finished: {stats}")
+        return stats
+
+    async def _delete_chunk(self, cutoff, stats, candidates):
+        """Delete up to chunk_size expired groups with their rows; returns the groups deleted."""
+        async with self.session_factory() as db:
+            result = await db.execute(
+                select(MessageGroup.id)
+                .where(MessageGroup.posted_date < cutoff)
+                .order_by(MessageGroup.id)
+                .limit(self.chunk_size)
+            )
+            group_ids = list(result.scalars())
+            if not group_ids:
+                return 0
+
+            for column in (MediaItem.content_hash, MediaItem.thumbnail_hash):
+                result = await db.execute(
+                    select(column).where(MediaItem.group_id.in_(group_ids), column.isnot(None)).distinct()
+                )
+                candidates.update(result.scalars())
+
+            for table, model in CHILD_TABLES:
+                result = await db.execute(delete(model).where(model.group_id.in_(group_ids)))
+                stats[table] += result.rowcount or 0
+            result = await db.execute(delete(MessageGroup).where(MessageGroup.id.in_(group_ids)))
+            stats['message_groups'] += result.rowcount or 0
+            await db.commit()
+
+        stats['chunks'] += 1
+        return len(group_ids)
+
+    async def _collect_blobs(self, candidates):
+        """Remove candidate blobs no longer referenced by any media item."""
+        referenced = set()
+        keys = sorted(candidates)
+        async with self.session_factory() as db:
+            for start in range(0, len(keys), self.chunk_size):
+                result = await db.execute(referenced_hashes_query(keys[start:start + self.chunk_size]))
+                referenced.update(result.scalars())
+        return await asyncio.to_thread(collect_garbage, self.blob_store, candidates, referenced)
+
+
+async def run_retention(engine, interval):
+    """Run the retention engine every `interval` seconds, forever.
+
+    Args:
+        engine: RetentionEngine to run
+        interval: Seconds between two runs
+    """
+    while True:
+        try:
+            await engine.run()
+        except Exception as e:
+            logger.error(f"Error during retention: {str(e)}", exc_info=True)
+        await asyncio.sleep(interval)
@@ -0,0 +1,37 @@
+from sqlalchemy.dialects import postgresql, sqlite
+
+# Dialects with INSERT ... ON CONFLICT
+INSERTS = {
+    'postgresql': postgresql.insert,
+    'sqlite': sqlite.insert,
+}
+
+def insert_for(db, model):
+    """Return an INSERT of `model` supporting ON CONFLICT on the session's database.
+
+    Args:
+        db: Sync or async database session
+        model: Mapped class to insert into
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect not in INSERTS:
+        raise NotImplementedError(f"ON CONFLICT inserts are not supported on {dialect}")
+    return INSERTS[dialect](model)
+
+def insert_ignoring_conflicts(db, model, values, index_elements):
+    """Build an INSERT that does nothing if a row with the same key exists.
+
+    The statement returns the new row's ID, so no row is returned on conflict.
+
+    Args:
+        db: Sync or async database session
+        model: Mapped class to insert into
+        values: Column values of the row
+        index_elements: Columns of the unique key
+    """
+    return (
+        insert_for(db, model)
+        .values(**values)
+        .on_conflict_do_nothing(index_elements=index_elements)
+        .returning(model.id)
+    )
@@ -0,0 +1,147 @@
+"""Chat completion backends used by the LLM processor."""
+import asyncio
+import json
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Callable, Iterable, Optional
+
+import httpx
+import openai
+
+from .config import LLMConfig
+from .schemas import Property
+
+# Status codes worth retrying besides 5xx: request timeout, conflict and rate limit
+RETRYABLE_STATUS = {408, 409, 429}
+
+
+@dataclass
+class ChatResponse:
+    """Message content and token usage of a chat completion."""
+    content: Optional[str]
+    model_name: Optional[str] = None
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+
+
+class RetryableError(Exception):
+    """A request failed in a way that may pass later: rate limit, server error, timeout or lost connection."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after  # Seconds the server asked to wait, None if it did not say
+
+
+def retry_after_seconds(headers) -> Optional[float]:
+    """Read the wait a server asked for from `retry-after-ms` or `Retry-After` (seconds or HTTP date)."""
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if not value:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class ChatBackend:
+    """Interface of a service answering chat completion requests."""
+
+    async def complete(self, body: dict) -> ChatResponse:
+        """Send a request body and return the answer.
+
+        Raises:
+            RetryableError: If the request may succeed when sent again
+        """
+        raise NotImplementedError
+
+    async def aclose(self):
+        """Release the backend's connections."""
+
+
+class OpenAIChatBackend(ChatBackend):
+    """Backend using the OpenAI API through one pooled HTTP client.
+
+    The client's own retries are disabled; the processor retries with its
+    policy instead.
+    """
+
+    def __init__(self, config: LLMConfig):
+        self.http_client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_connections
+            ),
+            timeout=httpx.Timeout(config.request_timeout, connect=config.connect_timeout)
+        )
+        self.client = openai.AsyncOpenAI(api_key=config.openai_api_key, http_client=self.http_client, max_retries=0)
+
+    async def complete(self, body: dict) -> ChatResponse:
+        try:
+            response = await self.client.chat.completions.create(**body)
+        except openai.APIStatusError as e:
+            if e.status_code in RETRYABLE_STATUS or e.status_code >= 500:
+                raise RetryableError(str(e), e.status_code, retry_after_seconds(e.response.headers)) from e
+            raise
+        except openai.APIConnectionError as e:  # Timeouts included
+            raise RetryableError(str(e)) from e
+        usage = response.usage
+        return ChatResponse(
+            response.choices[0].message.content,
+            response.model,
+            usage.prompt_tokens if usage else None,
+            usage.completion_tokens if usage else None
+        )
+
+    async def aclose(self):
+        await self.http_client.aclose()
+
+
+def placeholder_response(body: dict) -> str:
+    """Answer a request with a valid Property holding the first line of the listing as its address."""
+    text = body["messages"][-1]["content"]
+    return Property(
+        layout="other", address=text.strip().split("\n")[0], monthly_rent_usd=0, phone_numbers=[]
+    ).json()
+
+
+class FakeChatBackend(ChatBackend):
+    """Backend that answers requests locally, for tests and offline throughput runs.
+
+    Every request body is passed to `respond`, which returns the message
+    content the model would have produced. Errors in `failures` are raised by
+    the first requests instead, in order.
+    """
+
+    def __init__(self, respond: Callable[[dict], str] = placeholder_response, latency: float = 0.0,
+                 failures: Iterable[Exception] = ()):
+        self.respond = respond
+        self.latency = latency
+        self.failures = list(failures)
+        self.requests = 0
+
+    async def complete(self, body: dict) -> ChatResponse:
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.failures:
+            raise self.failures.pop(0)
+        content = self.respond(body)
+        prompt = json.dumps(body["messages"], ensure_ascii=False)
+        # Three characters per token, as estimated before requests are sent
+        return ChatResponse(content, body["model"], len(prompt) // 3, len(content) // 3)
+
+
+def create_backend(config: LLMConfig) -> ChatBackend:
+    """Create the backend named by config.backend: `openai`, or `fake` to run offline."""
+    if config.backend == "fake":
+        return FakeChatBackend(latency=config.fake_latency_ms / 1000)
+    if config.backend != "openai":
+        raise ValueError(f"Unknown LLM backend: {config.backend}")
+    return OpenAIChatBackend(config)
@@ -0,0 +1,347 @@
+"""Offline batch extraction of listings through a file-based batch job interface."""
+import argparse
+import asyncio
+import json
+import logging
+import shutil
+import uuid
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from .config import LLMConfig
+from .listing import build_cleaned_listing, build_llm_call, save_listings
+from .pipeline import ListingJob
+from .processor import Completion, request_body
+from .schemas import Property
+from .work_queue import WorkQueue, default_worker_id
+
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS_ENDPOINT = "/v1/chat/completions"
+TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def custom_id_for(group_id: int) -> str:
+    return f"group-{group_id}"
+
+
+def group_id_from(custom_id: str) -> int:
+    return int(custom_id.split("-", 1)[1])
+
+
+def build_request(group_id: int, text: str, config: LLMConfig) -> dict:
+    """Build one line of a batch job file, equivalent to LLMProcessor.process_listing."""
+    return {
+        "custom_id": custom_id_for(group_id),
+        "method": "POST",
+        "url": CHAT_COMPLETIONS_ENDPOINT,
+        "body": request_body(text, config),
+    }
+
+
+def parse_result_line(line: str) -> Tuple[int, Completion]:
+    """Parse one line of a batch result file.
+
+    Returns:
+        Tuple of the group ID and the completion, whose property_details are
+        None if the request failed
+    """
+    record = json.loads(line)
+    group_id = group_id_from(record["custom_id"])
+    response = record.get("response") or {}
+    body = response.get("body") or {}
+    usage = body.get("usage") or {}
+    completion = Completion(None, body.get("model"), usage.get("prompt_tokens"), usage.get("completion_tokens"))
+    if record.get("error") or response.get("status_code") != 200:
+        logger.warning(f"Batch request for group {group_id} failed: {record.get('error') or response.get('status_code')}")
+        return group_id, completion
+    try:
+        content = body["choices"][0]["message"]["content"]
+        completion.property_details = Property.parse_raw(content)
+    except Exception as e:
+        logger.warning(f"Invalid batch result for group {group_id}: {str(e)}")
+    return group_id, completion
+
+
+class BatchBackend:
+    """Interface of a service that runs batch job files."""
+
+    async def submit(self, job_path: Path) -> str:
+        """Submit a JSONL job file and return the job ID."""
+        raise NotImplementedError
+
+    async def status(self, job_id: str) -> str:
+        """Return the job status, one of TERMINAL_STATUSES once the job is over."""
+        raise NotImplementedError
+
+    async def download_results(self, job_id: str, result_path: Path) -> bool:
+        """Write the JSONL results of a completed job. Returns False if there are none."""
+        raise NotImplementedError
+
+
+class OpenAIBatchBackend(BatchBackend):
+    """Backend using the OpenAI Batch API."""
+
+    def __init__(self, config: LLMConfig, completion_window: str = "24h"):
+        from openai import OpenAI
+        self.client = OpenAI(api_key=config.openai_api_key)
+        self.completion_window = completion_window
+
+    async def submit(self, job_path: Path) -> str:
+        def _submit():
+            with open(job_path, "rb") as f:
+                input_file = self.client.files.create(file=f, purpose="batch")
+            batch = self.client.batches.create(
+                input_file_id=input_file.id,
+                endpoint=CHAT_COMPLETIONS_ENDPOINT,
+                completion_window=self.completion_window,
+            )
+            return batch.id
+        return await asyncio.to_thread(_submit)
+
+    async def status(self, job_id: str) -> str:
+        batch = await asyncio.to_thread(self.client.batches.retrieve, job_id)
+        return batch.status
+
+    async def download_results(self, job_id: str, result_path: Path) -> bool:
+        batch = await asyncio.to_thread(self.client.batches.retrieve, job_id)
+        if not batch.output_file_id:
+            return False
+        content = await asyncio.to_thread(self.client.files.content, batch.output_file_id)
+        result_path.write_bytes(content.read())
+        return True
+
+
+class LocalBatchBackend(BatchBackend):
+    """Backend that answers job files locally, for tests and dry runs.
+
+    Every request body is passed to `respond`, which returns the message
+    content the model would have produced.
+    """
+
+    def __init__(self, work_dir: Path, respond: Callable[[dict], str]):
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.respond = respond
+
+    async def submit(self, job_path: Path) -> str:
+        job_id = f"local-{uuid.uuid4().hex[:12]}"
+        input_path = self.work_dir / f"{job_id}.input.jsonl"
+        shutil.copyfile(job_path, input_path)
+        with open(input_path) as src, open(self.work_dir / f"{job_id}.output.jsonl", "w") as out:
+            for line in src:
+                request = json.loads(line)
+                content = self.respond(request["body"])
+                prompt = json.dumps(request["body"]["messages"], ensure_ascii=False)
+                out.write(json.dumps({
+                    "custom_id": request["custom_id"],
+                    "response": {
+                        "status_code": 200,
+                        "body": {
+                            "model": request["body"]["model"],
+                            "choices": [{"message": {"role": "assistant", "content": content}}],
+                            # Three characters per token, as estimated before requests are sent
+                            "usage": {"prompt_tokens": len(prompt) // 3, "completion_tokens": len(content) // 3},
+                        },
+                    },
+                    "error": None,
+                }) + "\n")
+        return job_id
+
+    async def status(self, job_id: str) -> str:
+        return "completed" if (self.work_dir / f"{job_id}.output.jsonl").exists() else "failed"
+
+    async def download_results(self, job_id: str, result_path: Path) -> bool:
+        output_path = self.work_dir / f"{job_id}.output.jsonl"
+        if not output_path.exists():
+            return False
+        shutil.copyfile(output_path, result_path)
+        return True
+
+
+class BatchRunner:
+    """Serializes pending groups into a batch job and imports its results.
+
+    The groups of a job are claimed from the work queue like those of the
+    online service, under a lease covering the batch completion window, so
+    the service does not extract them meanwhile. Failed requests are retried
+    through the queue with backoff.
+    """
+
+    def __init__(self, service, session_factory, backend: BatchBackend, config: LLMConfig,
+                 work_dir: Path, poll_interval: float = 60, queue: Optional[WorkQueue] = None):
+        """Initialize the runner.
+
+        Args:
+            service: ListingProcessorService loading the claimed groups
+            session_factory: Factory of async database sessions
+            backend: Batch backend running the job
+            config: Model settings used for the requests
+            work_dir: Directory for job and result files
+            poll_interval: Seconds between job status checks
+            queue: Work queue groups are claimed from, defaults to a batch worker leasing them for batch_lease_seconds
+        """
+        self.service = service
+        self.session_factory = session_factory
+        self.backend = backend
+        self.config = config
+        self.work_dir = Path(work_dir)
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self.queue = queue or WorkQueue(
+            session_factory,
+            worker_id=f"batch-{default_worker_id()}",
+            lease_seconds=config.batch_lease_seconds,
+            max_attempts=config.max_attempts,
+            retry_base_seconds=config.retry_base_seconds
+        )
+
+    async def write_job(self, limit: int) -> Tuple[Optional[Path], Dict[int, ListingJob]]:
+        """Claim up to `limit` pending groups and write them into a job file.
+
+        Returns:
+            Tuple of the job file path (None if nothing is pending) and
+            group ID -> ListingJob of the serialized groups
+        """
+        group_ids = await self.queue.claim(limit)
+        if not group_ids:
+            return None, {}
+        async with self.session_factory() as session:
+            groups = await self.service.load_groups(session, group_ids)
+            jobs = {
+                group.id: ListingJob(
+                    group.id,
+                    self.service.listing_text(group),
+                    self.service.listing_images(group),
+                    cluster_id=group.cluster_id,
+                    channel_name=group.channel_name,
+                    original_text=group.combined_text
+                )
+                for group in groups
+            }
+        if not jobs:
+            return None, {}
+        job_path = self.work_dir / f"job-{uuid.uuid4().hex[:12]}.jsonl"
+        with open(job_path, "w") as f:
+            for group_id, job in jobs.items():
+                f.write(json.dumps(build_request(group_id, job.text, self.config), ensure_ascii=False) + "\n")
+        logger.info(f"Wrote {len(jobs)} requests to {job_path}")
+        return job_path, jobs
+
+    async def wait(self, job_id: str) -> str:
+        """Poll the backend until the job reaches a terminal status."""
+        while True:
+            status = await self.backend.status(job_id)
+            if status in TERMINAL_STATUSES:
+                return status
+            logger.info(f"Batch job {job_id} is {status}, checking again in {self.poll_interval}s")
+            await asyncio.sleep(self.poll_interval)
+
+    async def import_results(self, result_path: Path, jobs: Dict[int, ListingJob]) -> int:
+        """Save the cleaned listings of a result file and complete their groups.
+
+        Groups whose lease was taken over in the meantime, e.g. after the job
+        outlived it, or whose text changed are skipped. A listing replaces the
+        one saved for an earlier post of the same apartment, as in the online
+        service. Groups without a valid result are retried through the work
+        queue. Every request is recorded in llm_calls at the batch price.
+
+        Returns:
+            int: Number of listings saved
+        """
+        completions: Dict[int, Completion] = {}
+        with open(result_path) as f:
+            for line in f:
+                if line.strip():
+                    group_id, completion = parse_result_line(line)
+                    if group_id in jobs:
+                        completions[group_id] = completion
+        parsed = {
+            group_id: completion.property_details for group_id, completion in completions.items()
+            if completion.property_details is not None
+        }
+        # Usage is recorded whether or not the result is written
+        calls = [
+            build_llm_call(
+                group_id, jobs[group_id].channel_name, jobs[group_id].original_text or jobs[group_id].text,
+                jobs[group_id].text, completion, price_factor=self.config.batch_price_factor
+            )
+            for group_id, completion in completions.items()
+        ]
+
+        imported = 0
+        if calls:
+            async with self.session_factory() as session:
+                owned = await self.queue.complete(session, parsed)
+                listings = [
+                    (
+                        build_cleaned_listing(
+                            group_id, jobs[group_id].original_text or jobs[group_id].text,
+                            property_details, jobs[group_id].image_urls
+                        ),
+                        jobs[group_id].cluster_id
+                    )
+                    for group_id, property_details in parsed.items() if group_id in owned
+                ]
+                await save_listings(session, listings)
+                session.add_all(calls)
+                await session.commit()
+            # Groups whose text changed meanwhile are extracted again
+            await self.queue.requeue_changed(set(parsed) - owned)
+            imported = len(listings)
+            if imported < len(parsed):
+                logger.warning(f"{len(parsed) - imported} groups were lost or changed, results discarded")
+        await self.queue.fail(set(jobs) - set(parsed))
+        logger.info(f"Imported {imported} cleaned listings from {result_path}")
+        return imported
+
+    async def run(self, limit: int) -> int:
+        """Run one batch job over up to `limit` pending groups.
+
+        Returns:
+            int: Number of listings imported
+        """
+        job_path, jobs = await self.write_job(limit)
+        if job_path is None:
+            logger.info("No unprocessed groups for a batch job")
+            return 0
+        try:
+            job_id = await self.backend.submit(job_path)
+        except Exception:
+            # Nothing was sent, the groups go back to the queue without using an attempt
+            await self.queue.release(jobs)
+            raise
+        logger.info(f"Submitted batch job {job_id}")
+        status = await self.wait(job_id)
+        result_path = self.work_dir / f"{job_id}.results.jsonl"
+        if not await self.backend.download_results(job_id, result_path):
+            logger.error(f"Batch job {job_id} ended as {status} without results")
+            await self.queue.fail(jobs)
+            return 0
+        return await self.import_results(result_path, jobs)
+
+
+async def run_batch(limit: int, work_dir: str, poll_interval: float):
+    """Run one batch job against the OpenAI Batch API."""
+    from src.database.engine import async_session
+    from .processor import LLMProcessor
+    from .service import ListingProcessorService
+
+    config = LLMConfig()
+    processor = LLMProcessor(config)
+    service = ListingProcessorService(processor)
+    runner = BatchRunner(service, async_session, OpenAIBatchBackend(config), config, Path(work_dir), poll_interval)
+    try:
+        return await runner.run(limit)
+    finally:
+        await processor.aclose()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Extract pending listings with a batch job")
+    parser.add_argument("--limit", type=int, default=1000, help="Maximum groups in the job")
+    parser.add_argument("--work-dir", default="batch_jobs", help="Directory for job and result files")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Seconds between status checks")
+    args = parser.parse_args()
+    asyncio.run(run_batch(args.limit, args.work_dir, args.poll_interval))
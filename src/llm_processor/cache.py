@@ -0,0 +1,141 @@
+"""Persistent cache of LLM extractions keyed by listing text."""
+import hashlib
+import logging
+import re
+import unicodedata
+from datetime import datetime, timezone, timedelta
+from typing import Optional
+
+from sqlalchemy import select, delete, func
+
+from src.database.models import ExtractionCacheEntry
+from .processor import PROMPT_VERSION
+from .schemas import Property
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    """Normalize listing text so that reposts with cosmetic edits map to the same key.
+
+    Unicode is NFKC-normalized and case-folded, emoji and other symbols are
+    dropped and whitespace runs collapse to single spaces.
+    """
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    text = "".join(ch for ch in text if unicodedata.category(ch) not in ("So", "Sk", "Cf"))
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def cache_key(text: str, model_name: str, prompt_version: str) -> str:
+    """Return the cache key of a listing text for a model and prompt version."""
+    payload = "\0".join((model_name, prompt_version, normalize_text(text)))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class ExtractionCache:
+    """Cache of extracted Property objects stored in the extraction_cache table.
+
+    Every lookup and store runs in its own session, so the cache can be used
+    from concurrent workers.
+    """
+
+    def __init__(self, session_factory, model_name: str, prompt_version: str = PROMPT_VERSION,
+                 max_entries: int = 100000, max_age_days: int = 30):
+        """Initialize the cache.
+
+        Args:
+            session_factory: Factory of async database sessions
+            model_name: Model whose extractions are cached
+            prompt_version: Version of the system prompt
+            max_entries: Entries kept by evict(), least recently used go first
+            max_age_days: Age after which entries are evicted
+        """
+        self.session_factory = session_factory
+        self.model_name = model_name
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.max_age = timedelta(days=max_age_days)
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text: str) -> str:
+        return cache_key(text, self.model_name, self.prompt_version)
+
+    async def get(self, text: str) -> Optional[Property]:
+        """Return the cached extraction of a text, or None on a miss."""
+        key = self.key(text)
+        async with self.session_factory() as session:
+            entry = (await session.execute(
+                select(ExtractionCacheEntry).where(ExtractionCacheEntry.cache_key == key)
+            )).scalar_one_or_none()
+            if entry is None:
+                self.misses += 1
+                return None
+            entry.hit_count = (entry.hit_count or 0) + 1
+            entry.last_hit_date = datetime.now(timezone.utc)
+            property_json = entry.property_json
+            await session.commit()
+        self.hits += 1
+        return Property.parse_raw(property_json)
+
+    async def put(self, text: str, property_details: Property):
+        """Store the extraction of a text, keeping an existing entry for the same key."""
+        key = self.key(text)
+        async with self.session_factory() as session:
+            exists = (await session.execute(
+                select(ExtractionCacheEntry.id).where(ExtractionCacheEntry.cache_key == key)
+            )).first()
+            if exists:
+                return
+            session.add(ExtractionCacheEntry(
+                cache_key=key,
+                model_name=self.model_name,
+                prompt_version=self.prompt_version,
+                property_json=property_details.json(),
+                created_date=datetime.now(timezone.utc)
+            ))
+            try:
+                await session.commit()
+            except Exception as e:
+                # Another worker stored the same key first
+                await session.rollback()
+                logger.debug(f"Cache entry {key} not stored: {str(e)}")
+
+    async def evict(self) -> int:
+        """Remove entries older than max_age and the least recently used beyond max_entries.
+
+        Returns:
+            int: Number of entries removed
+        """
+        cutoff = datetime.now(timezone.utc) - self.max_age
+        async with self.session_factory() as session:
+            result = await session.execute(
+                delete(ExtractionCacheEntry).where(ExtractionCacheEntry.created_date < cutoff)
+            )
+            removed = result.rowcount or 0
+
+            count = await session.scalar(select(func.count(ExtractionCacheEntry.id)))
+            excess = count - self.max_entries
+            if excess > 0:
+                last_used = func.coalesce(ExtractionCacheEntry.last_hit_date, ExtractionCacheEntry.created_date)
+                oldest = select(ExtractionCacheEntry.id).order_by(last_used).limit(excess)
+                result = await session.execute(
+                    delete(ExtractionCacheEntry).where(ExtractionCacheEntry.id.in_(oldest.scalar_subquery()))
+                )
+                removed += result.rowcount or 0
+            await session.commit()
+
+        if removed:
+            logger.info(f"Evicted {removed} extraction cache entries")
+        return removed
+
+    def stats(self) -> dict:
+        """Return hit/miss counters since start."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
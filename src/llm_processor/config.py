@@ -10,6 +10,48 @@ class LLMConfig(BaseSettings):
     temperature: float = 0.0
     max_tokens: int = 1000
     
+    # HTTP client shared by all workers, and retries of a single request
+    backend: str = "openai"  # "fake" answers locally, for offline throughput runs
+    fake_latency_ms: int = 200
+    max_connections: int = 16
+    connect_timeout: float = 10.0
+    request_timeout: float = 60.0
+    request_retries: int = 4  # Rate limits, server errors and timeouts
+    retry_backoff_seconds: float = 1.0
+    retry_max_wait_seconds: float = 60.0
+    validation_retries: int = 1  # Answers that do not match the schema
+    
+    # Pipeline mode: concurrent extraction with batched writes
+    pipeline_enabled: bool = False
+    pipeline_workers: int = 8
+    pipeline_prefetch_size: int = 32
+    pipeline_write_batch_size: int = 16
+    requests_per_minute: int = 500
+    tokens_per_minute: int = 200000
+    
+    # Extraction result cache
+    cache_enabled: bool = True
+    cache_max_entries: int = 100000
+    cache_max_age_days: int = 30
+    
+    # Rule-based extraction of templated listings ahead of the LLM
+    rules_enabled: bool = True
+    rules_min_confidence: float = 0.8
+    
+    # Preparation of listing texts: boilerplate learned per channel and an input token cap
+    input_max_tokens: int = 1500
+    boilerplate_min_groups: int = 5
+    boilerplate_min_share: float = 0.3
+    boilerplate_refresh_seconds: int = 3600
+    
+    # Work queue shared by all service replicas
+    worker_id: Optional[str] = None  # Defaults to host, PID and a random suffix
+    lease_seconds: int = 300
+    max_attempts: int = 3
+    retry_base_seconds: int = 60
+    batch_lease_seconds: int = 93600  # A 24h batch completion window plus time to import the results
+    batch_price_factor: float = 0.5  # Share of the list price billed for batch requests
+    
     class Config:
         env_prefix = "OPENAI_"
         case_sensitive = False
@@ -0,0 +1,138 @@
+"""Conversion of extracted property details into database rows."""
+import json
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import CleanedListing, LLMCall, MessageGroup
+from .processor import Completion
+from .schemas import Property
+
+
+def build_cleaned_listing(group_id: int, combined_text: str, property_details: Property, image_urls: List[str]) -> CleanedListing:
+    """Create a CleanedListing row from the details extracted for a message group.
+
+    Args:
+        group_id: ID of the processed MessageGroup
+        combined_text: Text the details were extracted from
+        property_details: Extracted property details
+        image_urls: URLs of the listing's photos in the media store
+
+    Returns:
+        CleanedListing: New, not yet added row
+    """
+    return CleanedListing(
+        group_id=group_id,
+        original_text=combined_text,
+        layout=property_details.layout.value,
+        area_sqm=property_details.area_sqm,
+        floor=property_details.floor,
+        total_floors=property_details.total_floors,
+        bedrooms=property_details.bedrooms,
+        has_balcony=property_details.has_balcony,
+        address=property_details.address,
+        district=property_details.district,
+        nearby_landmarks=json.dumps(property_details.nearby_landmarks) if property_details.nearby_landmarks else None,
+        monthly_rent_usd=property_details.monthly_rent_usd,
+        summer_rent_usd=property_details.summer_rent_usd,
+        requires_first_last=property_details.requires_first_last,
+        deposit_amount_usd=property_details.deposit_amount_usd,
+        commission=property_details.commission,
+        heating_type=property_details.heating_type.value if property_details.heating_type else None,
+        has_oven=property_details.has_oven,
+        has_microwave=property_details.has_microwave,
+        has_ac=property_details.has_ac,
+        has_internet=property_details.has_internet,
+        has_tv=property_details.has_tv,
+        has_parking=property_details.has_parking,
+        has_bathtub=property_details.has_bathtub,
+        is_furnished=property_details.is_furnished,
+        phone_numbers=json.dumps(property_details.phone_numbers),
+        whatsapp=property_details.whatsapp,
+        telegram=property_details.telegram,
+        contact_name=property_details.contact_name,
+        min_lease_months=property_details.min_lease_months,
+        max_lease_months=property_details.max_lease_months,
+        pet_policy=property_details.pet_policy.value if property_details.pet_policy else None,
+        has_contract=property_details.has_contract,
+        image_urls=json.dumps([str(url) for url in image_urls]),
+        processed_date=datetime.now(timezone.utc)
+    )
+
+
+def build_llm_call(group_id: int, channel_name: Optional[str], original_text: str, prompt: str,
+                   completion: Completion, price_factor: float = 1.0) -> LLMCall:
+    """Create the usage row of an LLM call made for a message group.
+
+    Args:
+        group_id: ID of the MessageGroup
+        channel_name: Channel the group was posted in
+        original_text: Text of the group
+        prompt: Prepared text sent to the LLM
+        completion: Result and usage of the call
+        price_factor: Share of the list price of the tokens billed, lower for batch jobs
+    """
+    return LLMCall(
+        group_id=group_id,
+        channel_name=channel_name,
+        model_name=completion.model_name,
+        prompt_tokens=completion.prompt_tokens,
+        completion_tokens=completion.completion_tokens,
+        latency_ms=completion.latency_ms,
+        original_chars=len(original_text or ""),
+        prompt_chars=len(prompt),
+        succeeded=completion.property_details is not None,
+        price_factor=price_factor
+    )
+
+
+def listing_property(listing: CleanedListing) -> Optional[Property]:
+    """Read the property details back from a cleaned listing, None if they no longer validate."""
+    values = {name: getattr(listing, name) for name in Property.__fields__}
+    for name in ('nearby_landmarks', 'phone_numbers'):
+        if values[name] is not None:
+            values[name] = json.loads(values[name])
+    try:
+        return Property(**values)
+    except ValidationError:
+        return None
+
+
+def cluster_listings(cluster_ids: Iterable[int]):
+    """Build the query of (cluster ID, CleanedListing) of the given listing clusters, newest listing first."""
+    return select(MessageGroup.cluster_id, CleanedListing).join(
+        MessageGroup, CleanedListing.group_id == MessageGroup.id
+    ).where(
+        MessageGroup.cluster_id.in_(list(cluster_ids))
+    ).order_by(CleanedListing.id.desc())
+
+
+async def save_listings(session: AsyncSession, listings: List[Tuple[CleanedListing, Optional[int]]]):
+    """Add cleaned listings, keeping one row per listing cluster.
+
+    A listing of a cluster that already has a row replaces that row's details
+    and moves it to the newer group, so reposts of an apartment update its
+    listing instead of duplicating it.
+
+    Args:
+        session: Database session, committed by the caller
+        listings: New rows with the listing cluster of their groups, None for unclustered groups
+    """
+    clusters = {cluster_id for _, cluster_id in listings if cluster_id is not None}
+    existing: Dict[int, CleanedListing] = {}
+    if clusters:
+        for cluster_id, row in await session.execute(cluster_listings(clusters)):
+            existing.setdefault(cluster_id, row)
+    for listing, cluster_id in listings:
+        row = existing.get(cluster_id)
+        if row is None:
+            session.add(listing)
+            if cluster_id is not None:
+                existing[cluster_id] = listing
+            continue
+        for column in CleanedListing.__table__.columns:
+            if not column.primary_key:
+                setattr(row, column.key, getattr(listing, column.key))
@@ -0,0 +1,254 @@
+"""Concurrent extraction pipeline for the listing processor service."""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Optional, List
+
+from .listing import build_cleaned_listing, build_llm_call, save_listings
+from .preparation import count_tokens
+from .schemas import Property
+
+logger = logging.getLogger(__name__)
+
+# Rough size of the system prompt and schema sent with every listing
+PROMPT_OVERHEAD_TOKENS = 300
+
+
+def estimate_tokens(text: str, max_tokens: int) -> int:
+    """Estimate the tokens a request uses, counting the full completion budget."""
+    return count_tokens(text) + PROMPT_OVERHEAD_TOKENS + max_tokens
+
+
+@dataclass
+class ListingJob:
+    """Data of one message group, detached from the session that loaded it."""
+    group_id: int
+    text: str  # Prepared text sent to the LLM
+    image_urls: List[str]
+    cluster_id: Optional[int] = None
+    earlier: Optional[Property] = None  # Details extracted from an earlier post of the same apartment
+    channel_name: Optional[str] = None
+    original_text: Optional[str] = None  # Text of the group, stored with its listing
+
+
+class RateBudget:
+    """Requests-per-minute and tokens-per-minute budget over a sliding minute."""
+
+    WINDOW_SECONDS = 60.0
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int):
+        self.requests_per_minute = max(1, requests_per_minute)
+        self.tokens_per_minute = max(1, tokens_per_minute)
+        self._spent = deque()
+        self._tokens = 0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, tokens: int):
+        """Wait until a request of `tokens` tokens fits in the budget and record it.
+
+        A request larger than the whole token budget is admitted once the
+        window is empty.
+        """
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._spent and now - self._spent[0][0] >= self.WINDOW_SECONDS:
+                    self._tokens -= self._spent.popleft()[1]
+                fits_tokens = self._tokens + tokens <= self.tokens_per_minute or not self._spent
+                if len(self._spent) < self.requests_per_minute and fits_tokens:
+                    self._spent.append((now, tokens))
+                    self._tokens += tokens
+                    return
+                await asyncio.sleep(self._spent[0][0] + self.WINDOW_SECONDS - now)
+
+
+class ListingPipeline:
+    """Prefetches unprocessed groups, extracts them concurrently and writes results in batches.
+
+    A prefetcher claims groups from the WorkQueue in batches and feeds a
+    bounded queue, a pool of workers runs LLM calls under a RateBudget, and
+    a single writer inserts CleanedListing rows in bulk. Leases of groups in
+    flight are renewed by a heartbeat, so several pipelines can share the
+    database.
+    """
+
+    def __init__(self, service, session_factory, queue, workers: int, prefetch_size: int, write_batch_size: int,
+                 budget: RateBudget, max_tokens: int, sleep_interval: int = 60, flush_interval: float = 2.0):
+        """Initialize the pipeline.
+
+        Args:
+            service: ListingProcessorService providing queries and the LLM processor
+            session_factory: Factory of async database sessions
+            queue: WorkQueue the groups are claimed from
+            workers: Number of concurrent LLM calls
+            prefetch_size: Number of groups claimed and queued ahead of the workers
+            write_batch_size: Maximum number of rows written per commit
+            budget: Rate budget shared by all workers
+            max_tokens: Completion token limit of a request
+            sleep_interval: Seconds to wait when nothing is unprocessed
+            flush_interval: Seconds the writer waits to fill a batch
+        """
+        self.service = service
+        self.session_factory = session_factory
+        self.queue = queue
+        self.workers = max(1, workers)
+        self.prefetch_size = max(1, prefetch_size)
+        self.write_batch_size = max(1, write_batch_size)
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.sleep_interval = sleep_interval
+        self.flush_interval = flush_interval
+
+        self._in_flight = set()
+
+    async def run(self, total_limit: Optional[int] = None) -> int:
+        """Run until `total_limit` listings are written, or forever if None.
+
+        Returns:
+            int: Number of listings written
+        """
+        jobs = asyncio.Queue(maxsize=self.prefetch_size)
+        results = asyncio.Queue()
+        tasks = [asyncio.create_task(self._prefetch(jobs)), asyncio.create_task(self._heartbeat())]
+        tasks += [asyncio.create_task(self._work(jobs, results)) for _ in range(self.workers)]
+        try:
+            return await self._write(results, total_limit)
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            # Groups claimed but not written go back to the queue for other workers
+            await self._release(self._in_flight)
+            self._in_flight.clear()
+
+    async def _release(self, group_ids):
+        try:
+            await self.queue.release(group_ids)
+        except Exception as e:
+            logger.warning(f"Error releasing {len(group_ids)} groups, their leases will expire: {str(e)}")
+
+    async def _prefetch(self, jobs: asyncio.Queue):
+        while True:
+            free = self.prefetch_size - jobs.qsize()
+            if free <= 0:
+                await asyncio.sleep(0.1)
+                continue
+            group_ids = []
+            try:
+                group_ids = await self.queue.claim(free)
+                self._in_flight.update(group_ids)
+                if not group_ids:
+                    logger.info("No unprocessed items found, sleeping...")
+                    await asyncio.sleep(self.sleep_interval)
+                    continue
+                async with self.session_factory() as session:
+                    await self.service.learn_boilerplate(session)
+                    groups = await self.service.load_groups(session, group_ids)
+                    earlier = await self.service.earlier_extractions(session, groups)
+                    batch = [
+                        ListingJob(group.id, self.service.listing_text(group), self.service.listing_images(group),
+                                   group.cluster_id, earlier.get(group.id), group.channel_name, group.combined_text)
+                        for group in groups
+                    ]
+            except Exception as e:
+                logger.error(f"Error prefetching groups: {str(e)}")
+                self._in_flight.difference_update(group_ids)
+                await self._release(group_ids)
+                await asyncio.sleep(self.sleep_interval)
+                continue
+
+            # Groups deleted by retention since the claim are simply dropped
+            self._in_flight.difference_update(set(group_ids) - {job.group_id for job in batch})
+            logger.info(f"Prefetched {len(batch)} groups")
+            for job in batch:
+                await jobs.put(job)
+
+    async def _heartbeat(self):
+        interval = self.queue.lease.total_seconds() / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.queue.heartbeat(self._in_flight)
+            except Exception as e:
+                logger.warning(f"Error renewing leases: {str(e)}")
+
+    async def _work(self, jobs: asyncio.Queue, results: asyncio.Queue):
+        while True:
+            job = await jobs.get()
+            completion = None
+            try:
+                # Reposts and templated listings are answered without spending budget
+                property_details = await self.service.lookup_cached(job.text)
+                if property_details is None:
+                    rules = self.service.pre_extract(job.text)
+                    property_details = rules.property_details
+                    if property_details is None and job.earlier is not None:
+                        property_details = self.service.reuse(job.earlier, rules)
+                    if property_details is None:
+                        await self.budget.acquire(estimate_tokens(job.text, self.max_tokens))
+                        completion = await self.service.llm_processor.complete(job.text, known=rules.known)
+                        property_details = completion.property_details
+                        await self.service.store_cached(job.text, property_details)
+            except Exception as e:
+                logger.warning(f"Extraction of group {job.group_id} failed: {str(e)}")
+                property_details = None
+            await results.put((job, property_details, completion))
+
+    async def _next_batch(self, results: asyncio.Queue) -> List:
+        batch = [await results.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.write_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(results.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, results: asyncio.Queue, total_limit: Optional[int]) -> int:
+        written = 0
+        while total_limit is None or written < total_limit:
+            batch = await self._next_batch(results)
+            failed = [job.group_id for job, property_details, _ in batch if property_details is None]
+            clusters = {job.group_id: job.cluster_id for job, _, _ in batch}
+            listings = [
+                build_cleaned_listing(job.group_id, job.original_text or job.text, property_details, job.image_urls)
+                for job, property_details, _ in batch if property_details is not None
+            ]
+            # Usage is recorded for every call, whether or not its result is written
+            calls = [
+                build_llm_call(job.group_id, job.channel_name, job.original_text or job.text, job.text, completion)
+                for job, _, completion in batch if completion is not None
+            ]
+
+            if listings or calls:
+                try:
+                    async with self.session_factory() as session:
+                        # Only groups still leased to this worker are written
+                        owned = await self.queue.complete(session, [listing.group_id for listing in listings])
+                        changed = [listing.group_id for listing in listings if listing.group_id not in owned]
+                        listings = [listing for listing in listings if listing.group_id in owned]
+                        # Reposts replace the listing of their cluster
+                        await save_listings(session, [(listing, clusters[listing.group_id]) for listing in listings])
+                        session.add_all(calls)
+                        await session.commit()
+                    # Groups whose text changed meanwhile are extracted again
+                    await self.queue.requeue_changed(changed)
+                    written += len(listings)
+                    if listings:
+                        logger.info(f"Wrote {len(listings)} cleaned listings ({written} total)")
+                except Exception as e:
+                    logger.error(f"Error writing {len(listings)} cleaned listings: {str(e)}")
+                    failed += [listing.group_id for listing in listings]
+
+            try:
+                await self.queue.fail(failed)
+            except Exception as e:
+                logger.error(f"Error recording {len(failed)} failed groups: {str(e)}")
+            for job, _, _ in batch:
+                self._in_flight.discard(job.group_id)
+        return written
@@ -0,0 +1,133 @@
+"""Preparation of listing texts before they are sent to the LLM."""
+import logging
+import re
+import time
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import MessageGroup, STATE_SKIPPED
+from .cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# Rough characters per token of Cyrillic, Georgian and English listing texts
+CHARS_PER_TOKEN = 3
+
+# Runs of three or more emoji and other symbols collapse to their first one
+_SYMBOL_RUN = re.compile(r"([^\w\s\x00-\x7f])(?:\s*[^\w\s\x00-\x7f]){2,}")
+_BLANK_LINES = re.compile(r"\n{3,}")
+_WORD = re.compile(r"\w+")
+# Lines with numbers or handles carry prices, phones and contacts, even when a channel repeats them
+_KEEP = re.compile(r"\d|@")
+
+
+def count_tokens(text: str) -> int:
+    """Estimate the tokens of a text."""
+    return len(text) // CHARS_PER_TOKEN
+
+
+def boilerplate_key(line: str) -> Optional[str]:
+    """Return the key a line is counted under when learning boilerplate, None for lines never removed."""
+    if _KEEP.search(line):
+        return None
+    key = normalize_text(line)
+    return key if len(_WORD.findall(key)) >= 3 else None
+
+
+class TextPreparer:
+    """Removes what the LLM does not need from listing texts.
+
+    Album captions repeated across messages are dropped, lines a channel puts
+    under most of its posts (footers, ads, subscribe calls) are removed, emoji
+    walls collapse, and the text is cut to `max_tokens`.
+    """
+
+    def __init__(self, max_tokens: int = 1500, min_groups: int = 5, min_share: float = 0.3,
+                 refresh_seconds: float = 3600):
+        """Initialize the preparer.
+
+        Args:
+            max_tokens: Estimated tokens a prepared text is cut to, 0 for no limit
+            min_groups: Groups of a channel a line must occur in to be boilerplate
+            min_share: Share of a channel's groups a line must occur in to be boilerplate
+            refresh_seconds: Seconds after which the boilerplate is learned again
+        """
+        self.max_tokens = max_tokens
+        self.min_groups = min_groups
+        self.min_share = min_share
+        self.refresh_seconds = refresh_seconds
+        self.boilerplate: Dict[str, Set[str]] = {}
+        self.loaded_at = None
+        self.truncated = 0
+
+    def learn(self, samples: Iterable[Tuple[str, str]]):
+        """Replace the boilerplate lines with those learned from (channel name, text) samples."""
+        counts = defaultdict(Counter)
+        groups = Counter()
+        for channel_name, text in samples:
+            groups[channel_name] += 1
+            counts[channel_name].update({boilerplate_key(line) for line in (text or "").splitlines()} - {None})
+        self.boilerplate = {
+            channel_name: {
+                key for key, count in line_counts.items()
+                if count >= self.min_groups and count >= self.min_share * groups[channel_name]
+            }
+            for channel_name, line_counts in counts.items()
+        }
+        self.boilerplate = {channel_name: keys for channel_name, keys in self.boilerplate.items() if keys}
+
+    def needs_refresh(self) -> bool:
+        """Check whether the boilerplate was never learned or was learned more than `refresh_seconds` ago."""
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > self.refresh_seconds
+
+    async def load(self, session: AsyncSession, sample_size: int = 5000):
+        """Learn the boilerplate of each channel from its most recent listings."""
+        result = await session.stream(
+            select(MessageGroup.channel_name, MessageGroup.combined_text)
+            .where(MessageGroup.processing_state != STATE_SKIPPED)
+            .order_by(MessageGroup.id.desc())
+            .limit(sample_size)
+            .execution_options(yield_per=1000)
+        )
+        self.learn([(channel_name, text) async for channel_name, text in result])
+        self.loaded_at = time.monotonic()
+        lines = sum(len(keys) for keys in self.boilerplate.values())
+        logger.info(f"Learned {lines} boilerplate lines of {len(self.boilerplate)} channels")
+
+    def prepare(self, channel_name: Optional[str], text: str) -> str:
+        """Return the text of a listing as it is sent to the LLM."""
+        boilerplate = self.boilerplate.get(channel_name, set())
+        seen = set()
+        lines = []
+        for line in (text or "").splitlines():
+            line = _SYMBOL_RUN.sub(r"\1", line).strip()
+            if not line:
+                lines.append(line)
+                continue
+            # Captions repeated by album members, or within one message, are kept once
+            key = normalize_text(line) or line
+            if key in seen or boilerplate_key(line) in boilerplate:
+                continue
+            seen.add(key)
+            lines.append(line)
+        prepared = _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+        return self.truncate(prepared)
+
+    def truncate(self, text: str) -> str:
+        """Cut a text to `max_tokens`, at a line break where possible."""
+        if not self.max_tokens or count_tokens(text) <= self.max_tokens:
+            return text
+        self.truncated += 1
+        cut = text[:self.max_tokens * CHARS_PER_TOKEN]
+        line_break = cut.rfind("\n")
+        return cut[:line_break] if line_break > len(cut) // 2 else cut
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "channels": len(self.boilerplate),
+            "boilerplate_lines": sum(len(keys) for keys in self.boilerplate.values()),
+            "truncated": self.truncated,
+        }
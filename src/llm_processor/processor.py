@@ -1,51 +1,170 @@
 """LLM processor for extracting structured information from property listings."""
-import json
-from typing import Optional
+import asyncio
+import hashlib
+import logging
+import random
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, FrozenSet, Optional, Type
 
-from openai import OpenAI
-from openai.error import OpenAIError
+from pydantic import BaseModel, ValidationError, create_model
 
+from .backends import ChatBackend, RetryableError, create_backend
 from .config import LLMConfig
 from .schemas import Property
 
+logger = logging.getLogger(__name__)
+
+GEL_PER_USD = 3
+
+FIELD_RULES = f"""
+For layout, use one of: "studio", "1+1", "2+1", "3+1", "other"
+For heating_type, use one of: "central", "individual", "none", "other"
+For pet_policy, use one of: "allowed", "not_allowed", "negotiable", "other"
+Convert all prices to USD using approximate rate: 1 USD = {GEL_PER_USD} GEL"""
+
+SYSTEM_PROMPT = """
+Extract all relevant details from the property listing.""" + FIELD_RULES
+
+# Used when rule-based extraction already found some fields; the schema lists the others only
+PARTIAL_PROMPT = """
+Extract the requested details from the property listing; the other details are already known.""" + FIELD_RULES
+
+# Changes whenever the prompt changes, so cached extractions of an older prompt are not reused
+PROMPT_VERSION = hashlib.sha256(SYSTEM_PROMPT.encode()).hexdigest()[:12]
+
+
+@lru_cache(maxsize=256)
+def partial_model(known_fields: FrozenSet[str]) -> Type[BaseModel]:
+    """Return a model of the Property fields not in `known_fields`, required as in Property."""
+    fields = {
+        name: (Property.__annotations__[name], ... if model_field.required else None)
+        for name, model_field in Property.__fields__.items()
+        if name not in known_fields
+    }
+    return create_model('PropertyDetails', **fields)
+
+
+def request_body(text: str, config: LLMConfig, known: Optional[Dict[str, Any]] = None) -> dict:
+    """Build the chat completion request extracting a listing, shared by online and batch extraction."""
+    response_model = partial_model(frozenset(known)) if known else Property
+    return {
+        "model": config.model_name,
+        "messages": [
+            {"role": "system", "content": PARTIAL_PROMPT if known else SYSTEM_PROMPT},
+            {"role": "user", "content": text}
+        ],
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": response_model.__name__, "schema": response_model.schema()}
+        },
+        "temperature": config.temperature,
+        "max_tokens": config.max_tokens,
+    }
+
+
+@dataclass
+class Completion:
+    """Result and token usage of one LLM call."""
+    property_details: Optional[Property]
+    model_name: Optional[str] = None
+    prompt_tokens: Optional[int] = None  # Summed over retries, None when no request was answered
+    completion_tokens: Optional[int] = None
+    latency_ms: Optional[int] = None
+
 
 class LLMProcessor:
-    """Processor that uses OpenAI to extract structured information from listings."""
+    """Processor that uses OpenAI to extract structured information from listings.
+
+    Requests that fail with a rate limit, a server error or a lost connection
+    are sent again after the wait the server asks for, or after an
+    exponential backoff. Answers that do not validate against the schema are
+    requested again at once, a limited number of times.
+    """
     
-    def __init__(self, config: LLMConfig):
-        """Initialize the processor with configuration."""
+    def __init__(self, config: LLMConfig, backend: Optional[ChatBackend] = None):
+        """Initialize the processor with configuration.
+        
+        Args:
+            config: Model, HTTP client and retry settings
+            backend: Backend answering the requests, defaults to the one named by config.backend
+        """
         self.config = config
-        self.client = OpenAI(api_key=config.openai_api_key)
+        self.backend = backend or create_backend(config)
+        self.requests = 0
+        self.retried = 0
+        self.invalid = 0
+        self.failed = 0
         
-    async def process_listing(self, text: str) -> Optional[Property]:
+    async def process_listing(self, text: str, known: Optional[Dict[str, Any]] = None) -> Optional[Property]:
         """Process a listing text and extract structured information.
         
         Args:
             text: Raw listing text to process
+            known: Fields already extracted by rules; only the others are requested
             
         Returns:
             Property object with extracted information or None if processing failed
         """
-        try:
-            completion = await self.client.beta.chat.completions.parse(
-                model="gpt-4o-mini",
-                messages=[
-                    {"role": "system", "content": """
-Extract all relevant details from the property listing.
-For layout, use one of: "studio", "1+1", "2+1", "3+1", "other"
-For heating_type, use one of: "central", "individual", "none", "other"
-For pet_policy, use one of: "allowed", "not_allowed", "negotiable", "other"
-Convert all prices to USD using approximate rate: 1 USD = 3 GEL"""
-                    },
-                    {"role": "user", "content": text}
-                ],
-                response_format=Property,
-                temperature=self.config.temperature,
-                max_tokens=self.config.max_tokens,
-            )
-            
-            return completion.choices[0].message.parsed
+        return (await self.complete(text, known)).property_details
+        
+    async def complete(self, text: str, known: Optional[Dict[str, Any]] = None) -> Completion:
+        """Extract a listing like process_listing, and report the call's token usage and latency."""
+        started = time.monotonic()
+        body = request_body(text, self.config, known)
+        response_model = partial_model(frozenset(known)) if known else Property
+        completion = Completion(None)
+        transient_failures = 0
+        invalid_answers = 0
+        while True:
+            self.requests += 1
+            try:
+                response = await self.backend.complete(body)
+            except RetryableError as e:
+                transient_failures += 1
+                if transient_failures > self.config.request_retries:
+                    logger.warning(f"Giving up on a request after {transient_failures} attempts: {str(e)}")
+                    break
+                wait = self.retry_wait(transient_failures, e.retry_after)
+                logger.info(f"Request failed ({e.status_code or 'no response'}), retrying in {wait:.1f}s")
+                self.retried += 1
+                await asyncio.sleep(wait)
+                continue
+            except Exception as e:
+                logger.warning(f"Request failed and is not retried: {str(e)}")
+                break
             
-        except Exception as e:
-            # Log error here
-            return None
+            completion.model_name = response.model_name
+            if response.prompt_tokens is not None:
+                completion.prompt_tokens = (completion.prompt_tokens or 0) + response.prompt_tokens
+                completion.completion_tokens = (completion.completion_tokens or 0) + (response.completion_tokens or 0)
+            try:
+                parsed = response_model.parse_raw(response.content or "")
+                completion.property_details = Property(**{**parsed.dict(), **known}) if known else parsed
+                break
+            except ValidationError as e:
+                invalid_answers += 1
+                self.invalid += 1
+                if invalid_answers > self.config.validation_retries:
+                    logger.warning(f"Answer does not match the schema after {invalid_answers} attempts: {str(e)}")
+                    break
+        
+        if completion.property_details is None:
+            self.failed += 1
+        completion.latency_ms = int((time.monotonic() - started) * 1000)
+        return completion
+        
+    def retry_wait(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Seconds to wait before retry `attempt`: the server's Retry-After, else a jittered exponential backoff."""
+        if retry_after is not None:
+            return min(retry_after, self.config.retry_max_wait_seconds)
+        backoff = self.config.retry_backoff_seconds * 2 ** (attempt - 1)
+        return min(backoff, self.config.retry_max_wait_seconds) * random.uniform(0.5, 1.0)
+        
+    def stats(self) -> Dict[str, int]:
+        return {"requests": self.requests, "retried": self.retried, "invalid": self.invalid, "failed": self.failed}
+        
+    async def aclose(self):
+        """Close the backend's HTTP connections."""
+        await self.backend.aclose()
@@ -0,0 +1,289 @@
+"""Rule-based extraction of templated listings, ahead of the LLM.
+
+Many channels post listings in a fixed template ("2+1, 65 m², 5/9 floor,
+$600, +995 5xx ..."). The RuleExtractor reads the fields such templates
+carry with compiled patterns and gives each a confidence; listings whose
+required fields are all confident skip the LLM, the others only ask it for
+the fields still missing.
+"""
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .processor import GEL_PER_USD
+from .schemas import Property, PropertyLayout
+
+# Fields a Property cannot be built without
+REQUIRED_FIELDS = tuple(name for name, model_field in Property.__fields__.items() if model_field.required)
+
+# Confidence of a value found once, and of one picked among conflicting values
+CONFIDENT = 0.9
+CONFLICTING = 0.5
+
+# Not the tail of a layout, date or decimal ("2+1 600$" is 600)
+_AMOUNT = r'(?<![\d+.,/])(\d{1,3}(?:[ ,]\d{3})+|\d+)'
+USD_PRICE = re.compile(rf'\$\s*{_AMOUNT}|{_AMOUNT}\s*(?:\$|usd\b|dollars?\b|долл|დოლ)', re.I)
+GEL_PRICE = re.compile(rf'₾\s*{_AMOUNT}|{_AMOUNT}\s*(?:₾|gel\b|lari\b|лари|ლარ)', re.I)
+DEPOSIT = re.compile(r'deposit|депозит|залог|დეპოზიტ', re.I)
+SUMMER = re.compile(r'summer|летом|лето|ზაფხულ', re.I)
+DAILY = re.compile(r'per day|/\s*day|a day|daily|сутк|посуточн|დღიურ', re.I)
+# Monthly rents outside this range are sale prices, daily rates or typos
+RENT_RANGE_USD = (50, 20000)
+CONTEXT_CHARS = 20
+
+PLUS_LAYOUT = re.compile(r'(?<![\d+])(\d)\s*\+\s*1(?![\d+])')
+STUDIO = re.compile(r'studio|студи|სტუდიო', re.I)
+BEDROOMS = re.compile(r'(?<!\d)(\d)\s*-?\s*(?:bed(?:room)?s?\b|br\b|спальн|საძინებ)', re.I)
+# Rooms count the living room: a 3-room flat is a 2+1
+ROOMS = re.compile(r'(?<!\d)(\d)\s*-?\s*(?:rooms?\b|комнатн|ოთახიან)', re.I)
+
+AREA = re.compile(r'(?<![\d.,])(\d{2,4}(?:[.,]\d{1,2})?)\s*(?:m²|m2\b|sq\.?\s*m\b|sqm\b|кв\.?\s*м|м²|м2\b|კვ\.?\s*მ|მ²)', re.I)
+AREA_RANGE = (10, 1000)
+
+# Floor and total floors, most specific first
+FLOOR_OF = (
+    re.compile(r'(?<!\d)(\d{1,2})\s*/\s*(\d{1,2})\s*(?:floor|fl\b|этаж|эт\b|სართ)', re.I),
+    re.compile(r'(?:floor|этаж|სართული)\s*:?\s*(\d{1,2})\s*(?:/|of|из)\s*(\d{1,2})(?!\d)', re.I),
+    re.compile(r'(?<!\d)(\d{1,2})(?:st|nd|rd|th|-?й|-?ый)?\s*(?:floor|этаж)\s*(?:of|/|из)\s*(\d{1,2})(?!\d)', re.I),
+)
+FLOOR = (
+    re.compile(r'(?<![\d/])(\d{1,2})(?:st|nd|rd|th|-?й|-?ый)?\s*(?:floor|этаж|სართულ)', re.I),
+    re.compile(r'(?:floor|этаж|სართული)\s*:?\s*(\d{1,2})(?![\d/])', re.I),
+)
+TOTAL_FLOORS = re.compile(r'(?<!\d)(\d{1,2})\s*-?\s*(?:stor(?:e)?y|storied|этажн|სართულიან)', re.I)
+MAX_FLOORS = 60
+
+# Georgian mobile numbers: optional +995, then nine digits starting with 5
+PHONE = re.compile(r'(?<![\d+])(?:\+\s*)?(?:995[\s\-.()]*)?5(?:[\s\-.()]*\d){8}(?!\d)')
+# Any other long digit run may be a phone number the pattern does not know
+LONG_NUMBER = re.compile(r'(?<![\d+])\+?\d(?:[\s\-.()]*\d){6,}')
+TELEGRAM = re.compile(r'(?:t\.me/|(?<![\w.])@)([A-Za-z][A-Za-z0-9_]{3,31})\b')
+
+ADDRESS_LINE = re.compile(r'^[ \t]*(?:📍️?|address\s*:|адрес\s*:|მისამართი\s*:)[ \t]*(.+?)[ \t.,;]*$', re.I | re.M)
+STREET = re.compile(
+    r"[^\s,;:]+(?:\s+[^\s,;:]+)?\s+(?:st\.|street\b|str\.|ave\.|avenue\b|ქ\.|ქუჩა)(?:\s*\d+\w?)?"
+    r"|(?:ул\.|улица|пр\.|проспект)\s*[^\s,;:]+(?:\s+\d+\w?)?",
+    re.I
+)
+
+# Spellings of districts -> name stored in Property.district
+DISTRICTS = {
+    'Vake': ('vake', 'ваке', 'ვაკე'),
+    'Saburtalo': ('saburtalo', 'сабуртало', 'საბურთალო'),
+    'Vera': ('vera', 'ვერა'),
+    'Mtatsminda': ('mtatsminda', 'мтацминда', 'მთაწმინდა'),
+    'Sololaki': ('sololaki', 'сололаки', 'სოლოლაკი'),
+    'Old Tbilisi': ('old tbilisi', 'старый тбилиси', 'ძველი თბილისი'),
+    'Didube': ('didube', 'дидубе', 'დიდუბე'),
+    'Chugureti': ('chugureti', 'чугурети', 'ჩუღურეთი'),
+    'Isani': ('isani', 'исани', 'ისანი'),
+    'Gldani': ('gldani', 'глдани', 'გლდანი'),
+    'Nadzaladevi': ('nadzaladevi', 'надзаладеви', 'ნაძალადევი'),
+    'Avlabari': ('avlabari', 'авлабари', 'ავლაბარი'),
+    'Ortachala': ('ortachala', 'орточала', 'ორთაჭალა'),
+    'Dighomi': ('dighomi', 'digomi', 'дигоми', 'დიღომი'),
+    'Krtsanisi': ('krtsanisi', 'крцаниси', 'კრწანისი'),
+    'Samgori': ('samgori', 'самгори', 'სამგორი'),
+    'Varketili': ('varketili', 'варкетили', 'ვარკეთილი'),
+    'Bagebi': ('bagebi', 'багеби', 'ბაგები'),
+    'Lisi': ('lisi', 'лиси', 'ლისი'),
+}
+DISTRICT = re.compile(
+    r'(?<!\w)(' + '|'.join(re.escape(name) for names in DISTRICTS.values() for name in names) + r')(?!\w)',
+    re.I
+)
+DISTRICT_NAMES = {name: district for district, names in DISTRICTS.items() for name in names}
+
+
+@dataclass
+class RuleExtraction:
+    """Fields read from a listing by the rules, with a confidence per field."""
+    values: Dict[str, Any] = field(default_factory=dict)
+    confidence: Dict[str, float] = field(default_factory=dict)
+    known: Dict[str, Any] = field(default_factory=dict)  # Fields at or above the confidence threshold
+    property_details: Optional[Property] = None  # Set when the known fields make a whole Property
+
+    def set(self, name: str, value: Any, confidence: float):
+        """Record a field, unless a more confident value was found before."""
+        if confidence > self.confidence.get(name, 0.0):
+            self.values[name] = value
+            self.confidence[name] = confidence
+
+
+def _pick(candidates: List[Any]) -> Tuple[Any, float]:
+    """Return the first candidate and how confident a single distinct value makes it."""
+    distinct = list(dict.fromkeys(candidates))
+    return distinct[0], CONFIDENT if len(distinct) == 1 else CONFLICTING
+
+
+def _amount(match: re.Match) -> int:
+    return int(re.sub(r'[ ,]', '', next(group for group in match.groups() if group)))
+
+
+def _context(text: str, match: re.Match) -> str:
+    return text[max(0, match.start() - CONTEXT_CHARS):match.start()]
+
+
+class RuleExtractor:
+    """Deterministic extractor of templated listings.
+
+    Covers the layout, bedrooms, area, floors, rent and deposit (GEL
+    converted to USD), phone numbers, Telegram handle, address and district.
+    """
+
+    def __init__(self, min_confidence: float = 0.8):
+        """Initialize the extractor.
+
+        Args:
+            min_confidence: Confidence a field needs to be trusted without the LLM
+        """
+        self.min_confidence = min_confidence
+        self.rule_only = 0
+        self.partial = 0
+        self.unmatched = 0
+
+    def extract(self, text: str) -> RuleExtraction:
+        """Read the fields of a listing text.
+
+        Returns:
+            RuleExtraction whose `known` fields can skip the LLM and whose
+            `property_details` are set when no LLM call is needed at all
+        """
+        result = RuleExtraction()
+        text = text or ""
+        for rule in (self._layout, self._area, self._floors, self._prices, self._contacts, self._location):
+            rule(text, result)
+
+        result.known = {
+            name: value for name, value in result.values.items()
+            if result.confidence[name] >= self.min_confidence
+        }
+        if all(name in result.known for name in REQUIRED_FIELDS):
+            try:
+                result.property_details = Property(**result.known)
+            except ValidationError:
+                result.property_details = None
+
+        if result.property_details is not None:
+            self.rule_only += 1
+        elif result.known:
+            self.partial += 1
+        else:
+            self.unmatched += 1
+        return result
+
+    def stats(self) -> dict:
+        """Listings extracted by the rules alone, with a partial LLM call and with a full one."""
+        total = self.rule_only + self.partial + self.unmatched
+        return {
+            "rule_only": self.rule_only,
+            "partial": self.partial,
+            "unmatched": self.unmatched,
+            "rule_only_rate": round(self.rule_only / total, 3) if total else 0.0,
+        }
+
+    def _layout(self, text: str, result: RuleExtraction):
+        bedrooms = [int(match.group(1)) for match in PLUS_LAYOUT.finditer(text)]
+        if bedrooms:
+            count, confidence = _pick(bedrooms)
+        elif STUDIO.search(text):
+            result.set('layout', PropertyLayout.STUDIO, CONFIDENT)
+            result.set('bedrooms', 0, CONFIDENT)
+            return
+        elif match := BEDROOMS.search(text):
+            count, confidence = int(match.group(1)), 0.8
+        elif match := ROOMS.search(text):
+            count, confidence = int(match.group(1)) - 1, 0.6
+        else:
+            return
+
+        if count <= 0:
+            result.set('layout', PropertyLayout.STUDIO, confidence)
+            return
+        layout = PropertyLayout(f"{count}+1") if count <= 3 else PropertyLayout.OTHER
+        result.set('layout', layout, confidence)
+        result.set('bedrooms', count, confidence)
+
+    def _area(self, text: str, result: RuleExtraction):
+        areas = [float(match.group(1).replace(',', '.')) for match in AREA.finditer(text)]
+        areas = [area for area in areas if AREA_RANGE[0] <= area <= AREA_RANGE[1]]
+        if areas:
+            result.set('area_sqm', *_pick(areas))
+
+    def _floors(self, text: str, result: RuleExtraction):
+        for pattern in FLOOR_OF:
+            pairs = [(int(floor), int(total)) for floor, total in pattern.findall(text)]
+            pairs = [(floor, total) for floor, total in pairs if 0 <= floor <= total <= MAX_FLOORS]
+            if pairs:
+                (floor, total), confidence = _pick(pairs)
+                result.set('floor', floor, confidence)
+                result.set('total_floors', total, confidence)
+                return
+
+        for pattern in FLOOR:
+            floors = [int(floor) for floor in pattern.findall(text) if int(floor) <= MAX_FLOORS]
+            if floors:
+                floor, confidence = _pick(floors)
+                result.set('floor', floor, confidence - 0.05)
+                break
+        totals = [int(total) for total in TOTAL_FLOORS.findall(text) if 0 < int(total) <= MAX_FLOORS]
+        if totals:
+            total, confidence = _pick(totals)
+            result.set('total_floors', total, confidence - 0.05)
+
+    def _prices(self, text: str, result: RuleExtraction):
+        rents = {'usd': [], 'gel': []}
+        deposits = []
+        for currency, pattern, rate in (('usd', USD_PRICE, 1.0), ('gel', GEL_PRICE, GEL_PER_USD)):
+            for match in pattern.finditer(text):
+                usd = round(_amount(match) / rate, 2)
+                context = _context(text, match)
+                if DEPOSIT.search(context):
+                    deposits.append(usd)
+                elif not SUMMER.search(context) and RENT_RANGE_USD[0] <= usd <= RENT_RANGE_USD[1]:
+                    rents[currency].append(usd)
+
+        # Prices given in both currencies are usually the same rent; USD is the original
+        candidates = rents['usd'] or rents['gel']
+        if candidates:
+            rent, confidence = _pick(candidates)
+            if not rents['usd']:
+                confidence -= 0.05
+            if DAILY.search(text):
+                confidence = 0.3
+            result.set('monthly_rent_usd', rent, confidence)
+        if deposits:
+            result.set('deposit_amount_usd', *_pick(deposits))
+
+    def _contacts(self, text: str, result: RuleExtraction):
+        phones = []
+        for match in PHONE.finditer(text):
+            digits = re.sub(r'\D', '', match.group())
+            phones.append(f"+995{digits[-9:]}")
+        phones = list(dict.fromkeys(phones))
+        # Long numbers that are not Georgian mobiles may be landlines or foreign phones
+        unknown = [
+            match for match in LONG_NUMBER.finditer(text)
+            if not PHONE.search(match.group())
+        ]
+        if unknown:
+            result.set('phone_numbers', phones, CONFLICTING)
+        else:
+            result.set('phone_numbers', phones, 0.95 if phones else 0.85)
+
+        handles = [f"@{handle}" for handle in TELEGRAM.findall(text)]
+        if handles:
+            handle, confidence = _pick(handles)
+            result.set('telegram', handle, confidence - 0.05)
+
+    def _location(self, text: str, result: RuleExtraction):
+        if match := ADDRESS_LINE.search(text):
+            result.set('address', match.group(1).strip(), 0.85)
+        elif match := STREET.search(text):
+            result.set('address', match.group().strip(), 0.6)
+
+        districts = [DISTRICT_NAMES[name.lower()] for name in DISTRICT.findall(text)]
+        if districts:
+            result.set('district', *_pick(districts))
@@ -1,17 +1,25 @@
 """Service for processing property listings using LLM."""
-import json
 import asyncio
 import logging
 from datetime import datetime, timezone, timedelta
-from typing import Optional, List
+from typing import Optional, List, Dict
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 
-from src.database.models import MessageGroup, CleanedListing, MediaItem
+from src.database.models import MessageGroup
 from src.database.engine import async_session
-from .processor import LLMProcessor
+from src.storage.blob_store import media_url
+from .processor import LLMProcessor, Completion
 from .config import LLMConfig
+from .listing import build_cleaned_listing, build_llm_call, cluster_listings, listing_property, save_listings
+from .pipeline import ListingPipeline, RateBudget
+from .cache import ExtractionCache
+from .work_queue import WorkQueue
+from .rules import RuleExtractor, RuleExtraction
+from .preparation import TextPreparer
+from .schemas import Property
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -19,134 +27,247 @@ logger = logging.getLogger(__name__)
 class ListingProcessorService:
     """Service for processing property listings."""
     
-    def __init__(self, llm_processor: LLMProcessor):
-        """Initialize the service."""
+    def __init__(self, llm_processor: LLMProcessor, media_base_url: Optional[str] = None,
+                 cache: Optional[ExtractionCache] = None, queue: Optional[WorkQueue] = None,
+                 rules: Optional[RuleExtractor] = None, preparer: Optional[TextPreparer] = None):
+        """Initialize the service.
+        
+        Args:
+            llm_processor: Processor used for extraction
+            media_base_url: Prefix of the image URLs of cleaned listings, defaults to MEDIA_BASE_URL
+            cache: Cache of earlier extractions; reposted texts skip the LLM when set
+            queue: Work queue groups are claimed from, defaults to one on the configured database
+            rules: Rule-based extractor; templated listings skip the LLM when set
+            preparer: Cleans texts before they are sent to the LLM; texts are sent as stored when None
+        """
         self.llm_processor = llm_processor
+        self.media_base_url = media_base_url
+        self.cache = cache
+        self.queue = queue or WorkQueue(async_session)
+        self.rules = rules
+        self.preparer = preparer
+        self.reused = 0
         
-    async def get_next_unprocessed(self, session: AsyncSession) -> Optional[MessageGroup]:
-        """Get next unprocessed message group."""
-        query = select(MessageGroup).outerjoin(
-            CleanedListing
-        ).where(
-            CleanedListing.id == None
-        ).limit(1)
+    async def load_groups(self, session: AsyncSession, group_ids: List[int]) -> List[MessageGroup]:
+        """Load claimed message groups with their messages and media, in ID order."""
+        query = select(MessageGroup).where(
+            MessageGroup.id.in_(group_ids)
+        ).order_by(
+            MessageGroup.id
+        ).options(
+            selectinload(MessageGroup.messages),
+            selectinload(MessageGroup.media_items)
+        )
         
         result = await session.execute(query)
-        return result.scalar_one_or_none()
+        return list(result.scalars())
         
-    async def process_listing(self, session: AsyncSession, group: MessageGroup, max_retries: int = 3) -> bool:
-        """Process a single listing with retries.
+    def listing_text(self, group: MessageGroup) -> str:
+        """Text of a group sent to the LLM."""
+        messages = sorted(group.messages, key=lambda m: m.message_id)
+        text = group.combined_text or " ".join(m.text for m in messages if m.text)
+        if self.preparer is None:
+            return text
+        return self.preparer.prepare(group.channel_name, text)
+        
+    async def learn_boilerplate(self, session: AsyncSession):
+        """Learn the channels' boilerplate when it is due."""
+        if self.preparer is None or not self.preparer.needs_refresh():
+            return
+        try:
+            await self.preparer.load(session)
+        except Exception as e:
+            logger.warning(f"Learning channel boilerplate failed: {str(e)}")
+        
+    def listing_images(self, group: MessageGroup) -> List[str]:
+        """URLs of the photos of a group, stored with its cleaned listing instead of their bytes."""
+        urls = []
+        for item in group.media_items:
+            if item.media_type != 'photo':
+                continue
+            if item.content_hash:
+                urls.append(media_url(item.content_hash, self.media_base_url))
+            else:
+                logger.warning(f"Media item {item.id} is not in the media store, run migrate_media_to_store.py")
+        return urls
         
-        Returns:
-            bool: True if processing was successful, False otherwise
-        """
-        for attempt in range(max_retries):
-            try:
-                # Get all messages
-                messages = sorted(group.messages, key=lambda m: m.message_id)
-                if not messages:
-                    logger.warning(f"No messages found in group {group.id}")
-                    return False
-                    
-                # Get the combined text
-                combined_text = group.combined_text or " ".join(m.text for m in messages)
-                
-                # Get all image URLs
-                media_items = [item for item in group.media_items if item.media_type == 'photo']
-                image_urls = [item.file_url for item in media_items if item.file_url]
-                
-                # Process the listing
-                property_details = await self.llm_processor.process_listing(combined_text)
-                
-                if property_details:
-                    # Create new cleaned listing
-                    cleaned_listing = CleanedListing(
-                        group_id=group.id,
-                        original_text=combined_text,
-                        layout=property_details.layout.value,
-                        area_sqm=property_details.area_sqm,
-                        floor=property_details.floor,
-                        total_floors=property_details.total_floors,
-                        bedrooms=property_details.bedrooms,
-                        has_balcony=property_details.has_balcony,
-                        address=property_details.address,
-                        district=property_details.district,
-                        nearby_landmarks=json.dumps(property_details.nearby_landmarks) if property_details.nearby_landmarks else None,
-                        monthly_rent_usd=property_details.monthly_rent_usd,
-                        summer_rent_usd=property_details.summer_rent_usd,
-                        requires_first_last=property_details.requires_first_last,
-                        deposit_amount_usd=property_details.deposit_amount_usd,
-                        commission=property_details.commission,
-                        heating_type=property_details.heating_type.value if property_details.heating_type else None,
-                        has_oven=property_details.has_oven,
-                        has_microwave=property_details.has_microwave,
-                        has_ac=property_details.has_ac,
-                        has_internet=property_details.has_internet,
-                        has_tv=property_details.has_tv,
-                        has_parking=property_details.has_parking,
-                        has_bathtub=property_details.has_bathtub,
-                        is_furnished=property_details.is_furnished,
-                        phone_numbers=json.dumps(property_details.phone_numbers),
-                        whatsapp=property_details.whatsapp,
-                        telegram=property_details.telegram,
-                        contact_name=property_details.contact_name,
-                        min_lease_months=property_details.min_lease_months,
-                        max_lease_months=property_details.max_lease_months,
-                        pet_policy=property_details.pet_policy.value if property_details.pet_policy else None,
-                        has_contract=property_details.has_contract,
-                        image_urls=json.dumps([url.hex() if isinstance(url, bytes) else str(url) for url in image_urls]),
-                        processed_date=datetime.now(timezone.utc)
-                    )
-                    
-                    session.add(cleaned_listing)
-                    await session.commit()
-                    logger.info(f"Successfully processed group {group.id}")
-                    return True
-                    
-            except Exception as e:
-                await session.rollback()
-                if attempt < max_retries - 1:
-                    logger.warning(f"Failed to process group {group.id} (attempt {attempt + 1}/{max_retries}): {str(e)}")
-                    await asyncio.sleep(2 ** attempt)  # Exponential backoff
-                else:
-                    logger.error(f"Failed to process group {group.id} after {max_retries} attempts: {str(e)}")
-                    
-        return False
 
-    async def cleanup_old_data(self, session: AsyncSession) -> int:
-        """Remove data older than 48 hours.
+    async def lookup_cached(self, text: str) -> Optional[Property]:
+        """Return the cached extraction of a text, or None without a cache or on a miss."""
+        if self.cache is None:
+            return None
+        try:
+            return await self.cache.get(text)
+        except Exception as e:
+            logger.warning(f"Extraction cache lookup failed: {str(e)}")
+            return None
+            
+    async def store_cached(self, text: str, property_details: Optional[Property]):
+        """Remember a successful extraction of a text."""
+        if self.cache is None or property_details is None:
+            return
+        try:
+            await self.cache.put(text, property_details)
+        except Exception as e:
+            logger.warning(f"Extraction cache store failed: {str(e)}")
+            
+    async def earlier_extractions(self, session: AsyncSession, groups: List[MessageGroup]) -> Dict[int, Property]:
+        """Return group ID -> details of the listing saved for an earlier post of the same apartment.
+
+        Groups of clusters without a cleaned listing are left out.
+        """
+        clusters = {group.cluster_id for group in groups if group.cluster_id is not None}
+        if not clusters:
+            return {}
+        latest = {}
+        for cluster_id, listing in await session.execute(cluster_listings(clusters)):
+            latest.setdefault(cluster_id, listing)
+        earlier = {}
+        for group in groups:
+            listing = latest.get(group.cluster_id)
+            if listing is not None and listing.group_id != group.id:
+                property_details = listing_property(listing)
+                if property_details is not None:
+                    earlier[group.id] = property_details
+        return earlier
         
-        Returns:
-            int: Number of message groups removed
+    def reuse(self, earlier: Property, rules: RuleExtraction) -> Property:
+        """Update an earlier extraction with the fields the rules read from the repost, e.g. a changed price."""
+        self.reused += 1
+        return Property(**{**earlier.dict(), **rules.known})
+            
+    def pre_extract(self, text: str) -> RuleExtraction:
+        """Apply the rule-based extractor; the result is empty without one."""
+        if self.rules is None:
+            return RuleExtraction()
+        return self.rules.extract(text)
+            
+    async def extract(self, text: str, earlier: Optional[Property] = None,
+                      calls: Optional[List[Completion]] = None) -> Optional[Property]:
+        """Extract property details, from the cache when the text was seen before.
+        
+        Listings the rules read completely skip the LLM, and so do reposts of
+        a listing extracted before. Otherwise the LLM is only asked for the
+        fields the rules did not find.
+        
+        Args:
+            text: Text of the listing
+            earlier: Details extracted from an earlier post of the same apartment
+            calls: Collects the LLM call made, for usage accounting
         """
-        cutoff_time = datetime.now(timezone.utc) - timedelta(hours=48)
-        logger.info(f"Running cleanup for data older than {cutoff_time.isoformat()}")
+        property_details = await self.lookup_cached(text)
+        if property_details is not None:
+            return property_details
+        rules = self.pre_extract(text)
+        if rules.property_details is not None:
+            return rules.property_details
+        if earlier is not None:
+            return self.reuse(earlier, rules)
+        completion = await self.llm_processor.complete(text, known=rules.known)
+        if calls is not None:
+            calls.append(completion)
+        property_details = completion.property_details
+        await self.store_cached(text, property_details)
+        return property_details
+        
+    def log_stats(self):
+        """Log how listings were extracted."""
+        if self.cache is not None:
+            logger.info(f"Extraction cache stats: {self.cache.stats()}")
+        if self.rules is not None:
+            logger.info(f"Rule extraction stats: {self.rules.stats()}")
+        logger.info(f"Reused the extractions of {self.reused} reposted listings")
+        logger.info(f"LLM request stats: {self.llm_processor.stats()}")
+        if self.preparer is not None:
+            logger.info(f"Text preparation stats: {self.preparer.stats()}")
+        
+    async def process_listing(self, session: AsyncSession, group: MessageGroup) -> bool:
+        """Process a single claimed listing.
         
+        The LLM processor retries failed requests itself; a group that still
+        fails is retried later through the work queue, with backoff.
+        The listing is written only if this worker still holds the group's lease,
+        and replaces the listing of an earlier post of the same apartment.
+        
+        Returns:
+            bool: True if processing was successful, False otherwise
+        """
+        # Rollbacks expire the group, so its ID is read once
+        group_id = group.id
         try:
-            # Find old message groups based on posted_date
-            query = select(MessageGroup).where(MessageGroup.posted_date < cutoff_time)
-            result = await session.execute(query)
-            old_groups = result.scalars().all()
-            
-            if not old_groups:
-                logger.info("No old message groups found to clean up")
-                return 0
+            # Get all messages
+            messages = sorted(group.messages, key=lambda m: m.message_id)
+            if not messages:
+                logger.warning(f"No messages found in group {group.id}")
+                return False
                 
-            logger.info(f"Found {len(old_groups)} message groups to clean up")
+            # Get the text sent to the LLM
+            text = self.listing_text(group)
             
-            # Delete the groups (cascade will handle related records)
-            for group in old_groups:
-                logger.debug(f"Deleting group {group.id} posted at {group.posted_date.isoformat()}")
-                await session.delete(group)
+            # Get all image URLs
+            image_urls = self.listing_images(group)
             
+            # Process the listing
+            earlier = await self.earlier_extractions(session, [group])
+            calls = []
+            property_details = await self.extract(text, earlier.get(group.id), calls)
+            if calls:
+                # Usage is recorded whether or not the result is written
+                session.add_all([
+                    build_llm_call(group.id, group.channel_name, group.combined_text, text, completion)
+                    for completion in calls
+                ])
+                await session.commit()
+            
+            if not property_details:
+                logger.warning(f"No details extracted from group {group.id}")
+                return False
+                
+            # Create new cleaned listing
+            cleaned_listing = build_cleaned_listing(group.id, group.combined_text or text, property_details, image_urls)
+            
+            if not await self.queue.complete(session, [group.id]):
+                await session.rollback()
+                if await self.queue.requeue_changed([group_id]):
+                    logger.info(f"Group {group_id} changed during extraction, result discarded")
+                else:
+                    logger.warning(f"Lease of group {group_id} was lost, result discarded")
+                return False
+            await save_listings(session, [(cleaned_listing, group.cluster_id)])
             await session.commit()
-            logger.info(f"Successfully cleaned up {len(old_groups)} old message groups")
-            return len(old_groups)
+            logger.info(f"Successfully processed group {group.id}")
+            return True
             
         except Exception as e:
-            logger.error(f"Error during cleanup: {str(e)}")
             await session.rollback()
-            return 0
+            logger.error(f"Failed to process group {group_id}: {str(e)}")
+            return False
+
+    async def run_pipeline(self, config: LLMConfig, total_limit: Optional[int] = None, sleep_interval: int = 60):
+        """Process listings concurrently with a prefetcher, a worker pool and a batched writer.
+        
+        Args:
+            config: Pipeline sizes and rate budgets
+            total_limit: Number of listings to write before stopping, None to run forever
+            sleep_interval: Seconds the prefetcher waits when nothing is unprocessed
+        """
+        pipeline = ListingPipeline(
+            self,
+            async_session,
+            self.queue,
+            workers=config.pipeline_workers,
+            prefetch_size=config.pipeline_prefetch_size,
+            write_batch_size=config.pipeline_write_batch_size,
+            budget=RateBudget(config.requests_per_minute, config.tokens_per_minute),
+            max_tokens=config.max_tokens,
+            sleep_interval=sleep_interval
+        )
+        if self.cache is not None:
+            await self.cache.evict()
+        try:
+            return await pipeline.run(total_limit)
+        finally:
+            self.log_stats()
 
     async def run_service(self, total_limit: int = 10, sleep_interval: int = 60):
         """Run the service continuously.
@@ -156,30 +277,37 @@ class ListingProcessorService:
             sleep_interval: Seconds to sleep when no items to process
         """
         processed = 0
-        cleanup_interval = 3600  # Run cleanup every hour
-        last_cleanup = datetime.now(timezone.utc) - timedelta(hours=1)  # Run first cleanup immediately
+        eviction_interval = 3600  # Evict cache entries every hour
+        last_eviction = datetime.now(timezone.utc) - timedelta(hours=1)  # Evict on the first pass
         
         while processed < total_limit:
             try:
                 async with async_session() as session:
-                    # Run periodic cleanup
+                    # Expired message groups are removed by the parser service's retention job
                     now = datetime.now(timezone.utc)
-                    if (now - last_cleanup).total_seconds() >= cleanup_interval:
-                        logger.info("Starting scheduled cleanup...")
-                        removed_count = await self.cleanup_old_data(session)
-                        last_cleanup = now
+                    if (now - last_eviction).total_seconds() >= eviction_interval:
+                        if self.cache is not None:
+                            await self.cache.evict()
+                        self.log_stats()
+                        last_eviction = now
+                    
+                    await self.learn_boilerplate(session)
                     
-                    # Process next item
-                    group = await self.get_next_unprocessed(session)
-                    if not group:
+                    # Claim next item
+                    group_ids = await self.queue.claim(1)
+                    groups = await self.load_groups(session, group_ids) if group_ids else []
+                    if not groups:
                         logger.info("No unprocessed items found, sleeping...")
                         await asyncio.sleep(sleep_interval)
                         continue
                         
-                    success = await self.process_listing(session, group)
+                    success = await self.process_listing(session, groups[0])
                     if success:
                         processed += 1
                         logger.info(f"Successfully processed {processed}/{total_limit} items")
+                    else:
+                        # Retried later with backoff, until the attempts are used up
+                        await self.queue.fail(group_ids)
                     
             except Exception as e:
                 logger.error(f"Error in service loop: {str(e)}")
@@ -194,9 +322,37 @@ async def run_service(total_limit: int = 10, sleep_interval: int = 60):
     """
     config = LLMConfig()
     processor = LLMProcessor(config)
-    service = ListingProcessorService(processor)
+    cache = None
+    if config.cache_enabled:
+        cache = ExtractionCache(
+            async_session,
+            config.model_name,
+            max_entries=config.cache_max_entries,
+            max_age_days=config.cache_max_age_days
+        )
+    queue = WorkQueue(
+        async_session,
+        worker_id=config.worker_id,
+        lease_seconds=config.lease_seconds,
+        max_attempts=config.max_attempts,
+        retry_base_seconds=config.retry_base_seconds
+    )
+    rules = RuleExtractor(config.rules_min_confidence) if config.rules_enabled else None
+    preparer = TextPreparer(
+        config.input_max_tokens,
+        config.boilerplate_min_groups,
+        config.boilerplate_min_share,
+        config.boilerplate_refresh_seconds
+    )
+    service = ListingProcessorService(processor, cache=cache, queue=queue, rules=rules, preparer=preparer)
     
-    await service.run_service(total_limit, sleep_interval)
+    try:
+        if config.pipeline_enabled:
+            await service.run_pipeline(config, total_limit, sleep_interval)
+        else:
+            await service.run_service(total_limit, sleep_interval)
+    finally:
+        await processor.aclose()
 
 if __name__ == "__main__":
     asyncio.run(run_service(total_limit=10))
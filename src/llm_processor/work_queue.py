@@ -0,0 +1,255 @@
+"""Lease-based work queue of message groups shared by processes and nodes."""
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Iterable, List, Optional, Set
+
+from sqlalchemy import select, update, and_, or_, case
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.settings import RELEVANCE_MIN_SCORE
+from src.database.models import MessageGroup, STATE_PENDING, STATE_CLAIMED, STATE_DONE, STATE_FAILED, STATE_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+
+def default_worker_id() -> str:
+    """Identify this worker across hosts and processes."""
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+class WorkQueue:
+    """Claims message groups for extraction under time-limited leases.
+
+    A claim moves pending groups, and claimed groups whose lease expired, to
+    the claimed state in a single UPDATE. On PostgreSQL its subquery locks the
+    candidate rows with FOR UPDATE SKIP LOCKED, so concurrent workers claim
+    disjoint groups without waiting on each other. SQLite does not support
+    row locks and ignores the clause; its writes are serialized by the
+    database lock, which makes the same statement safe there.
+
+    Every claim counts as an attempt. Failed groups are retried with
+    exponential backoff and marked failed after `max_attempts`.
+
+    A claimed group whose text changed, e.g. when the parser merged late
+    album members into it, is flagged with a next_attempt_at. It is not
+    completed, so its result, extracted from the old text, is not written;
+    requeue_changed puts it back in the queue without using an attempt, or
+    skips it if its new relevance score is below `min_relevance_score`.
+    """
+
+    def __init__(self, session_factory, worker_id: Optional[str] = None, lease_seconds: float = 300,
+                 max_attempts: int = 3, retry_base_seconds: float = 60,
+                 min_relevance_score: float = RELEVANCE_MIN_SCORE):
+        """Initialize the queue.
+
+        Args:
+            session_factory: Factory of async database sessions
+            worker_id: Name of this worker stored with its leases
+            lease_seconds: Time a claim stays valid without a heartbeat
+            max_attempts: Claims of a group before it is marked failed
+            retry_base_seconds: Delay before the first retry, doubled for each further one
+            min_relevance_score: Lowest relevance score of a listing, as used by the parser
+        """
+        self.session_factory = session_factory
+        self.worker_id = worker_id or default_worker_id()
+        self.lease = timedelta(seconds=lease_seconds)
+        self.max_attempts = max_attempts
+        self.retry_base_seconds = retry_base_seconds
+        self.min_relevance_score = min_relevance_score
+
+    def _owned(self, group_ids: Iterable[int]):
+        return and_(
+            MessageGroup.id.in_(list(group_ids)),
+            MessageGroup.processing_state == STATE_CLAIMED,
+            MessageGroup.lease_owner == self.worker_id
+        )
+
+    async def claim(self, limit: int) -> List[int]:
+        """Claim up to `limit` groups in ID order.
+
+        Returns:
+            List[int]: IDs of the claimed groups
+        """
+        now = datetime.now(timezone.utc)
+        claimable = or_(
+            and_(
+                MessageGroup.processing_state == STATE_PENDING,
+                or_(MessageGroup.next_attempt_at.is_(None), MessageGroup.next_attempt_at <= now)
+            ),
+            and_(
+                MessageGroup.processing_state == STATE_CLAIMED,
+                MessageGroup.lease_expires_at < now
+            )
+        )
+        candidates = (
+            select(MessageGroup.id)
+            .where(claimable)
+            .order_by(MessageGroup.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(MessageGroup)
+                .where(MessageGroup.id.in_(candidates.scalar_subquery()), claimable)
+                .values(
+                    processing_state=STATE_CLAIMED,
+                    lease_owner=self.worker_id,
+                    claimed_at=now,
+                    lease_expires_at=now + self.lease,
+                    next_attempt_at=None,
+                    attempts=MessageGroup.attempts + 1
+                )
+                .returning(MessageGroup.id)
+                .execution_options(synchronize_session=False)
+            )
+            group_ids = sorted(result.scalars())
+            await session.commit()
+        if group_ids:
+            logger.debug(f"Worker {self.worker_id} claimed {len(group_ids)} groups")
+        return group_ids
+
+    async def heartbeat(self, group_ids: Iterable[int]) -> Set[int]:
+        """Extend the leases of groups still held by this worker.
+
+        Returns:
+            Set[int]: IDs whose lease was extended; others were lost to another worker
+        """
+        group_ids = list(group_ids)
+        if not group_ids:
+            return set()
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(MessageGroup)
+                .where(self._owned(group_ids))
+                .values(lease_expires_at=datetime.now(timezone.utc) + self.lease)
+                .returning(MessageGroup.id)
+                .execution_options(synchronize_session=False)
+            )
+            extended = set(result.scalars())
+            await session.commit()
+        if len(extended) < len(group_ids):
+            logger.warning(f"Worker {self.worker_id} lost {len(group_ids) - len(extended)} leases")
+        return extended
+
+    async def complete(self, session: AsyncSession, group_ids: Iterable[int]) -> Set[int]:
+        """Mark groups held by this worker as done, in the caller's transaction.
+
+        The caller writes the results of the returned groups only and commits,
+        so a group whose lease was taken over is never written twice. Groups
+        whose text changed are not completed; the caller requeues them after
+        its transaction, with requeue_changed.
+
+        Returns:
+            Set[int]: IDs of the groups marked done
+        """
+        group_ids = list(group_ids)
+        if not group_ids:
+            return set()
+        result = await session.execute(
+            update(MessageGroup)
+            .where(self._owned(group_ids), MessageGroup.next_attempt_at.is_(None))
+            .values(processing_state=STATE_DONE, lease_owner=None, lease_expires_at=None)
+            .returning(MessageGroup.id)
+            .execution_options(synchronize_session=False)
+        )
+        return set(result.scalars())
+
+    async def requeue_changed(self, group_ids: Iterable[int]) -> Set[int]:
+        """Return groups held by this worker whose text changed to the queue, without using an attempt.
+
+        Groups whose new text is not a listing are skipped instead.
+
+        The requeue is committed in a session of its own; call it outside
+        other transactions, which lock SQLite against it.
+
+        Returns:
+            Set[int]: IDs of the requeued groups
+        """
+        group_ids = list(group_ids)
+        if not group_ids:
+            return set()
+        # Groups scored before the relevance classifier have no score and stay listings
+        is_listing = or_(
+            MessageGroup.relevance_score.is_(None),
+            MessageGroup.relevance_score >= self.min_relevance_score
+        )
+        async with self.session_factory() as session:
+            result = await session.execute(
+                update(MessageGroup)
+                .where(self._owned(group_ids), MessageGroup.next_attempt_at.isnot(None))
+                .values(
+                    processing_state=case((is_listing, STATE_PENDING), else_=STATE_SKIPPED),
+                    next_attempt_at=case((is_listing, MessageGroup.next_attempt_at), else_=None),
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    attempts=MessageGroup.attempts - 1
+                )
+                .returning(MessageGroup.id)
+                .execution_options(synchronize_session=False)
+            )
+            requeued = set(result.scalars())
+            await session.commit()
+        if requeued:
+            logger.info(f"Groups {sorted(requeued)} changed while claimed, queued again")
+        return requeued
+
+    async def fail(self, group_ids: Iterable[int]) -> int:
+        """Schedule a retry of groups held by this worker, or mark them failed.
+
+        Groups whose text changed meanwhile are requeued instead, since their
+        failure concerned the old text.
+
+        Returns:
+            int: Number of groups that used up their attempts
+        """
+        group_ids = list(group_ids)
+        if not group_ids:
+            return 0
+        await self.requeue_changed(group_ids)
+        now = datetime.now(timezone.utc)
+        given_up = 0
+        async with self.session_factory() as session:
+            result = await session.execute(
+                select(MessageGroup.id, MessageGroup.attempts).where(self._owned(group_ids))
+            )
+            for group_id, attempts in result.all():
+                values = {'lease_owner': None, 'lease_expires_at': None}
+                if attempts >= self.max_attempts:
+                    values['processing_state'] = STATE_FAILED
+                    given_up += 1
+                    logger.error(f"Failed to process group {group_id} after {attempts} attempts")
+                else:
+                    values['processing_state'] = STATE_PENDING
+                    values['next_attempt_at'] = now + timedelta(seconds=self.retry_base_seconds * 2 ** (attempts - 1))
+                    logger.warning(f"Failed to process group {group_id} (attempt {attempts}/{self.max_attempts})")
+                await session.execute(
+                    update(MessageGroup)
+                    .where(self._owned([group_id]))
+                    .values(**values)
+                    .execution_options(synchronize_session=False)
+                )
+            await session.commit()
+        return given_up
+
+    async def release(self, group_ids: Iterable[int]):
+        """Return unfinished groups to the queue without counting the attempt, e.g. on shutdown."""
+        group_ids = list(group_ids)
+        if not group_ids:
+            return
+        async with self.session_factory() as session:
+            await session.execute(
+                update(MessageGroup)
+                .where(self._owned(group_ids))
+                .values(
+                    processing_state=STATE_PENDING,
+                    lease_owner=None,
+                    lease_expires_at=None,
+                    attempts=MessageGroup.attempts - 1
+                )
+                .execution_options(synchronize_session=False)
+            )
+            await session.commit()
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""Historical backfill of channels with resumable checkpoints.
+
+Request a backfill; the service runs it within BACKFILL_CHECK_INTERVAL seconds:
+    python -m src.parser.backfill rentals --since 2024-01-01
+Or run it right away, while the service is stopped:
+    python -m src.parser.backfill rentals --min-id 1000 --run
+"""
+import argparse
+import asyncio
+import logging
+from datetime import datetime, timezone as tz, timedelta
+from sqlalchemy import select, update
+from src.config.settings import BACKFILL_PAGE_SIZE, BACKFILL_CHECK_INTERVAL, RETENTION_HOURS
+from src.database.engine import init_async_db
+from src.database.models import BackfillCheckpoint
+from src.parser.message_window import MessageWindow
+from src.parser.telegram_parser import TelegramParser
+from src.telegram.session_manager import SessionManager
+
+logger = logging.getLogger(__name__)
+
+class ChannelBackfill:
+    """Walks channels backwards page by page, down to a date or message ID bound.
+
+    Pages are fetched by a TelegramParser of its own, paced by the session
+    manager's backfill rate limiter, and their groups are saved through the
+    parser's regular persistence path, so groups already saved by polling are
+    merged rather than duplicated. After each page the checkpoint moves below
+    it, so an interrupted backfill resumes where it stopped.
+    """
+
+    def __init__(self, session_manager, page_size=BACKFILL_PAGE_SIZE, blob_store=None, session_factory=None):
+        """Initialize backfill.
+
+        Args:
+            session_manager: SessionManager shared with the live parser
+            page_size: Messages fetched per history request
+            blob_store: BlobStore for media bytes, defaults to the configured store
+            session_factory: Factory of async database sessions, defaults to the configured engine
+        """
+        self.parser = TelegramParser(
+            session_manager,
+            blob_store=blob_store,
+            session_factory=session_factory,
+            rate_limiter=session_manager.backfill_rate_limiter
+        )
+        self.page_size = max(1, page_size)
+        self.logger = logging.getLogger(__name__)
+
+    async def start(self):
+        """Connect the backfill's client; the session is shared, so there is no stop."""
+        await self.parser.start()
+
+    async def request(self, channel_name, min_date=None, min_message_id=None, restart=False, beyond_retention=False):
+        """Record a backfill of a channel down to a bound.
+
+        A channel keeps one checkpoint. Requesting an older bound for a channel
+        that was backfilled before continues below the history already walked.
+
+        Groups posted more than RETENTION_HOURS ago are deleted by the next
+        retention run, so a backfill stops at that age: older date bounds are
+        clamped to it, and message ID bounds get it as their date bound.
+
+        Args:
+            channel_name: Channel username or link
+            min_date: Oldest post date to backfill
+            min_message_id: Backfill messages with a higher ID only
+            restart: Walk the history again from the newest message
+            beyond_retention: Keep bounds older than RETENTION_HOURS, e.g. when it is raised before the backfill runs
+
+        Returns:
+            int: ID of the checkpoint
+        """
+        if min_date is None and min_message_id is None:
+            raise ValueError("A backfill needs a date or message ID bound")
+        horizon = datetime.now(tz.utc) - timedelta(hours=RETENTION_HOURS)
+        if beyond_retention:
+            if min_date is not None and min_date < horizon:
+                self.logger.warning(
+                    f"Backfill of {channel_name} reaches past RETENTION_HOURS ({RETENTION_HOURS}); "
+                    f"older groups are deleted by the next retention run unless it is raised"
+                )
+        elif min_date is None or min_date < horizon:
+            self.logger.info(f"Backfill of {channel_name} stops at RETENTION_HOURS ({RETENTION_HOURS}), at {horizon}")
+            min_date = horizon
+
+        async with self.parser.session_factory() as db:
+            result = await db.execute(select(BackfillCheckpoint).where(BackfillCheckpoint.channel_name == channel_name))
+            checkpoint = result.scalars().first()
+            if not checkpoint:
+                checkpoint = BackfillCheckpoint(channel_name=channel_name, groups_saved=0)
+                db.add(checkpoint)
+            if restart:
+                checkpoint.next_offset_id = None
+                checkpoint.groups_saved = 0
+            checkpoint.min_date = min_date
+            checkpoint.min_message_id = min_message_id
+            checkpoint.requested_date = datetime.now(tz.utc)
+            checkpoint.completed_date = None
+            await db.commit()
+            self.logger.info(f"Requested backfill of {channel_name} (checkpoint {checkpoint.id})")
+            return checkpoint.id
+
+    async def run_pending(self):
+        """Run the backfills that have not completed, oldest request first.
+
+        Returns:
+            int: Groups saved
+        """
+        async with self.parser.session_factory() as db:
+            result = await db.execute(
+                select(BackfillCheckpoint.id)
+                .where(BackfillCheckpoint.completed_date.is_(None))
+                .order_by(BackfillCheckpoint.requested_date)
+            )
+            checkpoint_ids = list(result.scalars())
+
+        saved = 0
+        for checkpoint_id in checkpoint_ids:
+            saved += await self.run(checkpoint_id)
+        return saved
+
+    async def run(self, checkpoint_id):
+        """Backfill a channel from its checkpoint until the bound or the channel's first message.
+
+        Args:
+            checkpoint_id: ID of the BackfillCheckpoint
+
+        Returns:
+            int: Groups saved in this run
+        """
+        parser = self.parser
+        saved = 0
+        async with parser.session_factory() as db:
+            try:
+                checkpoint = await db.get(BackfillCheckpoint, checkpoint_id)
+                # Skipped groups roll back and expire the checkpoint, so work from copies
+                channel_name = checkpoint.channel_name
+                min_date = checkpoint.min_date
+                if min_date is not None and min_date.tzinfo is None:
+                    min_date = min_date.replace(tzinfo=tz.utc)
+                min_message_id = checkpoint.min_message_id or 0
+                offset_id = checkpoint.next_offset_id or 0
+
+                if not parser.entity_cache.loaded:
+                    await parser.entity_cache.load(db)
+                await parser._refresh_indexes(db)
+                channel = await parser._resolve_channel(channel_name, db)
+                await self._save(db, checkpoint_id, channel_id=channel.id)
+                self.logger.info(f"Backfilling {channel_name} below message {offset_id or 'latest'}")
+
+                previous_groups = set()
+                while True:
+                    # Newest first, strictly below offset_id; 0 starts at the newest message
+                    page = await parser._request(
+                        parser.client.get_messages, channel, limit=self.page_size, offset_id=offset_id
+                    )
+                    page = [message for message in page or () if message]
+                    if not page:
+                        await self._save(db, checkpoint_id, completed_date=datetime.now(tz.utc))
+                        break
+
+                    exhausted = len(page) < self.page_size
+                    in_bounds = [
+                        message for message in page
+                        if message.id > min_message_id and (min_date is None or message.date >= min_date)
+                    ]
+                    # The page covers every ID from its oldest message up to the offset
+                    window = MessageWindow(
+                        page,
+                        low=1 if exhausted else page[-1].id,
+                        high=offset_id - 1 if offset_id else None,
+                        complete_above=not offset_id
+                    )
+                    # Albums crossing the page edge were completed with the previous page
+                    seen_groups = set(previous_groups)
+                    groups = await parser._collect_groups(channel, reversed(in_bounds), window, seen_groups)
+                    previous_groups = seen_groups - previous_groups
+                    page_saved = sum(1 for last_id in await parser._process_groups_pipelined(channel, groups, db) if last_id)
+                    saved += page_saved
+
+                    offset_id = page[-1].id
+                    now = datetime.now(tz.utc)
+                    done = exhausted or len(in_bounds) < len(page)
+                    await self._save(
+                        db,
+                        checkpoint_id,
+                        next_offset_id=offset_id,
+                        groups_saved=BackfillCheckpoint.groups_saved + page_saved,
+                        updated_date=now,
+                        completed_date=now if done else None
+                    )
+                    self.logger.info(f"Backfilled {channel_name} down to message {offset_id}, {page_saved} groups saved")
+                    if done:
+                        break
+
+                self.logger.info(f"Backfill of {channel_name} completed, {saved} groups saved in this run")
+            except Exception as e:
+                await db.rollback()
+                self.logger.error(f"Backfill {checkpoint_id} stopped, it resumes from its checkpoint: {str(e)}")
+        return saved
+
+    async def _save(self, db, checkpoint_id, **values):
+        """Update the checkpoint and commit."""
+        await db.execute(
+            update(BackfillCheckpoint)
+            .where(BackfillCheckpoint.id == checkpoint_id)
+            .values(**values)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+async def run_backfills(backfill, interval=BACKFILL_CHECK_INTERVAL):
+    """Run requested backfills, checking for new requests every `interval` seconds.
+
+    Args:
+        backfill: Started ChannelBackfill
+        interval: Seconds between two checks
+    """
+    while True:
+        try:
+            saved = await backfill.run_pending()
+            if saved:
+                logger.info(f"Backfill request stats: {backfill.parser.rate_limiter.stats()}")
+        except Exception as e:
+            logger.error(f"Error during backfill: {str(e)}", exc_info=True)
+        await asyncio.sleep(interval)
+
+def parse_date(value):
+    """Parse an ISO date for the command line, as UTC unless it has an offset."""
+    date = datetime.fromisoformat(value)
+    return date if date.tzinfo else date.replace(tzinfo=tz.utc)
+
+async def main(args):
+    await init_async_db()
+    session_manager = SessionManager()
+    backfill = ChannelBackfill(session_manager, page_size=args.page_size)
+    for channel_name in args.channels:
+        await backfill.request(
+            channel_name,
+            min_date=args.since,
+            min_message_id=args.min_id,
+            restart=args.restart,
+            beyond_retention=args.beyond_retention
+        )
+    if not args.run:
+        logger.info("Backfills requested, the service runs them")
+        return
+
+    await backfill.start()
+    try:
+        saved = await backfill.run_pending()
+        logger.info(f"Backfill finished, {saved} groups saved")
+    finally:
+        await session_manager.disconnect()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    arg_parser = argparse.ArgumentParser(description="Backfill the history of channels down to a date or message ID")
+    arg_parser.add_argument("channels", nargs="+", help="Channel usernames or links")
+    arg_parser.add_argument("--since", type=parse_date, help="Oldest post date, e.g. 2024-01-01")
+    arg_parser.add_argument("--min-id", type=int, help="Backfill messages with a higher ID only")
+    arg_parser.add_argument("--page-size", type=int, default=BACKFILL_PAGE_SIZE, help="Messages per history request")
+    arg_parser.add_argument("--restart", action="store_true", help="Walk the history again from the newest message")
+    arg_parser.add_argument(
+        "--beyond-retention", action="store_true", help="Backfill past RETENTION_HOURS instead of stopping there"
+    )
+    arg_parser.add_argument("--run", action="store_true", help="Run the backfills now instead of leaving them to the service")
+    args = arg_parser.parse_args()
+    if args.since is None and args.min_id is None:
+        arg_parser.error("one of --since or --min-id is required")
+    asyncio.run(main(args))
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
+
+
+def is_downloadable(media):
+    """Check whether the parser stores this kind of media."""
+    return isinstance(media, (MessageMediaPhoto, MessageMediaDocument))
+
+
+def expected_size(media):
+    """Best-effort size in bytes of the media before it is downloaded."""
+    if isinstance(media, MessageMediaPhoto):
+        sizes = [size.size for size in media.photo.sizes if hasattr(size, 'size')]
+        return max(sizes) if sizes else 0
+    if isinstance(media, MessageMediaDocument):
+        return getattr(media.document, 'size', 0) or 0
+    return 0
+
+
+class ByteBudget:
+    """Limits the number of bytes being downloaded at the same time."""
+
+    def __init__(self, limit):
+        """Initialize budget.
+
+        Args:
+            limit: Maximum bytes in flight
+        """
+        self.limit = max(1, limit)
+        self.in_flight = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self, size):
+        """Wait until `size` bytes fit in the budget and reserve them.
+
+        Items larger than the whole budget are admitted alone.
+
+        Returns:
+            int: Number of bytes reserved, to be passed to release()
+        """
+        size = min(max(0, size), self.limit)
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight + size <= self.limit)
+            self.in_flight += size
+        return size
+
+    async def release(self, size):
+        """Return reserved bytes to the budget."""
+        async with self._condition:
+            self.in_flight -= size
+            self._condition.notify_all()
+
+
+class MediaDownloader:
+    """Downloads media of many messages concurrently under shared limits.
+
+    A single downloader is shared by all channel workers of a parser, so the
+    concurrency cap and the bytes-in-flight budget hold for the whole cycle.
+    """
+
+    def __init__(self, fetch, max_concurrency, max_bytes_in_flight):
+        """Initialize downloader.
+
+        Args:
+            fetch: Coroutine function (message, media) -> bytes or None
+            max_concurrency: Maximum downloads running at the same time
+            max_bytes_in_flight: Maximum expected bytes being downloaded at once
+        """
+        self._fetch = fetch
+        self._slots = asyncio.Semaphore(max(1, max_concurrency))
+        self.budget = ByteBudget(max_bytes_in_flight)
+        self.logger = logging.getLogger(__name__)
+
+    async def download(self, message):
+        """Download the media of a single message.
+
+        Returns:
+            bytes: File contents, or None if the download failed
+        """
+        reserved = await self.budget.acquire(expected_size(message.media))
+        try:
+            async with self._slots:
+                return await self._fetch(message, message.media)
+        except Exception as e:
+            self.logger.error(f"Error downloading media of message {message.id}: {str(e)}")
+            return None
+        finally:
+            await self.budget.release(reserved)
+
+    async def download_messages(self, messages):
+        """Download the media of all messages at the same time.
+
+        Args:
+            messages: Messages of one group
+
+        Returns:
+            dict: Message ID -> file bytes (None for failed downloads)
+        """
+        media_messages = [msg for msg in messages if msg and is_downloadable(msg.media)]
+        if not media_messages:
+            return {}
+        results = await asyncio.gather(*(self.download(msg) for msg in media_messages))
+        return {msg.id: data for msg, data in zip(media_messages, results)}
@@ -0,0 +1,81 @@
+from collections import defaultdict
+
+# Telegram albums hold at most this many messages
+ALBUM_MAX_SIZE = 10
+
+
+class MessageWindow:
+    """Messages of one channel fetched in a single request, indexed by album.
+
+    The window covers every message ID in ``low..high``. Albums are assembled
+    from the window; only an album close enough to an open edge of the range
+    to continue beyond it needs a targeted fetch of the IDs past the edge.
+    """
+
+    def __init__(self, messages=(), low=None, high=None, complete_above=False):
+        """Initialize window.
+
+        Args:
+            messages: Fetched messages, in any order
+            low: Lowest message ID covered by the fetch (defaults to the lowest message)
+            high: Highest message ID covered by the fetch (defaults to the highest message)
+            complete_above: True if no message newer than `high` exists
+        """
+        self._messages = {}
+        self._albums = defaultdict(dict)
+        self.add(messages)
+        ids = list(self._messages)
+        self.low = low if low is not None else min(ids, default=0)
+        self.high = high if high is not None else max(ids, default=0)
+        self.complete_above = complete_above
+
+    def __len__(self):
+        return len(self._messages)
+
+    def add(self, messages):
+        """Add fetched messages to the window, ignoring empty results."""
+        for msg in messages or ():
+            if not msg:
+                continue
+            self._messages[msg.id] = msg
+            if msg.grouped_id:
+                self._albums[msg.grouped_id][msg.id] = msg
+
+    def cover(self, ids):
+        """Extend the covered range with IDs that were fetched explicitly."""
+        if ids:
+            self.low = min(self.low, min(ids))
+            self.high = max(self.high, max(ids))
+
+    def group(self, message):
+        """Return the messages of the message's album known to the window, sorted by ID."""
+        if not message.grouped_id:
+            return [message]
+        album = dict(self._albums.get(message.grouped_id, {}))
+        album.setdefault(message.id, message)
+        return [album[msg_id] for msg_id in sorted(album)]
+
+    def missing_ids(self, message):
+        """Return IDs outside the window where the message's album may continue.
+
+        Returns:
+            list: Message IDs to fetch, empty when the album lies inside the window
+        """
+        if not message.grouped_id:
+            return []
+        ids = [msg.id for msg in self.group(message)]
+        first_id, last_id = min(ids), max(ids)
+        # Album members have consecutive IDs, so another message between the
+        # album and an edge means the album cannot continue past that edge
+        missing = []
+        reach_below = max(1, last_id - (ALBUM_MAX_SIZE - 1))
+        if reach_below < self.low and not self._has_messages(self.low, first_id):
+            missing.extend(range(reach_below, self.low))
+        reach_above = first_id + (ALBUM_MAX_SIZE - 1)
+        if not self.complete_above and reach_above > self.high and not self._has_messages(last_id + 1, self.high + 1):
+            missing.extend(range(self.high + 1, reach_above + 1))
+        return missing
+
+    def _has_messages(self, start, stop):
+        """Check whether the window holds any message with ID in ``start..stop-1``."""
+        return any(msg_id in self._messages for msg_id in range(start, stop))
@@ -0,0 +1,152 @@
+"""Near-duplicate detection of listing texts with MinHash and LSH.
+
+The same apartment is reposted with small edits: a changed price, reordered
+lines, an added emoji. Texts are reduced to their sets of word 3-grams, and
+the MinHash signature of a set estimates the Jaccard similarity of two texts
+as the share of positions where their signatures agree. The LSH index cuts
+signatures into bands, so a lookup only compares texts sharing a whole band
+with the query.
+"""
+import logging
+import random
+import re
+import time
+import unicodedata
+import zlib
+from array import array
+from sqlalchemy import select
+from src.config.settings import LISTING_CLUSTER_THRESHOLD
+from src.database.models import MessageGroup
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r'\w+')
+SHINGLE_SIZE = 3
+NUM_PERM = 128
+BANDS = 16  # 8 rows per band: texts above ~0.7 similarity share a band with high probability
+_PRIME = (1 << 61) - 1
+_MASK = 0xFFFFFFFF
+# Fixed seed: signatures are stored, so every process must use the same permutations
+_rng = random.Random(20240501)
+PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+
+def shingles(text):
+    """Return the hashed word 3-grams of a text, ignoring case, punctuation and emoji."""
+    words = WORD.findall(unicodedata.normalize('NFKC', text or '').casefold())
+    if not words:
+        return set()
+    if len(words) < SHINGLE_SIZE:
+        return {zlib.crc32(' '.join(words).encode())}
+    return {
+        zlib.crc32(' '.join(words[i:i + SHINGLE_SIZE]).encode())
+        for i in range(len(words) - SHINGLE_SIZE + 1)
+    }
+
+def minhash_signature(text):
+    """Return the MinHash signature of a text as bytes, or None for a text without words."""
+    hashes = shingles(text)
+    if not hashes:
+        return None
+    return array('I', (min(((a * x + b) % _PRIME) & _MASK for x in hashes) for a, b in PERMUTATIONS)).tobytes()
+
+def similarity(signature, other):
+    """Estimate the Jaccard similarity of the 3-gram sets of two texts from their signatures."""
+    first, second = array('I', signature), array('I', other)
+    return sum(x == y for x, y in zip(first, second)) / len(first)
+
+class MinHashIndex:
+    """LSH index of text signatures, mapping message groups to listing clusters.
+
+    Each group belongs to a cluster, identified by the ID of the cluster's
+    first group. A new group joins the cluster of its most similar indexed
+    group, or starts its own.
+    """
+
+    def __init__(self, threshold=LISTING_CLUSTER_THRESHOLD, bands=BANDS):
+        """Initialize the index.
+
+        Args:
+            threshold: Lowest estimated similarity of two texts of the same listing
+            bands: Number of bands signatures are cut into; more bands find less similar texts
+        """
+        self.threshold = threshold
+        self.band_size = len(PERMUTATIONS) * 4 // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._entries = {}
+        self.loaded_at = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _bands(self, signature):
+        return [signature[i * self.band_size:(i + 1) * self.band_size] for i in range(len(self._buckets))]
+
+    def add(self, key, cluster_id, signature):
+        """Add or replace the signature of a group."""
+        self.remove(key)
+        self._entries[key] = (cluster_id, signature)
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            buckets.setdefault(band, set()).add(key)
+
+    def remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for buckets, band in zip(self._buckets, self._bands(entry[1])):
+            members = buckets.get(band)
+            members.discard(key)
+            if not members:
+                del buckets[band]
+
+    def find(self, signature, threshold=None):
+        """Return the groups whose texts are at least `threshold` similar to the signature's.
+
+        Returns:
+            list: (key, cluster_id, similarity) tuples, most similar first
+        """
+        threshold = self.threshold if threshold is None else threshold
+        candidates = set()
+        for buckets, band in zip(self._buckets, self._bands(signature)):
+            candidates.update(buckets.get(band, ()))
+        matches = []
+        for key in candidates:
+            cluster_id, other = self._entries[key]
+            score = similarity(signature, other)
+            if score >= threshold:
+                matches.append((key, cluster_id, score))
+        return sorted(matches, key=lambda match: -match[2])
+
+    def cluster_of(self, signature):
+        """Return the cluster of the most similar indexed group, or None if no group is similar enough."""
+        matches = self.find(signature)
+        return matches[0][1] if matches else None
+
+    def clear(self):
+        for buckets in self._buckets:
+            buckets.clear()
+        self._entries.clear()
+
+    def needs_refresh(self, max_age_seconds):
+        """Check whether the index was never loaded or was loaded more than `max_age_seconds` ago."""
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age_seconds
+
+    async def load(self, session):
+        """Replace the index with the signatures of all stored groups.
+
+        Reloading picks up groups saved by other parsers, e.g. a backfill, and
+        drops groups deleted by retention.
+
+        Returns:
+            int: Number of signatures loaded
+        """
+        result = await session.stream(
+            select(MessageGroup.id, MessageGroup.cluster_id, MessageGroup.minhash)
+            .where(MessageGroup.minhash.isnot(None))
+            .execution_options(yield_per=1000)
+        )
+        self.clear()
+        async for group_id, cluster_id, signature in result:
+            self.add(group_id, cluster_id or group_id, signature)
+        self.loaded_at = time.monotonic()
+        logger.info(f"Loaded {len(self)} listing text signatures")
+        return len(self)
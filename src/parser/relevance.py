@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""Relevance classifier that keeps non-listings out of the LLM work queue.
+
+The text of a message group is scored with weights over its words and a few
+listing features (price, phone, layout, ...). Until a model is trained, the
+built-in keyword weights are used. A model trained on the groups the LLM
+service already handled replaces them:
+    python -m src.parser.relevance train
+Pending groups saved before can be classified with:
+    python -m src.parser.relevance apply
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import re
+import zlib
+from collections import Counter
+from pathlib import Path
+from sqlalchemy import select, update, bindparam
+from src.config.settings import RELEVANCE_MODEL_PATH, RELEVANCE_MIN_SCORE
+from src.database.engine import async_session, init_async_db
+from src.database.models import MessageGroup, STATE_DONE, STATE_FAILED, STATE_PENDING, STATE_SKIPPED
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r'\w+')
+NO_TEXT = '__no_text__'
+NUMBER = '__number__'
+# Feature token -> pattern, matched against the case-folded text
+FEATURES = {
+    '__price__': re.compile(r'\d\s*(?:\$|usd\b|₾|gel\b|lari\b|лари|ლარ|долл)|[$₾]\s*\d'),
+    '__phone__': re.compile(r'(?:\+?995[\s\-.()]*)?5(?:[\s\-.()]*\d){8}(?!\d)'),
+    '__layout__': re.compile(r'(?<![\d+])\d\s*\+\s*1(?![\d+])|studio|студи|სტუდიო'),
+    '__area__': re.compile(r'\d\s*(?:m²|m2\b|sq\.?\s*m\b|sqm\b|кв\.?\s*м|м²|კვ\.?\s*მ)'),
+    '__for_rent__': re.compile(r'for rent|\brent\b|сда[её]тся|сдаю|аренд|ქირავდება|ქირით'),
+    '__rented__': re.compile(r'\brented\b|\bсдан[аоы]?\b|сдали|გაქირავებულია|no longer available'),
+    '__sale__': re.compile(r'for sale|продаж|прода[её]тся|продаю|იყიდება'),
+    '__promo__': re.compile(r'subscribe|подпис|реклам|promo|giveaway|розыгрыш|გამოიწერე'),
+}
+
+# Log-odds of the built-in model
+DEFAULT_BIAS = -1.0
+DEFAULT_WEIGHTS = {
+    '__price__': 2.0,
+    '__phone__': 1.0,
+    '__layout__': 1.5,
+    '__area__': 1.0,
+    '__for_rent__': 2.0,
+    '__rented__': -3.0,
+    '__sale__': -5.0,  # Sale posts carry every listing feature
+    '__promo__': -1.5,
+    NO_TEXT: -4.0,
+}
+
+def tokenize(text):
+    """Return the features of a text: its words, with numbers folded into one token, and listing features."""
+    text = (text or '').casefold()
+    if not text.strip():
+        return {NO_TEXT}
+    tokens = {NUMBER if any(ch.isdigit() for ch in word) else word for word in WORD.findall(text)}
+    tokens.update(name for name, pattern in FEATURES.items() if pattern.search(text))
+    return tokens
+
+class RelevanceClassifier:
+    """Linear classifier over the features of a group's text.
+
+    Scores are the probability that a text is a rental listing; groups scoring
+    below `min_score` are kept out of the LLM work queue.
+    """
+
+    def __init__(self, weights=None, bias=DEFAULT_BIAS, min_score=RELEVANCE_MIN_SCORE):
+        """Initialize classifier.
+
+        Args:
+            weights: Feature -> log-odds weight, defaults to the built-in keyword weights
+            bias: Log-odds of a text without known features
+            min_score: Lowest score of a listing; 0 keeps every group
+        """
+        self.weights = dict(DEFAULT_WEIGHTS if weights is None else weights)
+        self.bias = bias
+        self.min_score = min_score
+
+    def score(self, text):
+        """Return the probability that a text is a listing."""
+        log_odds = self.bias + sum(self.weights.get(token, 0.0) for token in tokenize(text))
+        return 1 / (1 + math.exp(-max(-50.0, min(50.0, log_odds))))
+
+    def is_listing(self, score):
+        return score >= self.min_score
+
+    @classmethod
+    def train(cls, samples, min_count=3, max_features=20000, min_score=RELEVANCE_MIN_SCORE):
+        """Train a Bernoulli naive Bayes model, expressed as linear weights.
+
+        Args:
+            samples: Iterable of (text, is_listing)
+            min_count: Groups a feature must occur in to be kept
+            max_features: Most frequent features kept
+            min_score: Lowest score of a listing
+
+        Returns:
+            RelevanceClassifier
+        """
+        counts = {True: Counter(), False: Counter()}
+        totals = Counter()
+        for text, is_listing in samples:
+            counts[bool(is_listing)].update(tokenize(text))
+            totals[bool(is_listing)] += 1
+        if not totals[True] or not totals[False]:
+            raise ValueError(f"Training needs listings and non-listings, got {dict(totals)}")
+
+        frequency = counts[True] + counts[False]
+        vocabulary = [token for token, count in frequency.most_common(max_features) if count >= min_count]
+        # Absent features count too: their log-odds are folded into the bias
+        bias = math.log(totals[True] / totals[False])
+        weights = {}
+        for token in vocabulary:
+            p_listing = (counts[True][token] + 1) / (totals[True] + 2)
+            p_other = (counts[False][token] + 1) / (totals[False] + 2)
+            bias += math.log((1 - p_listing) / (1 - p_other))
+            weights[token] = math.log(p_listing / p_other) - math.log((1 - p_listing) / (1 - p_other))
+        return cls(weights, bias, min_score)
+
+    def save(self, path=RELEVANCE_MODEL_PATH):
+        Path(path).write_text(json.dumps({'bias': self.bias, 'weights': self.weights}, ensure_ascii=False))
+
+    @classmethod
+    def load(cls, path=RELEVANCE_MODEL_PATH, min_score=RELEVANCE_MIN_SCORE):
+        """Load a trained model, or the built-in keyword model if there is none."""
+        path = Path(path)
+        if not path.exists():
+            return cls(min_score=min_score)
+        model = json.loads(path.read_text())
+        return cls(model['weights'], model['bias'], min_score)
+
+def evaluate(classifier, samples):
+    """Measure how well a classifier finds non-listings.
+
+    Args:
+        classifier: RelevanceClassifier
+        samples: Iterable of (text, is_listing)
+
+    Returns:
+        dict: Precision and recall of the skipped groups, and listings skipped by mistake
+    """
+    skipped = Counter()
+    groups = 0
+    for text, is_listing in samples:
+        groups += 1
+        if not classifier.is_listing(classifier.score(text)):
+            skipped[bool(is_listing)] += 1
+        elif not is_listing:
+            skipped['missed'] += 1
+    caught = skipped[False]
+    return {
+        'groups': groups,
+        'skipped': caught + skipped[True],
+        'precision': round(caught / (caught + skipped[True]), 3) if caught + skipped[True] else None,
+        'recall': round(caught / (caught + skipped['missed']), 3) if caught + skipped['missed'] else None,
+        'listings_skipped': skipped[True],
+    }
+
+def in_holdout(group_id, fraction):
+    """Assign a group to the held-out set, the same way on every run."""
+    return zlib.crc32(str(group_id).encode()) % 1000 < fraction * 1000
+
+async def labelled_groups(session):
+    """Yield (group ID, text, is_listing) of the groups the LLM service finished.
+
+    Groups a listing was extracted from are listings; groups that failed every
+    extraction attempt are not. Reposts hand their listing row to the newest
+    post, so the state, not the row, tells which groups were listings.
+    """
+    result = await session.stream(
+        select(MessageGroup.id, MessageGroup.combined_text, MessageGroup.processing_state == STATE_DONE)
+        .where(MessageGroup.processing_state.in_([STATE_DONE, STATE_FAILED]))
+        .order_by(MessageGroup.id)
+        .execution_options(yield_per=1000)
+    )
+    async for group_id, text, is_listing in result:
+        yield group_id, text, bool(is_listing)
+
+async def apply(classifier, session_factory, chunk_size=1000):
+    """Score pending groups and skip those that are not listings.
+
+    Returns:
+        int: Groups skipped
+    """
+    statement = (
+        update(MessageGroup.__table__)
+        .where(MessageGroup.id == bindparam('row_id'), MessageGroup.processing_state == STATE_PENDING)
+        .values(relevance_score=bindparam('new_score'), processing_state=bindparam('new_state'))
+    )
+    last_id = 0
+    skipped = 0
+    while True:
+        async with session_factory() as session:
+            rows = (await session.execute(
+                select(MessageGroup.id, MessageGroup.combined_text)
+                .where(MessageGroup.processing_state == STATE_PENDING, MessageGroup.id > last_id)
+                .order_by(MessageGroup.id)
+                .limit(chunk_size)
+            )).all()
+            if not rows:
+                break
+            params = []
+            for group_id, text in rows:
+                score = classifier.score(text)
+                state = STATE_PENDING if classifier.is_listing(score) else STATE_SKIPPED
+                skipped += state == STATE_SKIPPED
+                params.append({'row_id': group_id, 'new_score': score, 'new_state': state})
+            await session.execute(statement, params)
+            await session.commit()
+            last_id = rows[-1][0]
+    return skipped
+
+async def main(args):
+    await init_async_db()
+    if args.command == 'apply':
+        skipped = await apply(RelevanceClassifier.load(args.model, args.min_score), async_session)
+        logger.info(f"Skipped {skipped} pending groups that are not listings")
+        return
+
+    training, holdout = [], []
+    async with async_session() as session:
+        async for group_id, text, is_listing in labelled_groups(session):
+            (holdout if in_holdout(group_id, args.holdout) else training).append((text, is_listing))
+    classifier = RelevanceClassifier.train(training, min_score=args.min_score)
+    logger.info(f"Trained on {len(training)} groups, held-out evaluation: {evaluate(classifier, holdout)}")
+    logger.info(f"Built-in keyword model on the same groups: {evaluate(RelevanceClassifier(min_score=args.min_score), holdout)}")
+    classifier.save(args.model)
+    logger.info(f"Saved the model to {args.model}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    arg_parser = argparse.ArgumentParser(description="Train or apply the listing relevance classifier")
+    arg_parser.add_argument("command", choices=["train", "apply"], help="Train on finished groups, or skip pending non-listings")
+    arg_parser.add_argument("--model", default=RELEVANCE_MODEL_PATH, help="Path of the model file")
+    arg_parser.add_argument("--min-score", type=float, default=RELEVANCE_MIN_SCORE, help="Lowest score of a listing")
+    arg_parser.add_argument("--holdout", type=float, default=0.2, help="Share of groups held out for evaluation")
+    asyncio.run(main(arg_parser.parse_args()))
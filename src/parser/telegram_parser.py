@@ -1,34 +1,73 @@
 import asyncio
 import os
-from datetime import datetime, timezone as tz, timedelta
-from telethon import TelegramClient
+from collections import defaultdict
+from datetime import datetime, timezone as tz
+from telethon import TelegramClient, events, utils
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument, DocumentAttributeImageSize, DocumentAttributeVideo, DocumentAttributeAudio, DocumentAttributeSticker, DocumentAttributeAnimated
 from telethon.sessions import StringSession
-from src.config.settings import API_ID, API_HASH, SESSION_NAME, CHANNEL_NAMES
-from src.database.models import MessageGroup, Message, MediaItem, ChannelState
-from src.database.engine import get_db
+from sqlalchemy import select, update, delete
+from sqlalchemy.orm import selectinload
+from src.config.settings import (
+    API_ID, API_HASH, SESSION_NAME, CHANNEL_NAMES, PARSER_CHANNEL_WORKERS, PARSER_MAX_INFLIGHT_REQUESTS,
+    PARSER_MEDIA_CONCURRENCY, PARSER_MEDIA_BYTES_IN_FLIGHT, PARSER_MEDIA_PREFETCH_GROUPS, PARSER_PAGE_SIZE,
+    ENTITY_CACHE_TTL_HOURS, MEDIA_STORE_ORIGINALS, MEDIA_HASH_INDEX_REFRESH, LISTING_CLUSTER_INDEX_REFRESH
+)
+from src.database.models import MessageGroup, Message, MediaItem, ChannelState, CleanedListing, STATE_PENDING, STATE_SKIPPED, STATE_CLAIMED
+from src.database.upsert import insert_ignoring_conflicts
+from src.database.engine import async_session
 from src.telegram.session_manager import SessionManager
+from src.telegram.entity_cache import EntityCache
+from src.parser.media_downloader import MediaDownloader
+from src.parser.message_window import MessageWindow
+from src.parser.relevance import RelevanceClassifier
+from src.parser.near_duplicates import MinHashIndex, minhash_signature
+from src.storage.blob_store import get_blob_store
+from src.storage.image_index import ImageHashIndex, get_image_processor
 import logging
 
 class TelegramParser:
     """Parser for Telegram channels."""
     
-    def __init__(self, session_manager):
+    def __init__(self, session_manager, channel_workers=PARSER_CHANNEL_WORKERS, max_inflight_requests=PARSER_MAX_INFLIGHT_REQUESTS, blob_store=None, session_factory=None, rate_limiter=None):
         """Initialize parser.
         
         Args:
             session_manager: SessionManager instance for handling Telegram sessions
+            channel_workers: Number of channels parsed concurrently (1 = sequential)
+            max_inflight_requests: Maximum Telegram requests in flight across all workers
+            blob_store: BlobStore for media bytes, defaults to the configured store
+            session_factory: Factory of async database sessions, defaults to the configured engine
+            rate_limiter: AdaptiveRateLimiter pacing this parser's requests, defaults to the shared one
         """
         self.session_manager = session_manager
         self.client = None
+        self.blob_store = blob_store or get_blob_store()
+        self.session_factory = session_factory or async_session
+        self.rate_limiter = rate_limiter
         self._running = False
+        self.channel_workers = max(1, channel_workers)
+        self._request_slots = asyncio.Semaphore(max(1, max_inflight_requests))
+        self.media_downloader = MediaDownloader(
+            self._download_media,
+            max_concurrency=PARSER_MEDIA_CONCURRENCY,
+            max_bytes_in_flight=PARSER_MEDIA_BYTES_IN_FLIGHT
+        )
+        self.media_prefetch_groups = max(1, PARSER_MEDIA_PREFETCH_GROUPS)
+        self.page_size = max(1, PARSER_PAGE_SIZE)
+        self.entity_cache = EntityCache(ENTITY_CACHE_TTL_HOURS)
+        self.image_processor = get_image_processor()
+        self.image_index = ImageHashIndex()
+        self.relevance = RelevanceClassifier.load()
+        self.text_index = MinHashIndex()
+        self._channel_locks = defaultdict(asyncio.Lock)
+        self._live_channels = {}
         self.logger = logging.getLogger(__name__)
         
     async def start(self):
         """Start the parser."""
         self.logger.info("Starting parser...")
         self._running = True
-        self.client = await self.session_manager.get_client()
+        self.client = await self.session_manager.get_client(self.rate_limiter)
         self.logger.info("Parser started successfully")
         
     async def stop(self):
@@ -39,18 +78,30 @@ class TelegramParser:
             await self.session_manager.disconnect()
         self.logger.info("Parser stopped")
 
+    async def _request(self, method, *args, **kwargs):
+        """Call a client method while holding one of the global in-flight request slots."""
+        async with self._request_slots:
+            return await method(*args, **kwargs)
+
     async def _download_media(self, message, media):
         """Download media and return the file bytes."""
         try:
-            file = await message.client.download_media(media, file=bytes, thumb=-1)
+            file = await self._request(self.client.download_media, media, file=bytes, thumb=-1)
             if file:
                 return file
         except Exception as e:
             self.logger.error(f"Error downloading media: {str(e)}")
         return None
 
-    async def _process_media(self, message, db_group):
-        """Process all media from a message and save to database."""
+    async def _process_media(self, message, db_group, file_data=None, image=None):
+        """Process all media from a message and save to database.
+        
+        Args:
+            message: Telegram message
+            db_group: MessageGroup the media belongs to
+            file_data: Already downloaded media bytes; downloaded here when omitted
+            image: ProcessedImage of a photo; computed here when omitted
+        """
         if not message.media:
             return False
             
@@ -59,7 +110,8 @@ class TelegramParser:
         try:
             # Handle photos
             if isinstance(message.media, MessageMediaPhoto):
-                file_data = await self._download_media(message, message.media)
+                if file_data is None:
+                    file_data = await self._download_media(message, message.media)
                 if file_data:
                     photo = message.media.photo
                     media_item = MediaItem(
@@ -67,15 +119,16 @@ class TelegramParser:
                         media_type='photo',
                         file_id=str(photo.id),
                         file_size=max(size.size for size in photo.sizes if hasattr(size, 'size')),
-                        mime_type='image/jpeg',
-                        file_url=file_data
+                        mime_type='image/jpeg'
                     )
+                    await self._store_photo(media_item, file_data, image)
                     db_group.media_items.append(media_item)
                     has_media = True
             
             # Handle documents
             elif isinstance(message.media, MessageMediaDocument):
-                file_data = await self._download_media(message, message.media)
+                if file_data is None:
+                    file_data = await self._download_media(message, message.media)
                 if file_data:
                     document = message.media.document
                     media_type = 'document'
@@ -103,9 +156,12 @@ class TelegramParser:
                         media_type=media_type,
                         file_id=str(document.id),
                         file_size=document.size,
-                        mime_type=getattr(document, 'mime_type', None),
-                        file_url=file_data
+                        mime_type=getattr(document, 'mime_type', None)
                     )
+                    if media_type == 'photo':
+                        await self._store_photo(media_item, file_data, image)
+                    else:
+                        media_item.content_hash = await asyncio.to_thread(self.blob_store.put, file_data)
                     db_group.media_items.append(media_item)
                     has_media = True
                     
@@ -114,65 +170,262 @@ class TelegramParser:
             
         return has_media
 
-    async def _get_message_group(self, channel, message):
-        """Get all messages in the same group as the given message."""
+    async def _store_photo(self, media_item, file_data, image=None):
+        """Store a photo with its thumbnail and perceptual hash, and report earlier copies of it.
+        
+        Without MEDIA_STORE_ORIGINALS only the thumbnail is kept and stands in
+        for the photo. Photos that cannot be decoded are stored as they are.
+        
+        Args:
+            media_item: MediaItem of the photo, with its group ID set
+            file_data: Downloaded photo bytes
+            image: ProcessedImage of the photo; computed here when omitted
+        """
+        if image is None:
+            image = await self.image_processor.process(file_data)
+        if image is None:
+            media_item.content_hash = await asyncio.to_thread(self.blob_store.put, file_data)
+            return
+            
+        media_item.thumbnail_hash = await asyncio.to_thread(self.blob_store.put, image.thumbnail)
+        media_item.phash = image.phash
+        if MEDIA_STORE_ORIGINALS:
+            media_item.content_hash = await asyncio.to_thread(self.blob_store.put, file_data)
+        else:
+            media_item.content_hash = media_item.thumbnail_hash
+            
+        seen_in = [key for key, _ in self.image_index.find(image.phash) if key != media_item.group_id]
+        if seen_in:
+            self.logger.info(f"Photo {media_item.file_id} was posted before in groups {seen_in[:10]}")
+        self.image_index.add(media_item.group_id, image.phash)
+
+    async def _prepare_media(self, messages):
+        """Download the media of a group and process its images.
+        
+        Args:
+            messages: Messages of one group
+            
+        Returns:
+            tuple: Message ID -> downloaded bytes, and message ID -> ProcessedImage of the images
+        """
+        media_data = await self.media_downloader.download_messages(messages)
+        image_ids = {
+            msg.id for msg in messages
+            if msg and (isinstance(msg.media, MessageMediaPhoto) or (
+                isinstance(msg.media, MessageMediaDocument)
+                and (getattr(msg.media.document, 'mime_type', None) or '').startswith('image/')
+            ))
+        }
+        images = await self.image_processor.process_many({
+            msg_id: data for msg_id, data in media_data.items() if data and msg_id in image_ids
+        })
+        return media_data, images
+
+    async def _get_message_group(self, channel, message, window=None):
+        """Get all messages in the same group as the given message.
+        
+        Args:
+            channel: Channel entity
+            message: Any message of the group
+            window: MessageWindow the message was fetched in; when the album may
+                continue past its edges, only the missing IDs are fetched
+        """
         if not message or not message.grouped_id:
             return [message] if message else []
             
+        if window is None:
+            window = MessageWindow([message])
+            
         try:
-            # Get messages in a range around this message
-            messages = []
+            missing_ids = window.missing_ids(message)
+            if missing_ids:
+                self.logger.info(f"Album {message.grouped_id} crosses the window edge, fetching {len(missing_ids)} IDs")
+                fetched = await self._request(self.client.get_messages, channel, ids=missing_ids)
+                window.add(fetched)
+                window.cover(missing_ids)
+            return window.group(message)
             
-            # Get messages before
-            before = await self.client.get_messages(
-                channel,
-                limit=15,
-                max_id=message.id
-            )
-            if before:
-                messages.extend(before)
-                
-            # Get messages after
-            after = await self.client.get_messages(
-                channel,
-                limit=15,
-                min_id=message.id-1
-            )
-            if after:
-                messages.extend(after)
+        except Exception as e:
+            self.logger.error(f"Error getting message group: {str(e)}")
+            return [message] if message else []
+
+    async def _collect_groups(self, channel, messages, window, seen_groups=None):
+        """Assemble the groups of fetched messages, each group once.
+        
+        Args:
+            channel: Channel entity
+            messages: Fetched messages, in the order the groups should be returned
+            window: MessageWindow the messages were fetched in
+            seen_groups: Set of group IDs to skip, updated with the collected groups
+            
+        Returns:
+            list: Lists of the messages of each group
+        """
+        groups = []
+        seen_groups = set() if seen_groups is None else seen_groups
+        for message in messages:
+            if not message:
+                continue
                 
-            # Add the current message if not in the lists
-            if message.id not in {msg.id for msg in messages if msg}:
-                messages.append(message)
+            # Skip if we've already collected this group
+            group_id = message.grouped_id or message.id
+            if group_id in seen_groups:
+                self.logger.info(f"Skipping message {message.id} (group {group_id} already processed)")
+                continue
                 
-            if not messages:
-                return [message]
+            # Get all messages in the group
+            group_messages = await self._get_message_group(channel, message, window)
+            if not group_messages:
+                continue
                 
-            # Filter messages from the same group
-            group_messages = [msg for msg in messages if msg and msg.grouped_id == message.grouped_id]
-            
-            # Sort by ID and remove duplicates
-            unique_messages = []
-            seen_ids = set()
-            for msg in sorted(group_messages, key=lambda x: x.id):
-                if msg.id not in seen_ids:
-                    unique_messages.append(msg)
-                    seen_ids.add(msg.id)
-                    
-            return unique_messages if unique_messages else [message]
+            seen_groups.add(group_id)
+            groups.append(group_messages)
+        return groups
+
+    async def _unsaved_groups(self, channel, groups, db):
+        """Drop the groups whose messages are all stored, e.g. by live updates, before their media is downloaded."""
+        message_ids = [msg.id for group in groups for msg in group]
+        if not message_ids:
+            return groups
+        result = await db.execute(
+            select(Message.message_id)
+            .join(MessageGroup, Message.group_id == MessageGroup.id)
+            .where(MessageGroup.channel_id == channel.id, Message.message_id.in_(message_ids))
+        )
+        saved = set(result.scalars())
+        return [group for group in groups if any(msg.id not in saved for msg in group)]
+
+    def _message_link(self, channel, message_id):
+        """Generate the link to a message of a channel."""
+        if channel.username:
+            return f"https://t.me/{channel.username}/{message_id}"
+        return f"https://t.me/c/{channel.id}/{message_id}"
+
+    async def _refresh_indexes(self, db):
+        """Reload the photo hash and text signature indexes when they are due."""
+        if self.image_index.needs_refresh(MEDIA_HASH_INDEX_REFRESH):
+            await self.image_index.load(db)
+        if self.text_index.needs_refresh(LISTING_CLUSTER_INDEX_REFRESH):
+            await self.text_index.load(db)
+
+    def _cluster(self, signature, group_id=None):
+        """Return the listing cluster of a text signature: that of a near-duplicate, else the group's own."""
+        if signature is None:
+            return None
+        cluster_id = self.text_index.cluster_of(signature)
+        return group_id if cluster_id is None else cluster_id
+
+    def _queue_state(self, text):
+        """Score a group's text and return its relevance score and initial work queue state."""
+        score = self.relevance.score(text)
+        return score, STATE_PENDING if self.relevance.is_listing(score) else STATE_SKIPPED
+
+    async def _upsert_group(self, channel, messages, db):
+        """Insert the group of the messages unless it exists, and load it with its rows.
+        
+        Groups the relevance classifier rejects are inserted as skipped, so
+        they never enter the LLM work queue. Listings join the cluster of a
+        near-duplicate text saved before, or start their own.
+        
+        Args:
+            channel: Channel entity
+            messages: Messages of the group
+            db: Async database session
             
-        except Exception as e:
-            self.logger.error(f"Error getting message group: {str(e)}")
-            return [message] if message else []
+        Returns:
+            tuple: MessageGroup with messages and media loaded, and whether it was created
+        """
+        first = min(messages, key=lambda msg: msg.id)
+        group_key = {
+            'channel_id': channel.id,
+            'group_id': first.grouped_id or first.id
+        }
+        combined_text = '\n'.join(msg.text for msg in messages if msg.text)
+        relevance_score, state = self._queue_state(combined_text)
+        signature = minhash_signature(combined_text) if state == STATE_PENDING else None
+        result = await db.execute(insert_ignoring_conflicts(db, MessageGroup, dict(
+            group_key,
+            channel_name=channel.username or channel.title,
+            first_message_id=first.id,
+            combined_text=combined_text,
+            posted_date=first.date,
+            parsed_date=datetime.now(tz.utc),
+            message_link=self._message_link(channel, first.id),
+            processing_state=state,
+            relevance_score=relevance_score,
+            minhash=signature,
+            cluster_id=self._cluster(signature),
+            attempts=0
+        ), index_elements=list(group_key)))
+        created = result.scalar() is not None
+        
+        result = await db.execute(
+            select(MessageGroup).filter_by(**group_key).options(
+                selectinload(MessageGroup.messages),
+                selectinload(MessageGroup.media_items)
+            ).execution_options(populate_existing=True)
+        )
+        db_group = result.scalar_one()
+        if created and signature is not None and db_group.cluster_id is None:
+            db_group.cluster_id = db_group.id
+        return db_group, created
+
+    async def _merge_into_group(self, channel, db_group, db):
+        """Refresh a stored group after late album members were added to it.
+        
+        The text and first message are recomputed from all members and scored
+        again. A group that was already handed to the LLM goes back to the work
+        queue, or leaves it if the new text is not a listing. A group a worker
+        holds right now keeps its lease and is only flagged, with its new
+        relevance score; the work queue then queues or skips it instead of
+        completing it.
+        """
+        members = sorted(db_group.messages, key=lambda msg: msg.message_id)
+        db_group.first_message_id = members[0].message_id
+        db_group.message_link = self._message_link(channel, members[0].message_id)
+        db_group.combined_text = '\n'.join(msg.text for msg in members if msg.text)
+        db_group.relevance_score, state = self._queue_state(db_group.combined_text)
+        # The cluster stays; only the signature follows the new text
+        db_group.minhash = minhash_signature(db_group.combined_text) if state == STATE_PENDING else None
+        if db_group.cluster_id is None:
+            db_group.cluster_id = self._cluster(db_group.minhash, db_group.id)
+        if db_group.processing_state == STATE_CLAIMED:
+            db_group.next_attempt_at = datetime.now(tz.utc)
+            if state == STATE_SKIPPED:
+                await db.execute(delete(CleanedListing).where(CleanedListing.group_id == db_group.id))
+        elif db_group.processing_state != state:
+            await db.execute(delete(CleanedListing).where(CleanedListing.group_id == db_group.id))
+            db_group.processing_state = state
+            db_group.attempts = 0
+            db_group.lease_owner = None
+            db_group.lease_expires_at = None
+            db_group.next_attempt_at = None
 
-    async def _process_message_group(self, channel, message, db):
-        """Process a message group and save to database."""
+    async def _process_message_group(self, channel, message, db, messages=None, media_data=None, images=None):
+        """Process a message group and save it to the database.
+        
+        Groups are keyed by (channel_id, group_id): fetching a group again is a
+        no-op, and album members missing from a stored group are merged into it.
+        
+        Args:
+            channel: Channel entity
+            message: Any message of the group
+            db: Async database session
+            messages: Messages of the group, fetched when omitted
+            media_data: Message ID -> downloaded bytes, downloaded concurrently when omitted
+            images: Message ID -> ProcessedImage of photos, computed per photo when omitted
+            
+        Returns:
+            int: ID of the group's last message if it is stored, None if it was skipped
+        """
         if not message:
             return None
             
         try:
             # Get all messages in the group
-            messages = await self._get_message_group(channel, message)
+            if messages is None:
+                messages = await self._get_message_group(channel, message)
+            messages = [msg for msg in messages if msg] if messages else []
             if not messages:
                 self.logger.info(f"No messages found in group for message {message.id}")
                 return None
@@ -183,33 +436,21 @@ class TelegramParser:
             
             self.logger.info(f"Processing message group: {len(messages)} messages, IDs {first_id}-{last_id}")
             
-            # Generate message link
-            if channel.username:
-                message_link = f"https://t.me/{channel.username}/{first_id}"
-            else:
-                message_link = f"https://t.me/c/{channel.id}/{first_id}"
+            db_group, created = await self._upsert_group(channel, messages, db)
+            stored_ids = {msg.message_id for msg in db_group.messages}
+            new_messages = [msg for msg in messages if msg.id not in stored_ids]
+            if not new_messages:
+                # The conflicting insert changed nothing, so there is nothing to roll back
+                self.logger.info(f"Message group {db_group.group_id} is already saved")
+                return last_id
                 
-            # Create message group
-            db_group = MessageGroup(
-                channel_id=channel.id,
-                channel_name=channel.username or channel.title,
-                group_id=message.grouped_id or message.id,
-                first_message_id=first_id,
-                combined_text='\n'.join(msg.text for msg in messages if msg and msg.text),
-                posted_date=message.date,
-                parsed_date=datetime.now(tz.utc),
-                message_link=message_link
-            )
-            db.add(db_group)
-            db.flush()
+            # Download the media of the new members at once
+            if media_data is None:
+                media_data = await self.media_downloader.download_messages(new_messages)
             
-            # Process each message in the group
-            has_media = False
+            # Process each new message in the group
             media_count = 0
-            for msg in messages:
-                if not msg:
-                    continue
-                    
+            for msg in new_messages:
                 # Save message
                 db_message = Message(
                     message_id=msg.id,
@@ -219,202 +460,389 @@ class TelegramParser:
                 db_group.messages.append(db_message)
                 
                 # Process media if present
-                if await self._process_media(msg, db_group):
-                    has_media = True
+                file_data = media_data.get(msg.id)
+                image = (images or {}).get(msg.id)
+                if file_data and await self._process_media(msg, db_group, file_data, image):
                     media_count += 1
             
-            # Only commit if the group has media
-            if has_media:
-                db.commit()
-                self.logger.info(f"Saved message group {db_group.group_id} ({len(messages)} messages, {media_count} media items)")
-                self.logger.info(f"Message link: {message_link}")
-                return last_id
-            else:
-                db.rollback()
+            # Only keep new groups that have media
+            if created and not media_count:
+                await db.rollback()
                 self.logger.info(f"Skipped message group {db_group.group_id} (no media)")
                 return None
                 
+            if not created:
+                await self._merge_into_group(channel, db_group, db)
+                self.logger.info(f"Merged {len(new_messages)} late messages into group {db_group.group_id}")
+            await db.commit()
+            self.logger.info(f"Saved message group {db_group.group_id} ({len(new_messages)} messages, {media_count} media items)")
+            self.logger.info(f"Message link: {db_group.message_link}")
+            if db_group.processing_state == STATE_SKIPPED:
+                self.logger.info(f"Message group {db_group.group_id} is not a listing (relevance {db_group.relevance_score:.2f}), kept out of the LLM queue")
+            if db_group.minhash is not None:
+                self.text_index.add(db_group.id, db_group.cluster_id, db_group.minhash)
+                if db_group.cluster_id != db_group.id:
+                    self.logger.info(f"Message group {db_group.group_id} repeats the listing of group {db_group.cluster_id}")
+            else:
+                self.text_index.remove(db_group.id)
+            return last_id
+                
         except Exception as e:
-            db.rollback()
+            await db.rollback()
             self.logger.error(f"Error processing message group: {str(e)}")
             return None
 
-    async def _cleanup_old_data(self, db):
-        """Remove data older than 48 hours."""
-        try:
-            cutoff_time = datetime.now(tz.utc) - timedelta(hours=48)
-            self.logger.info(f"Running cleanup for data older than {cutoff_time.isoformat()}")
-            
-            # Find old message groups
-            old_groups = db.query(MessageGroup).filter(
-                MessageGroup.posted_date < cutoff_time
-            ).all()
-            
-            if not old_groups:
-                self.logger.info("No old message groups found to clean up")
-                return
-                
-            self.logger.info(f"Found {len(old_groups)} message groups to clean up")
-            
-            # Delete old groups (cascade will handle related records)
-            for group in old_groups:
-                self.logger.info(f"Deleting group {group.id} posted at {group.posted_date.isoformat()}")
-                db.delete(group)
+    async def _process_groups_pipelined(self, channel, groups, db):
+        """Save message groups in order while downloading media of the next ones.
+        
+        Media of up to `media_prefetch_groups` groups is downloaded and its
+        images processed ahead of the group currently being written, so
+        downloads overlap with each other and with the database writes.
+        
+        Args:
+            channel: Channel entity
+            groups: Lists of messages, one list per group, in chronological order
+            db: Async database session
             
-            db.commit()
-            self.logger.info(f"Successfully cleaned up {len(old_groups)} old message groups")
+        Returns:
+            list: Result of _process_message_group for each group
+        """
+        downloads = []
+        
+        def schedule(index):
+            if index < len(groups):
+                downloads.append(asyncio.create_task(self._prepare_media(groups[index])))
+        
+        for index in range(min(self.media_prefetch_groups, len(groups))):
+            schedule(index)
             
-        except Exception as e:
-            self.logger.error(f"Error during cleanup: {str(e)}")
-            db.rollback()
+        results = []
+        try:
+            for index, group_messages in enumerate(groups):
+                media_data, images = await downloads[index]
+                schedule(index + self.media_prefetch_groups)
+                first_message = min(group_messages, key=lambda m: m.id)
+                results.append(await self._process_message_group(
+                    channel, first_message, db, messages=group_messages, media_data=media_data, images=images
+                ))
+        finally:
+            for task in downloads:
+                task.cancel()
+        return results
 
     async def parse_channels(self):
         """Parse all channels for new messages."""
         if not self.client or not self.client.is_connected():
             self.logger.info("Connecting client...")
-            self.client = await self.session_manager.get_client()
+            self.client = await self.session_manager.get_client(self.rate_limiter)
             self.logger.info("Client connected successfully")
+            # Event handlers were registered on the previous client
+            if self._live_channels:
+                await self.start_live_updates()
+            
+        channel_names = [name for name in CHANNEL_NAMES if name]
+        async with self.session_factory() as db:
+            self.logger.info(f"\nStarting to parse channels: {CHANNEL_NAMES}")
+            self.logger.info(f"Parser running state: {self._running}")
+            
+            # Resolve channels from the persistent entity cache where possible
+            if not self.entity_cache.loaded:
+                await self.entity_cache.load(db)
+            await self.entity_cache.refresh(self.client, db, channel_names)
+            await self._refresh_indexes(db)
+            
+            if self.channel_workers <= 1 or len(channel_names) <= 1:
+                for channel_name in channel_names:
+                    await self._parse_channel(channel_name, db)
+                return
+            
+        # Fan channels out over a bounded pool of workers sharing the client
+        queue = asyncio.Queue()
+        for channel_name in channel_names:
+            queue.put_nowait(channel_name)
             
-        db = next(get_db())
+        worker_count = min(self.channel_workers, len(channel_names))
+        self.logger.info(f"Parsing {len(channel_names)} channels with {worker_count} workers")
+        started = datetime.now(tz.utc)
+        await asyncio.gather(*(
+            self._channel_worker(queue, worker_id) for worker_id in range(worker_count)
+        ))
+        elapsed = (datetime.now(tz.utc) - started).total_seconds()
+        self.logger.info(f"Parsed {len(channel_names)} channels in {elapsed:.1f}s")
+
+    async def _channel_worker(self, queue, worker_id):
+        """Parse channels from the queue until it is drained.
         
-        # Run cleanup before parsing
-        await self._cleanup_old_data(db)
+        Each worker owns its database session so that commits and rollbacks
+        of one channel never interfere with another.
         
-        self.logger.info(f"\nStarting to parse channels: {CHANNEL_NAMES}")
-        self.logger.info(f"Parser running state: {self._running}")
+        Args:
+            queue: asyncio.Queue of channel names
+            worker_id: Worker number, used for logging
+        """
+        async with self.session_factory() as db:
+            while True:
+                try:
+                    channel_name = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                self.logger.info(f"Worker {worker_id} picked channel {channel_name}")
+                await self._parse_channel(channel_name, db)
+
+    async def _resolve_channel(self, channel_name, db):
+        """Get the channel entity, from the entity cache or by resolving its name.
         
-        for channel_name in CHANNEL_NAMES:
-            if not channel_name:
-                continue
-                
+        Args:
+            channel_name: Channel username or link from CHANNEL_NAMES
+            db: Database session used to persist newly resolved entities
+        """
+        channel = self.entity_cache.get(channel_name)
+        if channel is not None:
+            self.logger.info(f"Using cached entity for channel {channel_name}")
+            return channel
+            
+        # Try with @ prefix if not present
+        if not channel_name.startswith('@'):
+            self.logger.info(f"Trying with @ prefix...")
             try:
-                # Get channel
-                self.logger.info(f"\n{'='*50}")
-                self.logger.info(f"Processing channel: {channel_name}")
-                try:
-                    # Try with @ prefix if not present
-                    if not channel_name.startswith('@'):
-                        self.logger.info(f"Trying with @ prefix...")
-                        try:
-                            channel = await self.client.get_entity(f"@{channel_name}")
-                        except:
-                            self.logger.info(f"Failed with @ prefix, trying original name...")
-                            channel = await self.client.get_entity(channel_name)
-                    else:
-                        channel = await self.client.get_entity(channel_name)
-                        
-                    self.logger.info(f"Successfully connected to channel: {channel.title}")
-                    self.logger.info(f"Channel ID: {channel.id}")
-                    self.logger.info(f"Channel username: {channel.username}")
-                    
-                except ValueError as e:
-                    self.logger.error(f"Error accessing channel {channel_name}: {str(e)}")
-                    self.logger.info("Try using the full channel URL (t.me/...) or channel ID")
-                    self.logger.info("Make sure you have joined the channel")
-                    continue
-                except Exception as e:
-                    self.logger.error(f"Unexpected error accessing channel {channel_name}: {str(e)}")
-                    continue
+                channel = await self._request(self.client.get_entity, f"@{channel_name}")
+            except:
+                self.logger.info(f"Failed with @ prefix, trying original name...")
+                channel = await self._request(self.client.get_entity, channel_name)
+        else:
+            channel = await self._request(self.client.get_entity, channel_name)
+            
+        if getattr(channel, 'access_hash', None) is not None:
+            await self.entity_cache.store(db, channel_name, channel)
+        return channel
+
+    async def _parse_channel(self, channel_name, db):
+        """Parse a single channel for new messages and update its ChannelState.
+        
+        Args:
+            channel_name: Channel username or link from CHANNEL_NAMES
+            db: Database session used for this channel
+        """
+        try:
+            # Get channel
+            self.logger.info(f"\n{'='*50}")
+            self.logger.info(f"Processing channel: {channel_name}")
+            try:
+                channel = await self._resolve_channel(channel_name, db)
+                self.logger.info(f"Successfully connected to channel: {channel.title}")
+                self.logger.info(f"Channel ID: {channel.id}")
+                self.logger.info(f"Channel username: {channel.username}")
                 
-                # Get or create channel state
-                channel_state = db.query(ChannelState).filter(
-                    ChannelState.channel_id == channel.id
-                ).first()
+            except ValueError as e:
+                self.logger.error(f"Error accessing channel {channel_name}: {str(e)}")
+                self.logger.info("Try using the full channel URL (t.me/...) or channel ID")
+                self.logger.info("Make sure you have joined the channel")
+                return
+            except Exception as e:
+                self.logger.error(f"Unexpected error accessing channel {channel_name}: {str(e)}")
+                return
+            
+            # Live updates for the same channel wait until this poll is done
+            async with self._channel_locks[channel.id]:
+                await self._poll_channel(channel, db)
+            
+        except Exception as e:
+            self.logger.error(f"Error parsing channel {channel_name}: {str(e)}")
+            import traceback
+            self.logger.error(f"Traceback: {traceback.format_exc()}")
+            await db.rollback()
+
+    async def _poll_channel(self, channel, db):
+        """Fetch and save the messages of a channel newer than its ChannelState.
+        
+        Args:
+            channel: Channel entity
+            db: Async database session
+        """
+        # Get or create channel state
+        result = await db.execute(select(ChannelState).where(ChannelState.channel_id == channel.id))
+        channel_state = result.scalars().first()
+        
+        if not channel_state:
+            self.logger.info("\nNew channel detected, getting latest message")
+            # Get latest message
+            latest_messages = await self._request(self.client.get_messages, channel, limit=1)
+            if not latest_messages:
+                self.logger.info("No messages found in channel")
+                return
                 
-                if not channel_state:
-                    self.logger.info("\nNew channel detected, getting latest message")
-                    # Get latest message
-                    latest_messages = await self.client.get_messages(channel, limit=1)
-                    if not latest_messages:
-                        self.logger.info("No messages found in channel")
-                        continue
-                        
-                    latest_message = latest_messages[0]
-                    if not latest_message:
-                        self.logger.info("No valid message found")
-                        continue
-                        
-                    self.logger.info(f"Found latest message ID: {latest_message.id}")
-                    
-                    # Process the message group
-                    last_id = await self._process_message_group(channel, latest_message, db)
-                    
-                    # Create channel state
-                    channel_state = ChannelState(
-                        channel_id=channel.id,
-                        channel_name=channel.username or channel.title,
-                        last_message_id=last_id if last_id is not None else latest_message.id,
-                        last_parsed_date=datetime.now(tz.utc)
-                    )
-                    db.add(channel_state)
-                    db.commit()
-                    self.logger.info(f"Created channel state with last_message_id = {channel_state.last_message_id}")
-                    
-                else:
-                    self.logger.info(f"\nExisting channel, last_message_id = {channel_state.last_message_id}")
-                    # Get latest message to determine max_id
-                    latest_messages = await self.client.get_messages(channel, limit=1)
-                    if not latest_messages or not latest_messages[0]:
-                        self.logger.info("No messages found in channel")
-                        continue
-                        
-                    max_message_id = latest_messages[0].id
-                    self.logger.info(f"Latest message ID: {max_message_id}")
-                    
-                    # Get new messages with both min_id and max_id
-                    new_messages = await self.client.get_messages(
-                        channel,
-                        min_id=channel_state.last_message_id,
-                        max_id=max_message_id
-                    )
-                    
-                    if not new_messages:
-                        self.logger.info("No new messages found")
-                        continue
-                        
-                    self.logger.info(f"Found {len(new_messages)} new messages")
-                    
-                    # Track processed groups to avoid duplicates
-                    processed_groups = set()
-                    highest_id = channel_state.last_message_id
-                    
-                    # Process messages in chronological order
-                    for message in reversed(new_messages):
-                        if not message:
-                            continue
-                            
-                        # Skip if we've already processed this group
-                        group_id = message.grouped_id or message.id
-                        if group_id in processed_groups:
-                            self.logger.info(f"Skipping message {message.id} (group {group_id} already processed)")
-                            continue
-                            
-                        # Get all messages in the group
-                        group_messages = await self._get_message_group(channel, message)
-                        if not group_messages:
-                            continue
-                            
-                        # Find the first message in the group
-                        first_message = min(group_messages, key=lambda m: m.id)
-                        
-                        # Process the group using the first message
-                        last_id = await self._process_message_group(channel, first_message, db)
-                        if last_id:
-                            highest_id = max(highest_id, last_id)
-                            processed_groups.add(group_id)
-                    
-                    # Update channel state
-                    if highest_id > channel_state.last_message_id:
-                        channel_state.last_message_id = highest_id
-                        channel_state.last_parsed_date = datetime.now(tz.utc)
-                        db.commit()
-                        self.logger.info(f"Updated channel state: last_message_id = {highest_id}")
+            latest_message = latest_messages[0]
+            if not latest_message:
+                self.logger.info("No valid message found")
+                return
+                
+            self.logger.info(f"Found latest message ID: {latest_message.id}")
+            
+            # Process the message group; nothing newer than the latest message exists
+            window = MessageWindow([latest_message], complete_above=True)
+            group_messages = await self._get_message_group(channel, latest_message, window)
+            last_id = await self._process_message_group(channel, latest_message, db, messages=group_messages)
+            
+            # Create channel state
+            channel_state = ChannelState(
+                channel_id=channel.id,
+                channel_name=channel.username or channel.title,
+                last_message_id=last_id if last_id is not None else latest_message.id,
+                last_parsed_date=datetime.now(tz.utc)
+            )
+            db.add(channel_state)
+            await db.commit()
+            self.logger.info(f"Created channel state with last_message_id = {channel_state.last_message_id}")
+            
+        else:
+            # Skipped groups roll back and expire the state, which must not be reloaded lazily
+            last_message_id = channel_state.last_message_id
+            self.logger.info(f"\nExisting channel, last_message_id = {last_message_id}")
+            # Get latest message to determine max_id
+            latest_messages = await self._request(self.client.get_messages, channel, limit=1)
+            if not latest_messages or not latest_messages[0]:
+                self.logger.info("No messages found in channel")
+                return
+                
+            max_message_id = latest_messages[0].id
+            self.logger.info(f"Latest message ID: {max_message_id}")
+            
+            # Catch up page by page, committing the state after each page
+            highest_id = last_message_id
+            previous_groups = set()
+            async for page, window in self._iter_message_pages(channel, last_message_id, max_message_id):
+                self.logger.info(f"Found {len(page)} new messages up to {page[-1].id}")
                 
+                # Albums crossing the page edge were completed with the previous page
+                seen_groups = set(previous_groups)
+                groups = await self._collect_groups(channel, page, window, seen_groups)
+                previous_groups = seen_groups - previous_groups
+                groups = await self._unsaved_groups(channel, groups, db)
+                
+                # Download media ahead of the writes, which happen in order
+                highest_id = max(highest_id, page[-1].id)
+                for last_id in await self._process_groups_pipelined(channel, groups, db):
+                    if last_id:
+                        highest_id = max(highest_id, last_id)
+                
+                # Skipped groups expire the state object, so update it with a statement
+                await db.execute(
+                    update(ChannelState)
+                    .where(ChannelState.channel_id == channel.id)
+                    .values(last_message_id=highest_id, last_parsed_date=datetime.now(tz.utc))
+                    .execution_options(synchronize_session=False)
+                )
+                await db.commit()
+                self.logger.info(f"Updated channel state: last_message_id = {highest_id}")
+                
+            if highest_id == last_message_id:
+                self.logger.info("No new messages found")
+
+    async def _iter_message_pages(self, channel, min_id, max_id):
+        """Yield the messages between two IDs, oldest first, one page per request.
+        
+        Only one page is held at a time, so catching up after a long downtime
+        uses as much memory as a regular cycle.
+        
+        Args:
+            channel: Channel entity
+            min_id: Yield messages newer than this ID
+            max_id: Yield messages older than this ID
+            
+        Yields:
+            tuple: Messages of the page in ascending ID order, and the MessageWindow covering them
+        """
+        while True:
+            # With reverse=True, min_id is the exclusive offset of an ascending page
+            fetched = await self._request(
+                self.client.get_messages,
+                channel,
+                limit=self.page_size,
+                min_id=min_id,
+                max_id=max_id,
+                reverse=True
+            )
+            page = [message for message in fetched or () if message]
+            if not page:
+                return
+            complete = len(fetched) < self.page_size
+            # min_id/max_id are exclusive; a full page covers IDs up to its newest message only
+            window = MessageWindow(page, low=min_id + 1, high=max_id - 1 if complete else page[-1].id)
+            yield page, window
+            if complete:
+                return
+            min_id = page[-1].id
+
+    async def start_live_updates(self):
+        """Subscribe to new messages and albums of the configured channels.
+        
+        Groups pushed by Telegram are saved right away by _process_message_group.
+        parse_channels is still needed at a low frequency to repair gaps left
+        by disconnects. Only polling advances ChannelState, which stays the
+        highest ID up to which every message was fetched; the groups saved
+        live in between are recognized by the poll and not fetched twice.
+        """
+        if not self.client or not self.client.is_connected():
+            self.client = await self.session_manager.get_client(self.rate_limiter)
+            
+        async with self.session_factory() as db:
+            if not self.entity_cache.loaded:
+                await self.entity_cache.load(db)
+            await self._refresh_indexes(db)
+            channels = {}
+            for channel_name in [name for name in CHANNEL_NAMES if name]:
+                try:
+                    channel = await self._resolve_channel(channel_name, db)
+                except Exception as e:
+                    self.logger.error(f"Cannot subscribe to channel {channel_name}: {str(e)}")
+                    continue
+                channels[channel.id] = channel
+            
+        if not channels:
+            self.logger.warning("No channels to subscribe to, live updates disabled")
+            return
+            
+        self._live_channels = channels
+        chats = list(channels.values())
+        self.client.add_event_handler(self._on_new_message, events.NewMessage(chats=chats))
+        self.client.add_event_handler(self._on_album, events.Album(chats=chats))
+        self.logger.info(f"Subscribed to live updates of {len(chats)} channels")
+
+    async def _on_new_message(self, event):
+        """Handle a single new message; album members arrive through _on_album."""
+        if event.message.grouped_id:
+            return
+        await self._ingest_live_group(event.chat_id, [event.message])
+
+    async def _on_album(self, event):
+        """Handle all messages of a new album at once."""
+        await self._ingest_live_group(event.chat_id, list(event.messages))
+
+    async def _ingest_live_group(self, chat_id, messages):
+        """Save a group pushed by Telegram.
+        
+        The channel state is left to polling: messages missed while
+        disconnected lie below a live message, and gap repair must still
+        fetch them.
+        
+        Args:
+            chat_id: Marked chat ID of the event
+            messages: Messages of the group
+        """
+        channel = self._live_channels.get(utils.resolve_id(chat_id)[0])
+        messages = sorted((msg for msg in messages if msg), key=lambda msg: msg.id)
+        if channel is None or not messages or not self._running:
+            return
+            
+        async with self.session_factory() as db:
+            try:
+                async with self._channel_locks[channel.id]:
+                    # Groups saved before, by polling or an earlier event, are a no-op
+                    if await self._process_message_group(channel, messages[0], db, messages=messages):
+                        self.logger.info(f"Live update saved, messages {messages[0].id}-{messages[-1].id}")
             except Exception as e:
-                self.logger.error(f"Error parsing channel {channel_name}: {str(e)}")
-                import traceback
-                self.logger.error(f"Traceback: {traceback.format_exc()}")
-                continue
+                await db.rollback()
+                self.logger.error(f"Error handling live update: {str(e)}")
 
 async def main():
     session_manager = SessionManager()
@@ -5,8 +5,11 @@ import sys
 from pathlib import Path
 from datetime import datetime, UTC
 
-from src.database.engine import init_db
+from src.database.engine import init_async_db, async_session
+from src.database.retention import RetentionEngine, run_retention
+from src.storage.blob_store import get_blob_store
 from src.parser.telegram_parser import TelegramParser
+from src.parser.backfill import ChannelBackfill, run_backfills
 from src.telegram.session_manager import SessionManager
 from src.config import settings
 
@@ -27,14 +30,20 @@ def setup_environment():
     Path('sessions').mkdir(exist_ok=True)
     Path('logs').mkdir(exist_ok=True)
 
-async def run_parser(parser):
-    """Run the parser continuously."""
+async def run_parser(parser, interval=300):
+    """Run the parser continuously.
+    
+    Args:
+        parser: Started TelegramParser
+        interval: Seconds between two parsing runs
+    """
     while True:
         try:
             logger.info("Starting to parse channels...")
             await parser.parse_channels()
-            logger.info("Finished parsing channels, waiting 5 minutes before next run...")
-            await asyncio.sleep(300)  # 5 minutes interval
+            logger.info(f"Telegram request stats: {parser.session_manager.rate_limiter.stats()}")
+            logger.info(f"Finished parsing channels, waiting {interval} seconds before next run...")
+            await asyncio.sleep(interval)
         except Exception as e:
             logger.error(f"Error during channel parsing: {str(e)}", exc_info=True)
             logger.info("Waiting 60 seconds before retry...")
@@ -50,22 +59,44 @@ async def main():
         return
 
     # Initialize database
-    init_db()
+    await init_async_db()
     logger.info("Database initialized")
 
     session_manager = SessionManager()
     parser = TelegramParser(session_manager)
+    backfill = ChannelBackfill(session_manager)
+    backfill_task = None
+    
+    # Expired data of both the parser and the LLM service is removed here only
+    retention = RetentionEngine(
+        async_session,
+        settings.RETENTION_HOURS,
+        chunk_size=settings.RETENTION_CHUNK_SIZE,
+        blob_store=get_blob_store()
+    )
+    retention_task = asyncio.create_task(run_retention(retention, settings.RETENTION_INTERVAL))
     
     try:
         await parser.start()
         logger.info("Parser started")
-        await run_parser(parser)
+        # Requested backfills run at their own rate next to live ingestion
+        await backfill.start()
+        backfill_task = asyncio.create_task(run_backfills(backfill, settings.BACKFILL_CHECK_INTERVAL))
+        if settings.PARSER_MODE == 'events':
+            # Posts arrive as pushed updates; polling only repairs gaps
+            await parser.start_live_updates()
+            await run_parser(parser, settings.PARSER_GAP_REPAIR_INTERVAL)
+        else:
+            await run_parser(parser, settings.PARSER_POLL_INTERVAL)
     except KeyboardInterrupt:
         logger.info("Received shutdown signal")
     except Exception as e:
         logger.error(f"Service error: {str(e)}")
         raise
     finally:
+        retention_task.cancel()
+        if backfill_task:
+            backfill_task.cancel()
         await parser.stop()
         logger.info("Parser stopped")
 
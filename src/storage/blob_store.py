@@ -0,0 +1,250 @@
+"""Content-addressed storage for downloaded media."""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterable, Optional, Set, Tuple
+
+from sqlalchemy import select, func, union
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.config.settings import MEDIA_STORE_BACKEND, MEDIA_STORE_PATH, MEDIA_BASE_URL
+from src.database.models import MediaItem
+
+logger = logging.getLogger(__name__)
+
+
+def content_hash(data: bytes) -> str:
+    """Return the SHA-256 hex digest used as the key of a blob."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobStore:
+    """Interface of a content-addressed blob store.
+
+    Blobs are keyed by the SHA-256 of their contents, so storing the same
+    bytes twice keeps a single copy.
+    """
+
+    def put(self, data: bytes) -> str:
+        """Store bytes and return their content hash."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the bytes stored under a hash, or None if missing."""
+        raise NotImplementedError
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        """Open a blob for streaming, seekable reads, or return None if missing."""
+        data = self.get(key)
+        return io.BytesIO(data) if data is not None else None
+
+    def exists(self, key: str) -> bool:
+        """Check whether a blob is stored."""
+        raise NotImplementedError
+
+    def delete(self, key: str, min_age_seconds: float = 0) -> bool:
+        """Delete a blob unless it was written or re-used recently.
+
+        Returns:
+            bool: True if the blob was removed
+        """
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    """Blob store on the local filesystem, sharded by hash prefix.
+
+    A blob with hash ``abcdef...`` lives at ``<root>/ab/cd/abcdef...``.
+    """
+
+    def __init__(self, root: str, shard_depth: int = 2):
+        """Initialize the store.
+
+        Args:
+            root: Directory holding the blobs
+            shard_depth: Number of two-character directory levels
+        """
+        self.root = Path(root)
+        self.shard_depth = shard_depth
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, key: str) -> Path:
+        """Return the filesystem path of a blob."""
+        shards = [key[i * 2:i * 2 + 2] for i in range(self.shard_depth)]
+        return self.root.joinpath(*shards, key)
+
+    def put(self, data: bytes) -> str:
+        key = content_hash(data)
+        path = self.path_for(key)
+        if path.exists():
+            # Refresh the mtime so a concurrent garbage collection keeps it
+            os.utime(path)
+            return key
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as tmp:
+                tmp.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return key
+
+    def get(self, key: str) -> Optional[bytes]:
+        try:
+            return self.path_for(key).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def open(self, key: str) -> Optional[BinaryIO]:
+        try:
+            return self.path_for(key).open('rb')
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return self.path_for(key).exists()
+
+    def delete(self, key: str, min_age_seconds: float = 0) -> bool:
+        path = self.path_for(key)
+        try:
+            if min_age_seconds and time.time() - path.stat().st_mtime < min_age_seconds:
+                return False
+            path.unlink()
+            return True
+        except FileNotFoundError:
+            return False
+
+
+_blob_store: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    """Return the blob store configured by MEDIA_STORE_BACKEND."""
+    global _blob_store
+    if _blob_store is None:
+        if MEDIA_STORE_BACKEND == 'local':
+            _blob_store = LocalBlobStore(MEDIA_STORE_PATH)
+        else:
+            raise ValueError(f"Unknown media store backend: {MEDIA_STORE_BACKEND}")
+    return _blob_store
+
+
+# Columns of a media item without its legacy bytes
+MEDIA_METADATA = (
+    MediaItem.id, MediaItem.group_id, MediaItem.media_type, MediaItem.file_id,
+    MediaItem.mime_type, MediaItem.file_size, MediaItem.content_hash,
+    MediaItem.thumbnail_hash, MediaItem.phash,
+)
+
+
+def media_metadata_query(group_ids: Iterable[int], media_type: Optional[str] = None):
+    """Build a query listing the media of groups as MEDIA_METADATA rows, by group and ID."""
+    query = select(*MEDIA_METADATA).where(MediaItem.group_id.in_(list(group_ids)))
+    if media_type is not None:
+        query = query.where(MediaItem.media_type == media_type)
+    return query.order_by(MediaItem.group_id, MediaItem.id)
+
+
+def media_counts_query(group_ids: Iterable[int]):
+    """Build a query counting the media of groups as (group_id, media_type, count) rows."""
+    return (
+        select(MediaItem.group_id, MediaItem.media_type, func.count(MediaItem.id))
+        .where(MediaItem.group_id.in_(list(group_ids)))
+        .group_by(MediaItem.group_id, MediaItem.media_type)
+    )
+
+
+async def stream_legacy_blobs(session: AsyncSession, item_ids: Iterable[int]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Yield (id, bytes) of media items still holding bytes in the legacy column, one row at a time."""
+    result = await session.stream(
+        select(MediaItem.id, MediaItem.file_url)
+        .where(MediaItem.id.in_(list(item_ids)), MediaItem.file_url.isnot(None))
+        .execution_options(yield_per=1)
+    )
+    async for item_id, data in result:
+        yield item_id, data
+
+
+async def load_legacy_blobs(session: AsyncSession, items: Iterable[MediaItem]) -> int:
+    """Load the deferred legacy bytes of items that were not moved to the media store.
+
+    Items with a content hash are skipped, so after the media store migration
+    this costs nothing.
+
+    Returns:
+        int: Number of items whose bytes were loaded
+    """
+    legacy = {item.id: item for item in items if not item.content_hash}
+    if not legacy:
+        return 0
+    for item in legacy.values():
+        set_committed_value(item, 'file_url', None)
+    loaded = 0
+    async for item_id, data in stream_legacy_blobs(session, legacy):
+        set_committed_value(legacy[item_id], 'file_url', data)
+        loaded += 1
+    return loaded
+
+
+def media_url(key: str, base_url: Optional[str] = None) -> str:
+    """Return the URL a blob is served under by the media server.
+
+    Args:
+        key: Content hash of the blob
+        base_url: Prefix of the URL, defaults to MEDIA_BASE_URL; empty gives a relative URL
+    """
+    base_url = MEDIA_BASE_URL if base_url is None else base_url
+    return f"{base_url.rstrip('/')}/media/{key}"
+
+
+def load_media_bytes(item: MediaItem, store: Optional[BlobStore] = None) -> Optional[bytes]:
+    """Return the bytes of a media item from the store or the legacy column.
+
+    The legacy column of a loaded item must have been loaded explicitly, see
+    load_legacy_blobs.
+    """
+    if item.content_hash:
+        return (store or get_blob_store()).get(item.content_hash)
+    return item.file_url
+
+
+def referenced_hashes_query(keys: Iterable[str]):
+    """Build a query for the hashes among `keys` still used by a media item, as file or thumbnail."""
+    keys = list(keys)
+    return union(
+        select(MediaItem.content_hash).where(MediaItem.content_hash.in_(keys)),
+        select(MediaItem.thumbnail_hash).where(MediaItem.thumbnail_hash.in_(keys))
+    )
+
+
+def collect_garbage(store: BlobStore, candidates: Set[str], referenced: Set[str],
+                    min_age_seconds: float = 3600) -> int:
+    """Delete candidate blobs no longer referenced by any media item.
+
+    Blobs touched within `min_age_seconds` are kept, because a parser may
+    have just re-used them for a new media item that is not committed yet.
+
+    Args:
+        store: Blob store holding the candidates
+        candidates: Hashes of media items that were deleted
+        referenced: Hashes among the candidates that are still in use
+
+    Returns:
+        int: Number of blobs removed
+    """
+    removed = 0
+    for key in candidates - referenced:
+        if store.delete(key, min_age_seconds=min_age_seconds):
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} unreferenced media blobs")
+    return removed
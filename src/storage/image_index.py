@@ -0,0 +1,159 @@
+"""Photo processing off the event loop, and an index of perceptual hashes."""
+import asyncio
+import logging
+import multiprocessing
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config.settings import MEDIA_THUMBNAIL_SIZE, MEDIA_IMAGE_WORKERS, MEDIA_HASH_MAX_DISTANCE
+from src.database.models import MediaItem
+from src.storage.imaging import HASH_BITS, HASH_MASK, ProcessedImage, hamming_distance, process_image
+
+logger = logging.getLogger(__name__)
+
+
+class ImageProcessor:
+    """Creates thumbnails and perceptual hashes in a pool of worker processes.
+
+    Decoding and resizing photos is CPU bound, so it runs outside the event
+    loop's process. The pool is started on first use; with no workers the
+    images are processed in a thread instead.
+    """
+
+    def __init__(self, workers: int = MEDIA_IMAGE_WORKERS, max_size: int = MEDIA_THUMBNAIL_SIZE):
+        """Initialize the processor.
+
+        Args:
+            workers: Worker processes, 0 to process in a thread
+            max_size: Longest side of thumbnails in pixels
+        """
+        self.workers = workers
+        self.max_size = max_size
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    async def process(self, data: bytes) -> Optional[ProcessedImage]:
+        """Return the thumbnail and hash of a photo, or None if it cannot be decoded."""
+        if self.workers <= 0:
+            return await asyncio.to_thread(process_image, data, self.max_size)
+        if self._pool is None:
+            # Spawned workers do not inherit the parent's threads and connections
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool, process_image, data, self.max_size)
+        except BrokenProcessPool:
+            logger.error("Image worker process died, restarting the pool")
+            self._pool = None
+            return None
+
+    async def process_many(self, data: Dict[Hashable, bytes]) -> Dict[Hashable, ProcessedImage]:
+        """Process several photos at the same time, keyed like `data`; undecodable ones are left out."""
+        keys = list(data)
+        results = await asyncio.gather(*(self.process(data[key]) for key in keys))
+        return {key: image for key, image in zip(keys, results) if image is not None}
+
+    def shutdown(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+_image_processor: Optional[ImageProcessor] = None
+
+
+def get_image_processor() -> ImageProcessor:
+    """Return the image processor shared by all parsers of the process."""
+    global _image_processor
+    if _image_processor is None:
+        _image_processor = ImageProcessor()
+    return _image_processor
+
+
+class ImageHashIndex:
+    """Finds photos whose perceptual hash is within a Hamming distance of a query.
+
+    The 64-bit hash is cut into `max_distance + 1` bands. Two hashes differing
+    in at most `max_distance` bits agree exactly on at least one band, so a
+    lookup only compares the entries sharing a band value with the query
+    instead of every hash seen.
+    """
+
+    def __init__(self, max_distance: int = MEDIA_HASH_MAX_DISTANCE):
+        """Initialize the index.
+
+        Args:
+            max_distance: Largest Hamming distance a lookup can match
+        """
+        self.max_distance = max(0, min(max_distance, HASH_BITS - 1))
+        bands = self.max_distance + 1
+        self._bands = []
+        shift = 0
+        for band in range(bands):
+            width = HASH_BITS // bands + (band < HASH_BITS % bands)
+            self._bands.append((shift, (1 << width) - 1))
+            shift += width
+        self._buckets = [defaultdict(list) for _ in self._bands]
+        self._size = 0
+        self.loaded_at: Optional[float] = None
+
+    def __len__(self):
+        return self._size
+
+    def _band_values(self, phash: int):
+        value = phash & HASH_MASK
+        return [(value >> shift) & mask for shift, mask in self._bands]
+
+    def add(self, key: Hashable, phash: int):
+        """Add the hash of a photo of `key`, e.g. a message group ID."""
+        for buckets, band in zip(self._buckets, self._band_values(phash)):
+            buckets[band].append((key, phash))
+        self._size += 1
+
+    def find(self, phash: int, max_distance: Optional[int] = None) -> List[Tuple[Hashable, int]]:
+        """Return the keys with a photo within `max_distance` bits of the hash.
+
+        Returns:
+            List[Tuple[Hashable, int]]: (key, distance) pairs, closest first
+        """
+        limit = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        matches = {}
+        for buckets, band in zip(self._buckets, self._band_values(phash)):
+            for key, candidate in buckets.get(band, ()):
+                distance = hamming_distance(phash, candidate)
+                if distance <= limit and distance < matches.get(key, limit + 1):
+                    matches[key] = distance
+        return sorted(matches.items(), key=lambda match: match[1])
+
+    def clear(self):
+        """Remove all hashes."""
+        for buckets in self._buckets:
+            buckets.clear()
+        self._size = 0
+
+    def needs_refresh(self, max_age_seconds: float) -> bool:
+        """Check whether the index was never loaded or was loaded more than `max_age_seconds` ago."""
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > max_age_seconds
+
+    async def load(self, session: AsyncSession) -> int:
+        """Replace the index with the hashes of all stored photos, keyed by group ID.
+
+        Reloading drops the photos of groups deleted by retention since.
+
+        Returns:
+            int: Number of hashes loaded
+        """
+        result = await session.stream(
+            select(MediaItem.group_id, MediaItem.phash).where(MediaItem.phash.isnot(None))
+        )
+        self.clear()
+        async for group_id, phash in result:
+            self.add(group_id, phash)
+        self.loaded_at = time.monotonic()
+        logger.info(f"Loaded {self._size} photo hashes")
+        return self._size
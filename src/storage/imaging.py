@@ -0,0 +1,74 @@
+"""Thumbnails and perceptual hashes of photos.
+
+Everything here is pure and picklable, so it can run in worker processes
+without importing the settings or the database.
+"""
+import io
+from dataclasses import dataclass
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+# dHash compares neighbouring pixels of a (HASH_SIZE + 1) x HASH_SIZE grayscale image
+HASH_SIZE = 8
+HASH_BITS = HASH_SIZE * HASH_SIZE
+HASH_MASK = (1 << HASH_BITS) - 1
+THUMBNAIL_QUALITY = 80
+
+
+@dataclass(frozen=True)
+class ProcessedImage:
+    """Thumbnail and perceptual hash of a photo."""
+    thumbnail: bytes  # JPEG
+    phash: int  # Signed 64-bit, as stored in a BigInteger column
+    width: int
+    height: int
+
+
+def to_signed(value: int) -> int:
+    """Map an unsigned 64-bit hash to the signed range of a BigInteger column."""
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def hamming_distance(a: int, b: int) -> int:
+    """Number of bits in which two hashes differ; works for signed and unsigned hashes."""
+    return ((a ^ b) & HASH_MASK).bit_count()
+
+
+def difference_hash(image: Image.Image) -> int:
+    """Return the dHash of an image: one bit per pair of horizontally adjacent pixels.
+
+    The hash survives rescaling, recompression and small edits, so reposts of
+    the same photo hash within a few bits of each other.
+    """
+    gray = image.convert('L').resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.LANCZOS)
+    pixels = gray.tobytes()
+    value = 0
+    for row in range(HASH_SIZE):
+        offset = row * (HASH_SIZE + 1)
+        for col in range(HASH_SIZE):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return to_signed(value)
+
+
+def process_image(data: bytes, max_size: int) -> Optional[ProcessedImage]:
+    """Decode a photo and return its thumbnail and perceptual hash.
+
+    Args:
+        data: Encoded image
+        max_size: Longest side of the thumbnail in pixels
+
+    Returns:
+        ProcessedImage, or None if the data is not a decodable image
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as original:
+            image = ImageOps.exif_transpose(original).convert('RGB')
+        width, height = image.size
+        phash = difference_hash(image)
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        thumbnail = io.BytesIO()
+        image.save(thumbnail, format='JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        return None
+    return ProcessedImage(thumbnail.getvalue(), phash, width, height)
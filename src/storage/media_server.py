@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""HTTP server streaming blobs of the media store, with Range support.
+
+Serves GET and HEAD requests for /media/<sha256>, the URLs stored in
+cleaned_listings.image_urls. Run with:
+    python -m src.storage.media_server --host 0.0.0.0 --port 8080
+"""
+import argparse
+import io
+import logging
+import re
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+from src.config.settings import MEDIA_SERVER_HOST, MEDIA_SERVER_PORT
+from src.storage.blob_store import BlobStore, get_blob_store
+
+logger = logging.getLogger(__name__)
+
+MEDIA_PATH = re.compile(r'^/media/([0-9a-f]{64})$')
+SINGLE_RANGE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+# Blobs never change under their hash
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Leading bytes -> content type; the store keeps bytes only
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'GIF8', 'image/gif'),
+    (b'%PDF', 'application/pdf'),
+)
+
+
+def sniff_content_type(head: bytes) -> str:
+    """Guess the content type of a blob from its first bytes."""
+    for signature, content_type in SIGNATURES:
+        if head.startswith(signature):
+            return content_type
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head[4:8] == b'ftyp':
+        return 'video/mp4'
+    return 'application/octet-stream'
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Return the inclusive byte range requested by a Range header.
+
+    Headers that are missing, not in bytes or ask for several ranges are
+    ignored, and the whole blob is served.
+
+    Returns:
+        Tuple[int, int]: First and last byte, or None to serve the whole blob
+
+    Raises:
+        ValueError: If the range lies outside the blob
+    """
+    match = SINGLE_RANGE.match(header.strip()) if header else None
+    if not match or match.groups() == ('', ''):
+        return None
+    start, end = match.groups()
+    if not start:
+        # Suffix range: the last `end` bytes
+        length = int(end)
+        if not length or not size:
+            raise ValueError(f"Unsatisfiable range {header}")
+        return max(0, size - length), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or end < start:
+        raise ValueError(f"Unsatisfiable range {header}")
+    return start, end
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """Serves one request for a blob of the server's media store."""
+
+    server_version = 'MediaServer/1.0'
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def _serve(self, send_body: bool):
+        match = MEDIA_PATH.match(self.path.split('?', 1)[0])
+        blob = self.server.store.open(match.group(1)) if match else None
+        if blob is None:
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+
+        with blob:
+            size = blob.seek(0, io.SEEK_END)
+            blob.seek(0)
+            content_type = sniff_content_type(blob.read(16))
+            etag = f'"{match.group(1)}"'
+            if self.headers.get('If-None-Match') == etag:
+                self.send_response(HTTPStatus.NOT_MODIFIED)
+                self.send_header('ETag', etag)
+                self.end_headers()
+                return
+
+            # A conditional range applies to this exact blob only
+            if_range = self.headers.get('If-Range')
+            try:
+                byte_range = parse_range(self.headers.get('Range'), size) if if_range in (None, etag) else None
+            except ValueError:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', f'bytes */{size}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+
+            start, end = byte_range or (0, size - 1)
+            self.send_response(HTTPStatus.PARTIAL_CONTENT if byte_range else HTTPStatus.OK)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(end - start + 1))
+            self.send_header('Accept-Ranges', 'bytes')
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', CACHE_CONTROL)
+            if byte_range:
+                self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+            self.end_headers()
+            if send_body:
+                self._copy(blob, start, end - start + 1)
+
+    def _copy(self, blob, start: int, remaining: int):
+        """Stream part of a blob to the client in chunks."""
+        blob.seek(start)
+        try:
+            while remaining > 0:
+                chunk = blob.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug(f"Client closed the connection during {self.path}")
+
+    def log_message(self, format, *args):
+        logger.debug(f"{self.address_string()} {format % args}")
+
+
+class MediaServer(ThreadingHTTPServer):
+    """Threaded HTTP server of a media store; each request is streamed by its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], store: Optional[BlobStore] = None):
+        """Initialize the server.
+
+        Args:
+            address: Host and port to listen on; port 0 picks a free port
+            store: Blob store to serve, defaults to the configured store
+        """
+        self.store = store or get_blob_store()
+        super().__init__(address, MediaRequestHandler)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    arg_parser = argparse.ArgumentParser(description="Serve the media store over HTTP")
+    arg_parser.add_argument("--host", default=MEDIA_SERVER_HOST, help="Address to listen on")
+    arg_parser.add_argument("--port", type=int, default=MEDIA_SERVER_PORT, help="Port to listen on")
+    args = arg_parser.parse_args()
+    server = MediaServer((args.host, args.port))
+    logger.info(f"Serving the media store on http://{args.host}:{server.server_port}/media/<hash>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
@@ -0,0 +1,117 @@
+from collections import namedtuple
+from datetime import datetime, timezone as tz, timedelta
+from telethon.tl.functions.channels import GetChannelsRequest
+from telethon.tl.types import Channel, ChatPhotoEmpty, InputChannel
+from sqlalchemy import select
+from src.database.models import ChannelEntity
+import logging
+
+# Snapshot of a channel_entities row, safe to keep across sessions
+CachedEntity = namedtuple('CachedEntity', 'channel_name channel_id access_hash username title resolved_date')
+
+
+class EntityCache:
+    """Resolved channel entities, persisted in the channel_entities table.
+
+    Entries are loaded from the database once, so a warm cycle resolves no
+    channel at all. Entries older than the TTL are refreshed together with a
+    single channels.getChannels request using their stored access hashes.
+    """
+
+    def __init__(self, ttl_hours):
+        """Initialize cache.
+
+        Args:
+            ttl_hours: Hours an entry is used before it is refreshed
+        """
+        self.ttl = timedelta(hours=ttl_hours)
+        self.loaded = False
+        self._entries = {}
+        self.logger = logging.getLogger(__name__)
+
+    def _is_fresh(self, row):
+        resolved = row.resolved_date
+        if resolved is None:
+            return False
+        if resolved.tzinfo is None:
+            resolved = resolved.replace(tzinfo=tz.utc)
+        return datetime.now(tz.utc) - resolved < self.ttl
+
+    @staticmethod
+    def _to_entity(row):
+        """Build a channel entity usable in client requests from a cached row."""
+        return Channel(
+            id=row.channel_id,
+            title=row.title,
+            photo=ChatPhotoEmpty(),
+            date=None,
+            broadcast=True,
+            access_hash=row.access_hash,
+            username=row.username
+        )
+
+    @staticmethod
+    def _snapshot(row):
+        return CachedEntity(
+            row.channel_name, row.channel_id, row.access_hash, row.username, row.title, row.resolved_date
+        )
+
+    async def load(self, db):
+        """Load all cached entities from the database."""
+        result = await db.execute(select(ChannelEntity))
+        self._entries = {row.channel_name: self._snapshot(row) for row in result.scalars()}
+        self.loaded = True
+        self.logger.info(f"Loaded {len(self._entries)} cached channel entities")
+
+    def get(self, channel_name):
+        """Return the cached entity of a channel, or None if missing or expired."""
+        row = self._entries.get(channel_name)
+        if row is None or not self._is_fresh(row):
+            return None
+        return self._to_entity(row)
+
+    async def store(self, db, channel_name, channel):
+        """Save a resolved entity under the configured channel name."""
+        result = await db.execute(select(ChannelEntity).where(ChannelEntity.channel_name == channel_name))
+        row = result.scalars().first()
+        if row is None:
+            row = ChannelEntity(channel_name=channel_name)
+            db.add(row)
+        row.channel_id = channel.id
+        row.access_hash = channel.access_hash
+        row.username = channel.username
+        row.title = channel.title
+        row.resolved_date = datetime.now(tz.utc)
+        self._entries[channel_name] = self._snapshot(row)
+        await db.commit()
+
+    async def refresh(self, client, db, channel_names):
+        """Refresh expired entries of the given channels with one bulk request.
+
+        Channels that cannot be refreshed keep their expired entry and are
+        resolved by name on their next use.
+
+        Args:
+            client: Telegram client
+            db: Async database session
+            channel_names: Channel names about to be parsed
+        """
+        stale = [
+            self._entries[name] for name in channel_names
+            if name in self._entries and not self._is_fresh(self._entries[name])
+        ]
+        if not stale:
+            return
+        self.logger.info(f"Refreshing {len(stale)} expired channel entities")
+        try:
+            result = await client(GetChannelsRequest([
+                InputChannel(row.channel_id, row.access_hash) for row in stale
+            ]))
+        except Exception as e:
+            self.logger.warning(f"Bulk channel refresh failed, channels will be resolved by name: {str(e)}")
+            return
+        channels = {chat.id: chat for chat in result.chats if isinstance(chat, Channel)}
+        for row in stale:
+            channel = channels.get(row.channel_id)
+            if channel is not None and channel.access_hash is not None:
+                await self.store(db, row.channel_name, channel)
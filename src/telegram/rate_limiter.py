@@ -0,0 +1,163 @@
+import asyncio
+import logging
+import time
+from telethon.errors import FloodWaitError
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose rate adapts to FloodWait errors.
+
+    Every request takes one token. The rate grows additively after each
+    successful request and shrinks after a FloodWait to the rate that would
+    have avoided it, i.e. the requests made since the previous FloodWait
+    spread over that period plus the mandated wait. While a FloodWait is
+    pending, no tokens are handed out at all.
+    """
+
+    def __init__(self, rate, min_rate, max_rate, burst, increase_step=0.05, decrease_factor=0.5):
+        """Initialize limiter.
+
+        Args:
+            rate: Initial rate in requests per second
+            min_rate: Lowest rate the limiter backs off to
+            max_rate: Highest rate the limiter ramps up to
+            burst: Bucket capacity, i.e. requests allowed back to back
+            increase_step: Requests per second added after each success
+            decrease_factor: Multiplier applied to the rate on FloodWait, at most
+        """
+        self.rate = min(max(rate, min_rate), max_rate)
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = max(1, burst)
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+
+        self.requests = 0
+        self.flood_waits = 0
+        self.flood_wait_seconds = 0.0
+        self.throttle_wait_seconds = 0.0
+
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._window_started = self._updated
+        self._window_requests = 0
+        self._lock = asyncio.Lock()
+        self.logger = logging.getLogger(__name__)
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self):
+        """Wait for a token. Callers are served in arrival order."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    delay = self._paused_until - now
+                else:
+                    self._refill(now)
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        break
+                    delay = (1 - self._tokens) / self.rate
+                await asyncio.sleep(delay)
+                self.throttle_wait_seconds += delay
+            self.requests += 1
+            self._window_requests += 1
+
+    def on_success(self):
+        """Ramp the rate up after a request went through."""
+        self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_flood_wait(self, seconds):
+        """Pause all requests for the mandated wait and lower the rate.
+
+        Args:
+            seconds: Wait time reported by Telegram
+        """
+        now = time.monotonic()
+        elapsed = now - self._window_started
+        sustainable = self._window_requests / (elapsed + seconds) if elapsed + seconds > 0 else self.rate
+        self.rate = max(self.min_rate, min(self.rate * self.decrease_factor, sustainable))
+
+        self.flood_waits += 1
+        self.flood_wait_seconds += seconds
+        self._paused_until = max(self._paused_until, now + seconds)
+        self._tokens = 0.0
+        self._updated = self._paused_until
+        self._window_started = self._paused_until
+        self._window_requests = 0
+        self.logger.warning(f"FloodWait of {seconds}s, rate lowered to {self.rate:.2f} req/s")
+
+    def stats(self):
+        """Return the current rate and wait-time counters.
+
+        Returns:
+            dict: Counters of the limiter
+        """
+        return {
+            'rate': round(self.rate, 3),
+            'requests': self.requests,
+            'flood_waits': self.flood_waits,
+            'flood_wait_seconds': self.flood_wait_seconds,
+            'throttle_wait_seconds': round(self.throttle_wait_seconds, 3),
+        }
+
+
+class RateLimitedClient:
+    """TelegramClient proxy that schedules requests through an AdaptiveRateLimiter.
+
+    get_messages, get_entity, download_media and raw requests made by
+    calling the client wait for a token and are retried after the wait
+    mandated by a FloodWaitError. Every other attribute is passed through
+    to the wrapped client.
+    """
+
+    def __init__(self, client, rate_limiter, max_flood_retries=3, max_flood_wait=600):
+        """Initialize proxy.
+
+        Args:
+            client: Connected TelegramClient
+            rate_limiter: AdaptiveRateLimiter shared by all users of the client
+            max_flood_retries: Retries of one request after FloodWait errors
+            max_flood_wait: Longest FloodWait in seconds that is waited out instead of raised
+        """
+        self._client = client
+        self.rate_limiter = rate_limiter
+        self.max_flood_retries = max_flood_retries
+        self.max_flood_wait = max_flood_wait
+        self.logger = logging.getLogger(__name__)
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    async def _call(self, method, *args, **kwargs):
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire()
+            try:
+                result = await method(*args, **kwargs)
+            except FloodWaitError as e:
+                self.rate_limiter.on_flood_wait(e.seconds)
+                if attempt >= self.max_flood_retries or e.seconds > self.max_flood_wait:
+                    raise
+                attempt += 1
+                name = getattr(method, '__name__', type(args[0]).__name__ if args else 'request')
+                self.logger.info(f"Retrying {name} after FloodWait (attempt {attempt}/{self.max_flood_retries})")
+                continue
+            self.rate_limiter.on_success()
+            return result
+
+    async def __call__(self, *args, **kwargs):
+        return await self._call(self._client, *args, **kwargs)
+
+    async def get_messages(self, *args, **kwargs):
+        return await self._call(self._client.get_messages, *args, **kwargs)
+
+    async def get_entity(self, *args, **kwargs):
+        return await self._call(self._client.get_entity, *args, **kwargs)
+
+    async def download_media(self, *args, **kwargs):
+        return await self._call(self._client.download_media, *args, **kwargs)
@@ -1,6 +1,10 @@
 from telethon import TelegramClient
 from telethon.sessions import StringSession
-from src.config.settings import API_ID, API_HASH, SESSION_STRING
+from src.config.settings import (
+    API_ID, API_HASH, SESSION_STRING, TELEGRAM_RATE, TELEGRAM_MIN_RATE, TELEGRAM_MAX_RATE,
+    TELEGRAM_BURST, TELEGRAM_FLOOD_RETRIES, TELEGRAM_MAX_FLOOD_WAIT, BACKFILL_RATE, BACKFILL_BURST
+)
+from src.telegram.rate_limiter import AdaptiveRateLimiter, RateLimitedClient
 import base64
 import logging
 
@@ -10,6 +14,19 @@ class SessionManager:
     def __init__(self):
         """Initialize session manager."""
         self.client = None
+        self.rate_limiter = AdaptiveRateLimiter(
+            rate=TELEGRAM_RATE,
+            min_rate=TELEGRAM_MIN_RATE,
+            max_rate=TELEGRAM_MAX_RATE,
+            burst=TELEGRAM_BURST
+        )
+        # Historical backfills are paced separately, so they never starve live polling
+        self.backfill_rate_limiter = AdaptiveRateLimiter(
+            rate=BACKFILL_RATE,
+            min_rate=TELEGRAM_MIN_RATE,
+            max_rate=BACKFILL_RATE,
+            burst=BACKFILL_BURST
+        )
         self.logger = logging.getLogger(__name__)
         
     def _decode_session_string(self, encoded_string):
@@ -30,14 +47,26 @@ class SessionManager:
             self.logger.error(f"Error decoding session string: {str(e)}")
             raise ValueError(f"Invalid session string format: {str(e)}")
         
-    async def get_client(self):
+    def _rate_limited(self, rate_limiter=None):
+        """Wrap the client so that its requests are paced by a rate limiter, the shared one by default."""
+        return RateLimitedClient(
+            self.client,
+            rate_limiter or self.rate_limiter,
+            max_flood_retries=TELEGRAM_FLOOD_RETRIES,
+            max_flood_wait=TELEGRAM_MAX_FLOOD_WAIT
+        )
+        
+    async def get_client(self, rate_limiter=None):
         """Get or create Telegram client using session string.
         
+        Args:
+            rate_limiter: AdaptiveRateLimiter pacing the returned client, defaults to the shared one
+            
         Returns:
-            TelegramClient: Connected Telegram client
+            RateLimitedClient: Connected Telegram client with paced requests
         """
         if self.client and self.client.is_connected():
-            return self.client
+            return self._rate_limited(rate_limiter)
             
         self.logger.info("Creating new client from session string...")
         
@@ -50,7 +79,9 @@ class SessionManager:
                 StringSession(session_string),
                 API_ID,
                 API_HASH,
-                system_version="4.16.30-vxCUSTOM"
+                system_version="4.16.30-vxCUSTOM",
+                # Surface every FloodWait so the rate limiter can adapt to it
+                flood_sleep_threshold=0
             )
             
             self.logger.info("Connecting to Telegram...")
@@ -62,7 +93,7 @@ class SessionManager:
                 
             me = await self.client.get_me()
             self.logger.info(f"Connected successfully as {me.first_name} (ID: {me.id})")
-            return self.client
+            return self._rate_limited(rate_limiter)
             
         except Exception as e:
             self.logger.error(f"Error connecting client: {str(e)}")
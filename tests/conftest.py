@@ -1,5 +1,7 @@
 import pytest
+import pytest_asyncio
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.orm import sessionmaker
 import sys
 from pathlib import Path
@@ -9,11 +11,13 @@ from datetime import datetime, timezone
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.database.models import Base
+from src.database.engine import enable_sqlite_foreign_keys
 from telethon.tl.types import MessageMediaPhoto, MessageMediaDocument
 
 @pytest.fixture
 def engine():
     engine = create_engine('sqlite:///:memory:', echo=True)
+    enable_sqlite_foreign_keys(engine)
     Base.metadata.create_all(engine)
     return engine
 
@@ -26,6 +30,16 @@ def db_session(engine):
     finally:
         session.close()
 
+@pytest_asyncio.fixture
+async def async_session_factory(tmp_path):
+    # A file database, so concurrent sessions get their own connections
+    engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'test.db'}")
+    enable_sqlite_foreign_keys(engine.sync_engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    yield async_sessionmaker(engine, expire_on_commit=False)
+    await engine.dispose()
+
 @pytest.fixture
 def mock_telegram_message():
     class MockPhotoSize:
@@ -0,0 +1,178 @@
+import pytest
+import io
+import random
+import sys
+import json
+import threading
+import urllib.request
+from urllib.error import HTTPError
+from pathlib import Path
+from datetime import datetime
+from sqlalchemy import select, inspect
+from sqlalchemy.exc import InvalidRequestError
+from sqlalchemy.orm import selectinload
+from PIL import Image
+
+# Add the project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.database.models import MessageGroup, MediaItem, CleanedListing
+from src.database.migrations import rewrite_image_urls
+from src.storage.blob_store import (
+    LocalBlobStore, content_hash, referenced_hashes_query, collect_garbage, load_media_bytes,
+    media_metadata_query, load_legacy_blobs, media_url
+)
+from src.storage.media_server import MediaServer
+from src.storage.imaging import process_image, hamming_distance, to_signed, HASH_MASK
+from src.storage.image_index import ImageHashIndex
+
+def test_put_is_content_addressed(tmp_path):
+    store = LocalBlobStore(tmp_path)
+    key = store.put(b'same photo')
+
+    assert key == content_hash(b'same photo')
+    assert store.put(b'same photo') == key
+    assert store.path_for(key) == tmp_path / key[:2] / key[2:4] / key
+    assert store.get(key) == b'same photo'
+    assert len([p for p in tmp_path.rglob('*') if p.is_file()]) == 1
+
+def test_collect_garbage_keeps_referenced_blobs(db_session, tmp_path):
+    store = LocalBlobStore(tmp_path)
+    shared = store.put(b'reposted photo')
+    orphan = store.put(b'unique photo')
+    group = MessageGroup(channel_id=1, group_id=1, posted_date=datetime.utcnow())
+    MediaItem(media_type='photo', content_hash=shared, group=group)
+    db_session.add(group)
+    db_session.commit()
+
+    candidates = {shared, orphan}
+    referenced = {row[0] for row in db_session.execute(referenced_hashes_query(candidates))}
+    removed = collect_garbage(store, candidates, referenced, min_age_seconds=0)
+
+    assert removed == 1
+    assert store.exists(shared)
+    assert not store.exists(orphan)
+
+def test_load_media_bytes_falls_back_to_legacy_column(tmp_path):
+    store = LocalBlobStore(tmp_path)
+    stored = MediaItem(content_hash=store.put(b'new'))
+    legacy = MediaItem(file_url=b'old')
+
+    assert load_media_bytes(stored, store) == b'new'
+    assert load_media_bytes(legacy, store) == b'old'
+
+@pytest.mark.asyncio
+async def test_media_blobs_are_deferred(async_session_factory, tmp_path):
+    store = LocalBlobStore(tmp_path)
+    async with async_session_factory() as db:
+        group = MessageGroup(channel_id=1, group_id=1, posted_date=datetime.utcnow())
+        MediaItem(media_type='photo', content_hash=store.put(b'new'), group=group)
+        MediaItem(media_type='photo', file_url=b'old' * 1000, group=group)
+        MediaItem(media_type='video', content_hash=store.put(b'clip'), group=group)
+        db.add(group)
+        await db.commit()
+
+    async with async_session_factory() as db:
+        rows = (await db.execute(media_metadata_query([1], media_type='photo'))).all()
+        assert [(row.id, row.media_type) for row in rows] == [(1, 'photo'), (2, 'photo')]
+
+        group = (await db.scalars(select(MessageGroup).options(selectinload(MessageGroup.media_items)))).one()
+        stored, legacy, video = sorted(group.media_items, key=lambda item: item.id)
+        assert all('file_url' in inspect(item).unloaded for item in group.media_items)
+        with pytest.raises(InvalidRequestError):
+            legacy.file_url
+
+        assert await load_legacy_blobs(db, group.media_items) == 1
+        assert load_media_bytes(stored, store) == b'new'
+        assert load_media_bytes(legacy, store) == b'old' * 1000
+
+def encode(image, **kwargs):
+    data = io.BytesIO()
+    image.convert('RGB').save(data, format='JPEG', **kwargs)
+    return data.getvalue()
+
+def test_reposted_photo_hashes_close(tmp_path):
+    photo = Image.effect_mandelbrot((800, 600), (-2.0, -1.2, 1.0, 1.2), 64)
+    other = Image.radial_gradient('L').resize((800, 600))
+
+    original = process_image(encode(photo, quality=95), max_size=320)
+    repost = process_image(encode(photo.resize((640, 480)), quality=60), max_size=320)
+    different = process_image(encode(other), max_size=320)
+
+    assert (original.width, original.height) == (800, 600)
+    assert Image.open(io.BytesIO(original.thumbnail)).size == (320, 240)
+    assert hamming_distance(original.phash, repost.phash) <= 4
+    assert hamming_distance(original.phash, different.phash) > 16
+    assert process_image(b'not an image', max_size=320) is None
+
+def test_image_hash_index_matches_brute_force():
+    rng = random.Random(7)
+    hashes = {key: to_signed(rng.getrandbits(64)) for key in range(2000)}
+    index = ImageHashIndex(max_distance=4)
+    for key, phash in hashes.items():
+        index.add(key, phash)
+    # Near copies of some hashes, with up to 4 flipped bits
+    queries = [to_signed(hashes[key] & HASH_MASK ^ sum(1 << bit for bit in rng.sample(range(64), key % 5)))
+               for key in range(0, 2000, 100)]
+
+    for query in queries:
+        expected = sorted(
+            (key, hamming_distance(query, phash)) for key, phash in hashes.items()
+            if hamming_distance(query, phash) <= 4
+        )
+        assert sorted(index.find(query)) == expected
+        assert expected
+    assert len(index) == 2000
+
+@pytest.fixture
+def media_server(tmp_path):
+    server = MediaServer(('127.0.0.1', 0), LocalBlobStore(tmp_path))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def fetch(server, key, method='GET', **headers):
+    url = media_url(key, f"http://127.0.0.1:{server.server_port}")
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, method=method, headers=headers)) as response:
+            return response.status, response.headers, response.read()
+    except HTTPError as e:
+        return e.code, e.headers, e.read()
+
+def test_media_server_streams_ranges(media_server):
+    data = encode(Image.linear_gradient('L').resize((64, 64)))
+    key = media_server.store.put(data)
+
+    status, headers, body = fetch(media_server, key)
+    assert (status, body) == (200, data)
+    assert headers['Content-Type'] == 'image/jpeg'
+    assert headers['Accept-Ranges'] == 'bytes'
+
+    status, headers, body = fetch(media_server, key, Range='bytes=10-19')
+    assert (status, body) == (206, data[10:20])
+    assert headers['Content-Range'] == f'bytes 10-19/{len(data)}'
+    assert fetch(media_server, key, Range='bytes=-5')[2] == data[-5:]
+    assert fetch(media_server, key, Range=f'bytes={len(data) - 3}-')[2] == data[-3:]
+
+    status, headers, _ = fetch(media_server, key, Range=f'bytes={len(data)}-')
+    assert status == 416
+    assert headers['Content-Range'] == f'bytes */{len(data)}'
+    assert fetch(media_server, key, **{'If-None-Match': f'"{key}"'})[0] == 304
+    assert fetch(media_server, key, method='HEAD')[1]['Content-Length'] == str(len(data))
+    assert fetch(media_server, content_hash(b'missing'))[0] == 404
+    assert fetch(media_server, '../etc/passwd')[0] == 404
+
+def test_rewrite_image_urls_replaces_hex_bytes(db_session, engine):
+    photo = b'\xff\xd8\xffphoto'
+    url = media_url(content_hash(b'\xff\xd8\xffother'))
+    group = MessageGroup(channel_id=1, group_id=1, posted_date=datetime.utcnow())
+    listing = CleanedListing(message_group=group, image_urls=json.dumps([photo.hex(), url]))
+    db_session.add(listing)
+    db_session.commit()
+
+    rewrite_image_urls.upgrade(engine)
+    db_session.refresh(listing)
+
+    assert json.loads(listing.image_urls) == [media_url(content_hash(photo)), url]
@@ -0,0 +1,510 @@
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+from datetime import datetime, timedelta
+
+# Add the project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import select, func, update
+
+from src.database.models import MessageGroup, Message, CleanedListing, LLMCall, STATE_CLAIMED, STATE_DONE, STATE_FAILED, STATE_PENDING, STATE_SKIPPED
+from src.llm_processor.pipeline import ListingPipeline, RateBudget
+from src.llm_processor.batch import BatchRunner, LocalBatchBackend
+from src.llm_processor.config import LLMConfig
+from src.llm_processor.processor import SYSTEM_PROMPT, Completion, LLMProcessor
+from src.llm_processor.backends import FakeChatBackend, RetryableError, placeholder_response, retry_after_seconds
+from src.llm_processor.cache import ExtractionCache
+from src.llm_processor.schemas import Property, PropertyLayout
+from src.llm_processor.service import ListingProcessorService
+from src.llm_processor.rules import RuleExtractor, RuleExtraction
+from src.llm_processor.preparation import TextPreparer
+from src.llm_processor.work_queue import WorkQueue
+
+class FakeProcessor:
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.known = []
+
+    async def complete(self, text, known=None):
+        return Completion(await self.process_listing(text, known), "fake-model", len(text), 10, 1)
+
+    async def process_listing(self, text, known=None):
+        self.known.append(known)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(self.delay)
+        self.in_flight -= 1
+        if 'broken' in text:
+            return None
+        return Property(layout='2+1', address=text, monthly_rent_usd=500, phone_numbers=[])
+
+class FakeService:
+    def __init__(self, processor):
+        self.llm_processor = processor
+
+    async def load_groups(self, session, group_ids):
+        query = select(MessageGroup).where(MessageGroup.id.in_(group_ids)).order_by(MessageGroup.id)
+        return list((await session.execute(query)).scalars())
+
+    def listing_text(self, group):
+        return group.combined_text
+
+    def listing_images(self, group):
+        return []
+
+    def pre_extract(self, text):
+        return RuleExtraction()
+
+    async def earlier_extractions(self, session, groups):
+        return {}
+
+    async def learn_boilerplate(self, session):
+        pass
+
+    async def lookup_cached(self, text):
+        return None
+
+    async def store_cached(self, text, property_details):
+        pass
+
+async def add_groups(session_factory, texts):
+    async with session_factory() as session:
+        session.add_all([
+            MessageGroup(channel_id=1, group_id=i, combined_text=text, posted_date=datetime.utcnow())
+            for i, text in enumerate(texts)
+        ])
+        await session.commit()
+
+@pytest.mark.asyncio
+async def test_pipeline_processes_groups_concurrently(async_session_factory):
+    await add_groups(async_session_factory, [f"Flat {i}" for i in range(20)])
+    processor = FakeProcessor()
+    pipeline = ListingPipeline(
+        FakeService(processor), async_session_factory, WorkQueue(async_session_factory), workers=5, prefetch_size=10,
+        write_batch_size=8, budget=RateBudget(1000, 10 ** 6), max_tokens=100, flush_interval=0.05
+    )
+
+    written = await asyncio.wait_for(pipeline.run(total_limit=20), timeout=5)
+
+    assert written == 20
+    assert processor.max_in_flight == 5
+    async with async_session_factory() as session:
+        count = await session.scalar(select(func.count(CleanedListing.id)))
+        assert count == 20
+
+@pytest.mark.asyncio
+async def test_pipeline_gives_up_on_failing_groups(async_session_factory):
+    await add_groups(async_session_factory, ["broken post", "Flat 1", "Flat 2"])
+    queue = WorkQueue(async_session_factory, max_attempts=2, retry_base_seconds=0)
+    pipeline = ListingPipeline(
+        FakeService(FakeProcessor(delay=0)), async_session_factory, queue, workers=2, prefetch_size=4,
+        write_batch_size=4, budget=RateBudget(1000, 10 ** 6), max_tokens=100, sleep_interval=0.01,
+        flush_interval=0.01
+    )
+
+    assert await asyncio.wait_for(pipeline.run(total_limit=2), timeout=5) == 2
+    async with async_session_factory() as session:
+        broken = await session.get(MessageGroup, 1)
+        assert broken.processing_state in (STATE_PENDING, STATE_FAILED)
+        assert broken.lease_owner is None
+        assert await session.scalar(select(func.count(CleanedListing.id))) == 2
+
+@pytest.mark.asyncio
+async def test_rate_budget_limits_requests_per_minute(monkeypatch):
+    budget = RateBudget(requests_per_minute=2, tokens_per_minute=10 ** 6)
+    monkeypatch.setattr(RateBudget, 'WINDOW_SECONDS', 0.05)
+    started = asyncio.get_running_loop().time()
+    for _ in range(3):
+        await budget.acquire(10)
+    assert asyncio.get_running_loop().time() - started >= 0.04
+
+@pytest.mark.asyncio
+async def test_batch_job_round_trip(async_session_factory, tmp_path):
+    await add_groups(async_session_factory, ["Flat on Rustaveli", "Flat in Vake", "Garage"])
+    requests = []
+
+    def respond(body):
+        requests.append(body)
+        text = body['messages'][-1]['content']
+        if text == "Garage":
+            return "not a listing"
+        return Property(layout='1+1', address=text, monthly_rent_usd=400, phone_numbers=[]).json()
+
+    config = LLMConfig(openai_api_key='test')
+    backend = LocalBatchBackend(tmp_path / 'backend', respond)
+    runner = BatchRunner(FakeService(FakeProcessor()), async_session_factory, backend, config, tmp_path / 'jobs')
+
+    assert await runner.run(limit=10) == 2
+    assert requests[0]['messages'][0]['content'] == SYSTEM_PROMPT
+    assert requests[0]['model'] == config.model_name
+    async with async_session_factory() as session:
+        addresses = (await session.execute(select(CleanedListing.address))).scalars().all()
+        groups = (await session.execute(select(MessageGroup).order_by(MessageGroup.id))).scalars().all()
+        calls = (await session.execute(select(LLMCall).order_by(LLMCall.group_id))).scalars().all()
+    assert sorted(addresses) == ["Flat in Vake", "Flat on Rustaveli"]
+    assert [group.processing_state for group in groups] == [STATE_DONE, STATE_DONE, STATE_PENDING]
+    # Every request's usage is recorded at the batch price, including the invalid answer
+    assert [(call.group_id, call.succeeded, call.price_factor) for call in calls] == [
+        (1, True, 0.5), (2, True, 0.5), (3, False, 0.5)
+    ]
+    assert all(call.prompt_tokens > 0 and call.model_name == config.model_name for call in calls)
+    assert all(group.lease_owner is None for group in groups)
+    # The group without a valid result is retried later through the queue
+    assert groups[2].attempts == 1 and groups[2].next_attempt_at is not None
+
+    # Nothing is pending any more
+    assert await runner.run(limit=10) == 0
+
+@pytest.mark.asyncio
+async def test_batch_job_updates_the_listing_of_a_repost(async_session_factory, tmp_path):
+    await add_groups(async_session_factory, ["2+1 in Vake, $600", "2+1 in Vake, $550"])
+    async with async_session_factory() as session:
+        await session.execute(update(MessageGroup).values(cluster_id=1))
+        await session.commit()
+    config = LLMConfig(openai_api_key='test')
+    backend = LocalBatchBackend(tmp_path / 'backend', placeholder_response)
+    runner = BatchRunner(FakeService(FakeProcessor()), async_session_factory, backend, config, tmp_path / 'jobs')
+
+    assert await runner.run(limit=10) == 2
+    async with async_session_factory() as session:
+        listings = (await session.execute(select(CleanedListing))).scalars().all()
+        states = (await session.execute(select(MessageGroup.processing_state))).scalars().all()
+    # One row per apartment, holding the newest post
+    assert [(listing.group_id, listing.address) for listing in listings] == [(2, "2+1 in Vake, $550")]
+    assert states == [STATE_DONE, STATE_DONE]
+
+@pytest.mark.asyncio
+async def test_batch_job_skips_groups_claimed_by_the_service(async_session_factory, tmp_path):
+    await add_groups(async_session_factory, ["Flat on Rustaveli", "Flat in Vake"])
+    config = LLMConfig(openai_api_key='test')
+    backend = LocalBatchBackend(tmp_path / 'backend', placeholder_response)
+    runner = BatchRunner(FakeService(FakeProcessor()), async_session_factory, backend, config, tmp_path / 'jobs')
+    service_queue = WorkQueue(async_session_factory, worker_id='service')
+
+    assert await service_queue.claim(1) == [1]
+    assert await runner.run(limit=10) == 1
+    async with async_session_factory() as session:
+        listing_groups = (await session.execute(select(CleanedListing.group_id))).scalars().all()
+        first = await session.get(MessageGroup, 1)
+    assert listing_groups == [2]
+    assert (first.processing_state, first.lease_owner) == (STATE_CLAIMED, 'service')
+
+@pytest.mark.asyncio
+async def test_extraction_cache_matches_reposts(async_session_factory):
+    cache = ExtractionCache(async_session_factory, 'gpt-4o-mini')
+    flat = Property(layout='2+1', address='Vake', monthly_rent_usd=600, phone_numbers=['+995555'])
+
+    assert await cache.get("2+1 in Vake, $600") is None
+    await cache.put("2+1 in Vake, $600", flat)
+    repost = await cache.get("  2+1 IN VAKE,\n$600 🔥 ")
+
+    assert repost == flat
+    assert await cache.get("2+1 in Vake, $650") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+
+    # Another model or prompt version does not share entries
+    assert await ExtractionCache(async_session_factory, 'gpt-4o').get("2+1 in Vake, $600") is None
+
+@pytest.mark.asyncio
+async def test_extraction_cache_evicts_least_recently_used(async_session_factory):
+    cache = ExtractionCache(async_session_factory, 'gpt-4o-mini', max_entries=2)
+    flat = Property(layout='studio', address='Saburtalo', monthly_rent_usd=300, phone_numbers=[])
+    for text in ("first", "second", "third"):
+        await cache.put(text, flat)
+    await cache.get("first")
+
+    assert await cache.evict() == 1
+    assert await cache.get("second") is None
+    assert await cache.get("first") is not None
+    assert await cache.get("third") is not None
+
+@pytest.mark.asyncio
+async def test_work_queue_claims_are_disjoint_and_leases_expire(async_session_factory):
+    await add_groups(async_session_factory, [f"Flat {i}" for i in range(6)])
+    first = WorkQueue(async_session_factory, worker_id='first')
+    second = WorkQueue(async_session_factory, worker_id='second')
+
+    claims = await asyncio.gather(first.claim(2), second.claim(2), first.claim(2))
+    claimed = [group_id for claim in claims for group_id in claim]
+    assert sorted(claimed) == [1, 2, 3, 4, 5, 6]
+
+    # A worker that stopped renewing its leases loses them to another worker
+    async with async_session_factory() as session:
+        await session.execute(update(MessageGroup).where(MessageGroup.id.in_(claims[1])).values(
+            lease_expires_at=datetime.utcnow() - timedelta(seconds=1)
+        ))
+        await session.commit()
+    reclaimed = await first.claim(10)
+    assert reclaimed == claims[1]
+    assert await second.heartbeat(claims[1]) == set()
+
+    # Only the current lease holder completes a group
+    async with async_session_factory() as session:
+        assert await second.complete(session, reclaimed) == set()
+        assert await first.complete(session, reclaimed) == set(reclaimed)
+        await session.commit()
+        group = await session.get(MessageGroup, reclaimed[0])
+        assert (group.processing_state, group.attempts) == (STATE_DONE, 2)
+
+@pytest.mark.asyncio
+async def test_work_queue_retries_with_backoff_then_gives_up(async_session_factory):
+    await add_groups(async_session_factory, ["broken post"])
+    queue = WorkQueue(async_session_factory, max_attempts=2, retry_base_seconds=60)
+
+    assert await queue.claim(1) == [1]
+    assert await queue.fail([1]) == 0
+    # Not claimable again before next_attempt_at
+    assert await queue.claim(1) == []
+
+    async with async_session_factory() as session:
+        await session.execute(update(MessageGroup).values(next_attempt_at=datetime.utcnow()))
+        await session.commit()
+    assert await queue.claim(1) == [1]
+    assert await queue.fail([1]) == 1
+    async with async_session_factory() as session:
+        group = await session.get(MessageGroup, 1)
+        assert (group.processing_state, group.attempts) == (STATE_FAILED, 2)
+    assert await queue.claim(1) == []
+
+@pytest.mark.asyncio
+async def test_cleaned_listing_is_unique_per_group(async_session_factory):
+    await add_groups(async_session_factory, ["Flat"])
+    async with async_session_factory() as session:
+        session.add_all([CleanedListing(group_id=1), CleanedListing(group_id=1)])
+        with pytest.raises(Exception):
+            await session.commit()
+
+TEMPLATED = """2+1, 65 m², 5/9 floor, $600
+📍 12 Chavchavadze Ave, Vake
++995 555 12 34 56, @owner_tbs"""
+
+def test_rule_extractor_reads_templated_listings():
+    rules = RuleExtractor(min_confidence=0.8)
+
+    flat = rules.extract(TEMPLATED).property_details
+    assert flat.layout == PropertyLayout.TWO_PLUS_ONE
+    assert (flat.bedrooms, flat.area_sqm, flat.floor, flat.total_floors) == (2, 65, 5, 9)
+    assert flat.monthly_rent_usd == 600
+    assert flat.address == "12 Chavchavadze Ave, Vake"
+    assert flat.district == "Vake"
+    assert flat.phone_numbers == ["+995555123456"]
+    assert flat.telegram == "@owner_tbs"
+
+    # No address and a price in GEL: the LLM is asked for the rest
+    partial = rules.extract("Studio near the metro, 1500 GEL, deposit 900 GEL, 5th floor. 599 11 22 33")
+    assert partial.property_details is None
+    assert partial.known['layout'] == PropertyLayout.STUDIO
+    assert partial.known['monthly_rent_usd'] == 500
+    assert partial.known['deposit_amount_usd'] == 300
+    assert partial.known['floor'] == 5
+    assert partial.known['phone_numbers'] == ["+995599112233"]
+    assert 'address' not in partial.known
+
+    # Daily rates and conflicting layouts are not trusted
+    daily = rules.extract("1+1 or 2+1, $60 per day")
+    assert daily.confidence['monthly_rent_usd'] < 0.8
+    assert daily.confidence['layout'] < 0.8
+    assert rules.stats()["rule_only"] == 1
+
+@pytest.mark.asyncio
+async def test_service_asks_llm_only_for_missing_fields(async_session_factory):
+    processor = FakeProcessor(delay=0)
+    service = ListingProcessorService(processor, queue=WorkQueue(async_session_factory), rules=RuleExtractor())
+
+    flat = await service.extract(TEMPLATED)
+    assert flat.monthly_rent_usd == 600
+    assert processor.known == []
+
+    await service.extract("2+1 in a new building, $700, call 555 12 34 56")
+    assert processor.known[0]['monthly_rent_usd'] == 700
+    assert processor.known[0]['layout'] == PropertyLayout.TWO_PLUS_ONE
+    assert 'address' not in processor.known[0]
+
+@pytest.mark.asyncio
+async def test_reposts_reuse_the_listing_of_their_cluster(async_session_factory):
+    async with async_session_factory() as session:
+        for i, text in enumerate(["2+1 in Vake, $600", "2+1 in Vake, $550"]):
+            session.add(MessageGroup(channel_id=1, group_id=i, combined_text=text, posted_date=datetime.utcnow(),
+                                     cluster_id=1, messages=[Message(message_id=i, text=text)]))
+        await session.commit()
+    processor = FakeProcessor(delay=0)
+    queue = WorkQueue(async_session_factory)
+    service = ListingProcessorService(processor, queue=queue, rules=RuleExtractor())
+
+    for _ in range(2):
+        async with async_session_factory() as session:
+            group = (await service.load_groups(session, await queue.claim(1)))[0]
+            assert await service.process_listing(session, group)
+
+    # The repost is not sent to the LLM; its price comes from the rules
+    assert len(processor.known) == 1
+    async with async_session_factory() as session:
+        listing = (await session.scalars(select(CleanedListing))).one()
+        assert (listing.group_id, listing.address, listing.monthly_rent_usd) == (2, "2+1 in Vake, $600", 550)
+        assert (await session.get(MessageGroup, 1)).processing_state == STATE_DONE
+    assert service.reused == 1
+
+@pytest.mark.asyncio
+async def test_service_discards_the_result_of_a_lost_lease(async_session_factory):
+    async with async_session_factory() as session:
+        session.add(MessageGroup(channel_id=1, group_id=1, combined_text="2+1 in Vake", posted_date=datetime.utcnow(),
+                                 messages=[Message(message_id=1, text="2+1 in Vake")]))
+        await session.commit()
+    queue = WorkQueue(async_session_factory, worker_id='service')
+    service = ListingProcessorService(FakeProcessor(delay=0), queue=queue)
+
+    async with async_session_factory() as session:
+        group_ids = await queue.claim(1)
+        group = (await service.load_groups(session, group_ids))[0]
+        # The lease expires and another worker takes the group over during extraction
+        async with async_session_factory() as other:
+            await other.execute(update(MessageGroup).values(lease_owner='other'))
+            await other.commit()
+        assert not await service.process_listing(session, group)
+    await queue.fail(group_ids)
+
+    async with async_session_factory() as session:
+        group = await session.get(MessageGroup, 1)
+        assert (group.processing_state, group.lease_owner, group.attempts) == (STATE_CLAIMED, 'other', 1)
+        assert await session.scalar(select(func.count(CleanedListing.id))) == 0
+
+@pytest.mark.asyncio
+async def test_service_requeues_groups_changed_during_extraction(async_session_factory):
+    async with async_session_factory() as session:
+        session.add(MessageGroup(channel_id=1, group_id=1, combined_text="2+1 in Vake", posted_date=datetime.utcnow(),
+                                 messages=[Message(message_id=1, text="2+1 in Vake")]))
+        await session.commit()
+    queue = WorkQueue(async_session_factory, worker_id='service', max_attempts=1)
+    service = ListingProcessorService(FakeProcessor(delay=0), queue=queue)
+
+    async with async_session_factory() as session:
+        group_ids = await queue.claim(1)
+        group = (await service.load_groups(session, group_ids))[0]
+        # The parser merges a late album member into the group during extraction
+        async with async_session_factory() as parser_session:
+            await parser_session.execute(update(MessageGroup).values(next_attempt_at=datetime.utcnow()))
+            await parser_session.commit()
+        assert not await service.process_listing(session, group)
+    # As run_service does with unsuccessful groups
+    assert await queue.fail(group_ids) == 0
+
+    async with async_session_factory() as session:
+        group = await session.get(MessageGroup, 1)
+        assert (group.processing_state, group.lease_owner, group.attempts) == (STATE_PENDING, None, 0)
+        assert await session.scalar(select(func.count(CleanedListing.id))) == 0
+    assert await queue.claim(1) == [1]
+
+@pytest.mark.asyncio
+async def test_changed_groups_that_are_no_longer_listings_are_skipped(async_session_factory):
+    await add_groups(async_session_factory, ["2+1 in Vake", "2+1 in Vake\nRented, thanks everyone"])
+    queue = WorkQueue(async_session_factory, min_relevance_score=0.5)
+    group_ids = await queue.claim(2)
+    async with async_session_factory() as session:
+        # Scores the parser gave the merged texts
+        for group_id, score in zip(group_ids, [0.9, 0.1]):
+            await session.execute(update(MessageGroup).where(MessageGroup.id == group_id).values(
+                relevance_score=score, next_attempt_at=datetime.utcnow()
+            ))
+        await session.commit()
+
+    assert await queue.requeue_changed(group_ids) == set(group_ids)
+    async with async_session_factory() as session:
+        states = (await session.execute(select(MessageGroup.processing_state).order_by(MessageGroup.id))).scalars().all()
+    assert states == [STATE_PENDING, STATE_SKIPPED]
+    assert await queue.claim(2) == group_ids[:1]
+
+def test_text_preparer_strips_boilerplate_and_repeated_captions():
+    footer = "Подписывайтесь на наш канал недвижимости"
+    contact = "Write to our agent @rent_admin"
+    samples = [("rentals", f"{i}+1 flat, ${i}00\n{footer}\n{contact}") for i in range(1, 9)]
+    samples += [("flats", f"Flat {i}\n{footer}") for i in range(2)]
+    preparer = TextPreparer(max_tokens=40, min_groups=5, min_share=0.3)
+    preparer.learn(samples)
+    assert preparer.boilerplate == {"rentals": {footer.casefold()}}
+
+    caption = "2+1 in Vake 🔥🔥🔥🔥🔥🔥, $600"
+    album = f"{caption}\n{footer}\n{contact}\n\n\n{caption.upper()}\n{footer}"
+    assert preparer.prepare("rentals", album) == f"2+1 in Vake 🔥, $600\n{contact}"
+    assert footer in preparer.prepare("flats", album)
+
+    long_text = "\n".join(f"Line {i} of a very long description" for i in range(20))
+    truncated = preparer.prepare("rentals", long_text)
+    assert len(truncated) <= 40 * 3 and truncated.endswith("description")
+    assert preparer.stats()["truncated"] == 1
+
+@pytest.mark.asyncio
+async def test_pipeline_records_token_usage_per_call(async_session_factory):
+    await add_groups(async_session_factory, ["broken post", "Flat 1"])
+    queue = WorkQueue(async_session_factory, max_attempts=1)
+    pipeline = ListingPipeline(
+        FakeService(FakeProcessor(delay=0)), async_session_factory, queue, workers=2, prefetch_size=4,
+        write_batch_size=4, budget=RateBudget(1000, 10 ** 6), max_tokens=100, sleep_interval=0.01,
+        flush_interval=0.05
+    )
+
+    assert await asyncio.wait_for(pipeline.run(total_limit=1), timeout=5) == 1
+    async with async_session_factory() as session:
+        calls = (await session.scalars(select(LLMCall).order_by(LLMCall.group_id))).all()
+    assert [(call.group_id, call.succeeded) for call in calls] == [(1, False), (2, True)]
+    assert (calls[1].model_name, calls[1].prompt_tokens, calls[1].completion_tokens) == ("fake-model", 6, 10)
+    assert calls[1].prompt_chars == calls[1].original_chars == len("Flat 1")
+
+@pytest.mark.asyncio
+async def test_processor_retries_rate_limits_and_invalid_answers(monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+    monkeypatch.setattr('src.llm_processor.processor.asyncio.sleep', sleep)
+    config = LLMConfig(openai_api_key='test', model_name='test-model', request_retries=2, validation_retries=1,
+                       retry_backoff_seconds=1, retry_max_wait_seconds=30)
+
+    # A rate limit with Retry-After, then a server error without, then a valid answer
+    backend = FakeChatBackend(failures=[
+        RetryableError("rate limited", 429, retry_after_seconds({'retry-after': '7'})),
+        RetryableError("bad gateway", 502),
+    ])
+    completion = await LLMProcessor(config, backend).complete("Flat on Rustaveli\n$500")
+    assert completion.property_details.address == "Flat on Rustaveli"
+    assert completion.model_name == 'test-model' and completion.prompt_tokens > 0
+    assert waits[0] == 7 and 1 <= waits[1] <= 2
+    assert backend.requests == 3
+
+    # Rate limits beyond the retries give up, other errors are not retried
+    backend = FakeChatBackend(failures=[RetryableError("rate limited", 429)] * 3)
+    assert (await LLMProcessor(config, backend).complete("Flat")).property_details is None
+    assert backend.requests == 3
+    backend = FakeChatBackend(failures=[ValueError("bad request")])
+    assert (await LLMProcessor(config, backend).complete("Flat")).property_details is None
+    assert backend.requests == 1
+
+    # Answers that do not match the schema are asked again at once, once
+    answers = iter(['{"layout": "2+1"}', Property(layout='2+1', address="Vake", monthly_rent_usd=600, phone_numbers=[]).json()])
+    waits.clear()
+    processor = LLMProcessor(config, FakeChatBackend(lambda body: next(answers)))
+    completion = await processor.complete("2+1 in Vake")
+    assert completion.property_details.monthly_rent_usd == 600
+    assert waits == []
+    assert processor.stats() == {"requests": 2, "retried": 0, "invalid": 1, "failed": 0}
+    assert retry_after_seconds({'retry-after-ms': '1500'}) == 1.5
+
+@pytest.mark.asyncio
+async def test_pipeline_runs_offline_with_the_fake_backend(async_session_factory):
+    await add_groups(async_session_factory, [f"Flat {i}" for i in range(30)])
+    config = LLMConfig(openai_api_key='test', backend='fake', fake_latency_ms=20)
+    processor = LLMProcessor(config)
+    pipeline = ListingPipeline(
+        FakeService(processor), async_session_factory, WorkQueue(async_session_factory), workers=10, prefetch_size=30,
+        write_batch_size=10, budget=RateBudget(1000, 10 ** 7), max_tokens=100, flush_interval=0.05
+    )
+
+    started = asyncio.get_running_loop().time()
+    assert await asyncio.wait_for(pipeline.run(total_limit=30), timeout=5) == 30
+    # 30 requests of 20 ms on 10 workers
+    assert asyncio.get_running_loop().time() - started < 0.6
+    assert processor.stats()["requests"] == 30
+    await processor.aclose()
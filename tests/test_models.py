@@ -6,7 +6,11 @@ from pathlib import Path
 # Add the project root directory to Python path
 sys.path.append(str(Path(__file__).parent.parent))
 
-from src.database.models import MessageGroup, Message, MediaItem
+from src.database.models import MessageGroup, Message, MediaItem, UTCDateTime
+from src.database.engine import async_database_url, sync_database_url
+from src.database.migrations import add_work_queue_columns, add_message_group_upsert
+from src.database.models import Base
+from sqlalchemy import create_engine, inspect, text
 
 def test_message_group_creation(db_session):
     group = MessageGroup(
@@ -84,3 +88,66 @@ def test_cascade_delete(db_session):
     
     assert db_session.query(Message).count() == 0
     assert db_session.query(MediaItem).count() == 0
+
+def test_database_urls_use_async_drivers():
+    assert async_database_url('sqlite:///telegram_parser.db') == 'sqlite+aiosqlite:///telegram_parser.db'
+    assert async_database_url('postgres://u:p@host:5432/db') == 'postgresql+asyncpg://u:p@host:5432/db'
+    assert async_database_url('postgresql+psycopg2://u:p@host/db') == 'postgresql+asyncpg://u:p@host/db'
+    assert sync_database_url('postgres://u:p@host/db') == 'postgresql://u:p@host/db'
+
+def test_work_queue_migration_marks_processed_groups(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE message_groups (id INTEGER PRIMARY KEY, channel_id INTEGER, group_id BIGINT, posted_date TIMESTAMP)"))
+        conn.execute(text("CREATE TABLE cleaned_listings (id INTEGER PRIMARY KEY, group_id BIGINT)"))
+        conn.execute(text("CREATE TABLE messages (id INTEGER PRIMARY KEY, group_id BIGINT)"))
+        conn.execute(text("CREATE TABLE media_items (id INTEGER PRIMARY KEY, group_id BIGINT)"))
+        conn.execute(text("INSERT INTO message_groups (id) VALUES (1), (2)"))
+        conn.execute(text("INSERT INTO cleaned_listings (group_id) VALUES (1)"))
+
+    add_work_queue_columns.upgrade(engine)
+    add_work_queue_columns.upgrade(engine)  # Safe to run twice
+
+    with engine.connect() as conn:
+        states = conn.execute(text("SELECT id, processing_state FROM message_groups ORDER BY id")).fetchall()
+    assert [tuple(row) for row in states] == [(1, 'done'), (2, 'pending')]
+    indexes = {index['name'] for index in inspect(engine).get_indexes('message_groups')}
+    assert {'ix_message_groups_state_id', 'ix_message_groups_channel_group', 'ix_message_groups_posted_date'} <= indexes
+
+def test_datetimes_are_stored_as_naive_utc():
+    from datetime import timezone, timedelta
+    tbilisi = timezone(timedelta(hours=4))
+    stored = UTCDateTime().process_bind_param(datetime(2024, 5, 1, 16, 30, tzinfo=tbilisi), None)
+    assert stored == datetime(2024, 5, 1, 12, 30)
+    assert stored.tzinfo is None
+
+def test_upsert_migration_merges_duplicate_groups(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    Base.metadata.create_all(engine)
+    with engine.begin() as conn:
+        # Schema as it was before groups were unique
+        conn.execute(text("DROP INDEX ix_messages_group_message"))
+        conn.execute(text("DROP INDEX ix_message_groups_channel_group"))
+        conn.execute(text("CREATE INDEX ix_message_groups_channel_group ON message_groups (channel_id, group_id)"))
+        conn.execute(text(
+            "INSERT INTO message_groups (id, channel_id, group_id, processing_state, attempts) VALUES "
+            "(1, 42, 100, 'done', 1), (2, 42, 100, 'pending', 0), (3, 42, 200, 'pending', 0)"
+        ))
+        conn.execute(text("INSERT INTO messages (group_id, message_id) VALUES (1, 7), (2, 7), (2, 8), (3, 9)"))
+        conn.execute(text("INSERT INTO media_items (group_id, file_id) VALUES (1, 'a'), (2, 'a'), (2, 'b')"))
+        conn.execute(text("INSERT INTO cleaned_listings (group_id) VALUES (1)"))
+
+    add_message_group_upsert.upgrade(engine)
+    add_message_group_upsert.upgrade(engine)  # Safe to run twice
+
+    with engine.connect() as conn:
+        groups = conn.execute(text("SELECT id, processing_state FROM message_groups ORDER BY id")).fetchall()
+        messages = conn.execute(text("SELECT group_id, message_id FROM messages ORDER BY message_id")).fetchall()
+        media = conn.execute(text("SELECT group_id, file_id FROM media_items ORDER BY file_id")).fetchall()
+        listings = conn.execute(text("SELECT COUNT(*) FROM cleaned_listings")).scalar()
+    assert [tuple(row) for row in groups] == [(1, 'pending'), (3, 'pending')]
+    assert [tuple(row) for row in messages] == [(1, 7), (1, 8), (3, 9)]
+    assert [tuple(row) for row in media] == [(1, 'a'), (1, 'b')]
+    assert listings == 0
+    unique = {index['name'] for index in inspect(engine).get_indexes('message_groups') if index['unique']}
+    assert 'ix_message_groups_channel_group' in unique
@@ -0,0 +1,81 @@
+import pytest
+import random
+import sys
+from pathlib import Path
+from datetime import datetime
+
+# Add the project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.database.models import MessageGroup, STATE_PENDING, STATE_SKIPPED
+from src.database.migrations import add_listing_clusters
+from src.parser.near_duplicates import MinHashIndex, minhash_signature, similarity
+
+LISTING = """Сдается квартира 2+1 в Ваке
+65 м², 5/9 этаж, центральное отопление
+Рядом метро и парк
+Цена 600$ в месяц, депозит 600$
++995 555 12 34 56"""
+
+def test_edited_reposts_are_similar():
+    signature = minhash_signature(LISTING)
+    price_change = minhash_signature(LISTING.replace("Цена 600$", "Цена 550$"))
+    lines = LISTING.splitlines()
+    reordered = minhash_signature("\n".join(lines[1:3] + lines[:1] + lines[3:]))
+    emoji = minhash_signature("🔥🔥 " + LISTING.replace("Рядом", "🚇 Рядом"))
+    other = minhash_signature("Studio for rent in Saburtalo, 35 m2, $350, call 599 11 22 33")
+
+    assert len(signature) == 512
+    assert similarity(signature, minhash_signature(LISTING.upper())) == 1.0
+    assert similarity(signature, emoji) == 1.0
+    assert similarity(signature, price_change) >= 0.7
+    assert similarity(signature, reordered) >= 0.7
+    assert similarity(signature, other) < 0.2
+    assert minhash_signature("🔥 !!!") is None
+
+def test_index_finds_the_pairs_brute_force_finds():
+    rng = random.Random(7)
+    vocabulary = [f"word{i}" for i in range(300)]
+    texts = []
+    for _ in range(100):
+        words = rng.choices(vocabulary, k=40)
+        texts.append(words)
+        # A repost with one word changed
+        edited = list(words)
+        edited[rng.randrange(len(edited))] = rng.choice(vocabulary)
+        texts.append(edited)
+    signatures = [minhash_signature(" ".join(words)) for words in texts]
+
+    index = MinHashIndex(threshold=0.7)
+    for key, signature in enumerate(signatures):
+        index.add(key, key, signature)
+
+    expected = found = 0
+    for key, signature in enumerate(signatures):
+        brute_force = {other for other, sig in enumerate(signatures) if similarity(signature, sig) >= 0.7}
+        matches = {match for match, _, _ in index.find(signature)}
+        assert matches <= brute_force
+        expected += len(brute_force)
+        found += len(matches)
+    assert found / expected >= 0.95
+
+    index.remove(1)
+    assert [key for key, _, _ in index.find(signatures[1])] == [0]
+    assert len(index) == 199
+
+def test_migration_clusters_saved_groups(db_session, engine):
+    texts = [LISTING, "Rented!", "Studio for rent in Saburtalo, 35 m2, $350", LISTING.replace("Цена 600$", "Цена 550$")]
+    db_session.add_all([
+        MessageGroup(channel_id=1, group_id=i, combined_text=text, posted_date=datetime.utcnow(),
+                     processing_state=STATE_SKIPPED if text == "Rented!" else STATE_PENDING)
+        for i, text in enumerate(texts)
+    ])
+    db_session.commit()
+
+    add_listing_clusters.upgrade(engine)
+    db_session.expire_all()
+
+    groups = db_session.query(MessageGroup).order_by(MessageGroup.id).all()
+    assert [group.cluster_id for group in groups] == [1, None, 3, 1]
+    assert groups[1].minhash is None
+    assert groups[3].minhash == minhash_signature(texts[3])
@@ -3,13 +3,26 @@ from unittest.mock import Mock, patch, AsyncMock
 import sys
 from pathlib import Path
 import asyncio
-from datetime import datetime, timezone
+import io
+from datetime import datetime, timezone, timedelta
+from sqlalchemy import select, func, update
 
 # Add the project root directory to Python path
 sys.path.append(str(Path(__file__).parent.parent))
 
 from src.parser.telegram_parser import TelegramParser
-from src.database.models import MessageGroup, Message, MediaItem
+from src.parser.backfill import ChannelBackfill
+from src.parser.media_downloader import MediaDownloader
+from src.parser.message_window import MessageWindow
+from src.llm_processor.work_queue import WorkQueue
+from src.storage.blob_store import LocalBlobStore
+from src.storage.image_index import ImageProcessor
+from src.database.models import (
+    MessageGroup, Message, MediaItem, ChannelState, CleanedListing, BackfillCheckpoint, STATE_DONE, STATE_PENDING,
+    STATE_SKIPPED, STATE_CLAIMED
+)
+from telethon.tl.types import Channel, ChatPhotoEmpty
+from PIL import Image
 from src.config import settings
 
 @pytest.fixture
@@ -112,3 +125,490 @@ async def test_message_grouping(db_session, mock_telegram_message, mock_client):
     assert len(messages) == 3
     assert [msg.message_id for msg in messages] == [1, 2, 3]
     assert [msg.text for msg in messages] == ["Part 1", "Part 2", "Part 3"]
+
+@pytest.mark.asyncio
+async def test_parse_channels_concurrent_workers(async_session_factory, mock_telegram_message, tmp_path):
+    settings_names = ['chan_a', 'chan_b', 'chan_c']
+    in_flight = {'now': 0, 'max': 0}
+
+    class FakeClient:
+        def is_connected(self):
+            return True
+
+        async def get_entity(self, name):
+            in_flight['now'] += 1
+            in_flight['max'] = max(in_flight['max'], in_flight['now'])
+            await asyncio.sleep(0.01)
+            in_flight['now'] -= 1
+            channel = Mock()
+            channel.id = settings_names.index(name.lstrip('@')) + 1
+            channel.access_hash = 1000 + channel.id
+            channel.username = name.lstrip('@')
+            channel.title = name
+            return channel
+
+        async def get_messages(self, channel, limit=None, **kwargs):
+            return [mock_telegram_message(id=10, text=f"Post in {channel.username}", media_type='photo')]
+
+        async def download_media(self, media, file=None, thumb=None):
+            return b'photo-bytes'
+
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=FakeClient())
+    parser = TelegramParser(session_manager, channel_workers=3, max_inflight_requests=2,
+                            blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+
+    with patch('src.parser.telegram_parser.CHANNEL_NAMES', settings_names):
+        await parser.parse_channels()
+
+    async with async_session_factory() as db:
+        assert await db.scalar(select(func.count(ChannelState.id))) == 3
+        names = await db.scalars(select(MessageGroup.channel_name))
+        assert sorted(names) == settings_names
+        # The same photo posted in three channels is stored once
+        hashes = set(await db.scalars(select(MediaItem.content_hash)))
+    assert in_flight['max'] == 2
+    assert len(hashes) == 1
+    assert LocalBlobStore(tmp_path).get(hashes.pop()) == b'photo-bytes'
+
+@pytest.mark.asyncio
+async def test_media_downloader_respects_byte_budget(mock_telegram_message):
+    in_flight = {'now': 0, 'max': 0}
+
+    async def fetch(message, media):
+        in_flight['now'] += 1
+        in_flight['max'] = max(in_flight['max'], in_flight['now'])
+        await asyncio.sleep(0.01)
+        in_flight['now'] -= 1
+        return f"bytes-{message.id}".encode()
+
+    # Every mock photo is expected to be 200 bytes
+    downloader = MediaDownloader(fetch, max_concurrency=10, max_bytes_in_flight=400)
+    messages = [mock_telegram_message(id=i, grouped_id=7, media_type='photo') for i in range(1, 6)]
+    messages.append(mock_telegram_message(id=6, grouped_id=7))
+
+    media_data = await downloader.download_messages(messages)
+
+    assert media_data == {i: f"bytes-{i}".encode() for i in range(1, 6)}
+    assert in_flight['max'] == 2
+    assert downloader.budget.in_flight == 0
+
+@pytest.mark.asyncio
+async def test_message_window_assembles_albums(mock_telegram_message, tmp_path):
+    # Messages 11-15 were fetched; album 100 spans 12-13, album 200 continues past 15
+    fetched = [
+        mock_telegram_message(id=11, text="Single"),
+        mock_telegram_message(id=12, text="A1", grouped_id=100),
+        mock_telegram_message(id=13, text="A2", grouped_id=100),
+        mock_telegram_message(id=14, text="B1", grouped_id=200),
+        mock_telegram_message(id=15, text="B2", grouped_id=200),
+    ]
+    beyond_edge = {16: mock_telegram_message(id=16, text="B3", grouped_id=200)}
+
+    client = AsyncMock()
+    client.get_messages.side_effect = lambda channel, ids=None, **kwargs: [beyond_edge.get(i) for i in ids]
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path))
+    await parser.start()
+
+    window = MessageWindow(reversed(fetched), low=11, high=15)
+    single = await parser._get_message_group(None, fetched[0], window)
+    album = await parser._get_message_group(None, fetched[1], window)
+    assert [m.id for m in single] == [11]
+    assert [m.id for m in album] == [12, 13]
+    assert client.get_messages.await_count == 0
+
+    crossing = await parser._get_message_group(None, fetched[3], window)
+    assert [m.id for m in crossing] == [14, 15, 16]
+    client.get_messages.assert_awaited_once_with(None, ids=list(range(16, 24)))
+
+    # The edge was covered by the targeted fetch, so asking again is free
+    await parser._get_message_group(None, fetched[4], window)
+    assert client.get_messages.await_count == 1
+
+@pytest.mark.asyncio
+async def test_channel_entities_are_cached_across_restarts(async_session_factory, tmp_path):
+    client = AsyncMock()
+    client.get_entity.return_value = Channel(
+        id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals"
+    )
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path))
+    await parser.start()
+    async with async_session_factory() as db:
+        await parser.entity_cache.load(db)
+        first = await parser._resolve_channel('rentals', db)
+    assert first.id == 42
+    assert client.get_entity.await_count == 1
+
+    # A restarted parser resolves the channel from the database
+    restarted = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path))
+    await restarted.start()
+    async with async_session_factory() as db:
+        await restarted.entity_cache.load(db)
+        cached = await restarted._resolve_channel('rentals', db)
+    assert (cached.id, cached.access_hash, cached.username) == (42, 777, "rentals")
+    assert client.get_entity.await_count == 1
+
+@pytest.mark.asyncio
+async def test_live_album_is_saved_once(async_session_factory, mock_telegram_message, tmp_path):
+    client = AsyncMock()
+    client.download_media.return_value = b'photo-bytes'
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    parser._live_channels = {channel.id: channel}
+    event = Mock()
+    event.chat_id = -1000000000042
+    event.messages = [
+        mock_telegram_message(id=8, text="Part 2", grouped_id=100, media_type='photo'),
+        mock_telegram_message(id=7, text="Part 1", grouped_id=100, media_type='photo'),
+    ]
+
+    await parser._on_album(event)
+    await parser._on_album(event)
+
+    async with async_session_factory() as db:
+        group = (await db.scalars(select(MessageGroup))).one()
+        # Only polling moves the channel state
+        assert await db.scalar(select(func.count(ChannelState.id))) == 0
+    assert (group.first_message_id, group.combined_text) == (7, "Part 1\nPart 2")
+
+@pytest.mark.asyncio
+async def test_refetched_groups_are_merged_not_duplicated(async_session_factory, mock_telegram_message, tmp_path):
+    client = AsyncMock()
+    client.download_media.return_value = b'photo-bytes'
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    album = [
+        mock_telegram_message(id=7, text="Part 1", grouped_id=100, media_type='photo'),
+        mock_telegram_message(id=8, text="Part 2", grouped_id=100, media_type='photo'),
+    ]
+    late_member = mock_telegram_message(id=9, text="Part 3", grouped_id=100, media_type='photo')
+
+    async with async_session_factory() as db:
+        assert await parser._process_message_group(channel, album[0], db, messages=album) == 8
+        # The same album fetched again in the next cycle
+        assert await parser._process_message_group(channel, album[0], db, messages=album) == 8
+        assert client.download_media.await_count == 2
+
+        # The group was extracted before its last member arrived
+        await db.execute(update(MessageGroup).values(processing_state=STATE_DONE))
+        db.add(CleanedListing(group_id=1, original_text="Part 1\nPart 2"))
+        await db.commit()
+        assert await parser._process_message_group(channel, album[0], db, messages=album + [late_member]) == 9
+
+    async with async_session_factory() as db:
+        group = (await db.scalars(select(MessageGroup))).one()
+        assert (group.first_message_id, group.combined_text) == (7, "Part 1\nPart 2\nPart 3")
+        assert group.processing_state == STATE_PENDING
+        assert await db.scalar(select(func.count(Message.id))) == 3
+        assert await db.scalar(select(func.count(MediaItem.id))) == 3
+        assert await db.scalar(select(func.count(CleanedListing.id))) == 0
+
+@pytest.mark.asyncio
+async def test_merge_into_claimed_group_keeps_the_lease(async_session_factory, mock_telegram_message, tmp_path):
+    client = AsyncMock()
+    client.download_media.return_value = b'photo-bytes'
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    album = [mock_telegram_message(id=7, text="Part 1", grouped_id=100, media_type='photo')]
+    late_member = mock_telegram_message(id=8, text="Part 2", grouped_id=100, media_type='photo')
+    queue = WorkQueue(async_session_factory, worker_id='worker')
+
+    async with async_session_factory() as db:
+        await parser._process_message_group(channel, album[0], db, messages=album)
+        assert await queue.claim(1) == [1]
+        # The last member arrives while the worker extracts the first one's text
+        await parser._process_message_group(channel, album[0], db, messages=album + [late_member])
+
+    async with async_session_factory() as db:
+        group = await db.get(MessageGroup, 1)
+        assert (group.processing_state, group.lease_owner, group.attempts) == (STATE_CLAIMED, 'worker', 1)
+        assert await queue.heartbeat([1]) == {1}
+
+        # The stale extraction is not completed, and the group is queued again
+        assert await queue.complete(db, [1]) == set()
+        await db.commit()
+        assert await queue.requeue_changed([1]) == {1}
+        await db.refresh(group)
+        assert (group.processing_state, group.lease_owner, group.attempts) == (STATE_PENDING, None, 0)
+    assert await queue.claim(1) == [1]
+
+@pytest.mark.asyncio
+async def test_backfill_resumes_from_checkpoint(async_session_factory, mock_telegram_message, tmp_path):
+    # Messages 1-12, with album 100 spanning 7-9 across the first page edge
+    history = {
+        i: mock_telegram_message(id=i, text=f"Post {i}", grouped_id=100 if 7 <= i <= 9 else None, media_type='photo')
+        for i in range(1, 13)
+    }
+    calls = {'pages': 0}
+
+    class FakeClient:
+        def is_connected(self):
+            return True
+
+        async def get_messages(self, channel, limit=None, offset_id=0, ids=None):
+            if ids is not None:
+                return [history.get(i) for i in ids]
+            calls['pages'] += 1
+            if calls['pages'] == 2:
+                raise ConnectionError("connection lost")
+            below = [i for i in sorted(history, reverse=True) if not offset_id or i < offset_id]
+            return [history[i] for i in below[:limit]]
+
+        async def download_media(self, media, file=None, thumb=None):
+            return b'photo-bytes'
+
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=FakeClient())
+    backfill = ChannelBackfill(session_manager, page_size=4, blob_store=LocalBlobStore(tmp_path),
+                               session_factory=async_session_factory)
+    await backfill.start()
+    session_manager.get_client.assert_awaited_once_with(session_manager.backfill_rate_limiter)
+    backfill.parser.entity_cache.get = Mock(return_value=Channel(
+        id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals"
+    ))
+
+    checkpoint_id = await backfill.request('rentals', min_message_id=2)
+    # The connection drops while fetching the second page
+    assert await backfill.run_pending() == 4
+    async with async_session_factory() as db:
+        checkpoint = await db.get(BackfillCheckpoint, checkpoint_id)
+        assert (checkpoint.next_offset_id, checkpoint.completed_date) == (9, None)
+
+    # After a restart the backfill continues below message 9 and stops at the bound
+    await backfill.run_pending()
+    async with async_session_factory() as db:
+        checkpoint = await db.get(BackfillCheckpoint, checkpoint_id)
+        assert checkpoint.next_offset_id == 1
+        assert checkpoint.completed_date is not None
+        groups = (await db.scalars(select(MessageGroup).order_by(MessageGroup.first_message_id))).all()
+        assert [group.first_message_id for group in groups] == [3, 4, 5, 6, 7, 10, 11, 12]
+        assert groups[4].combined_text == "Post 7\nPost 8\nPost 9"
+        assert await db.scalar(select(func.count(ChannelState.id))) == 0
+    assert await backfill.run_pending() == 0
+
+@pytest.mark.asyncio
+async def test_backfill_bounds_stop_at_retention(async_session_factory, tmp_path):
+    session_manager = Mock()
+    backfill = ChannelBackfill(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    now = datetime.now(timezone.utc)
+    last_week = now - timedelta(days=7)
+
+    with patch('src.parser.backfill.RETENTION_HOURS', 48):
+        clamped = await backfill.request('rentals', min_date=last_week)
+        by_id = await backfill.request('flats', min_message_id=2)
+        kept = await backfill.request('studios', min_date=last_week, beyond_retention=True)
+        recent = await backfill.request('rooms', min_date=now - timedelta(hours=1))
+
+    async with async_session_factory() as db:
+        bounds = {
+            checkpoint_id: (await db.get(BackfillCheckpoint, checkpoint_id)).min_date.replace(tzinfo=timezone.utc)
+            for checkpoint_id in (clamped, by_id, kept, recent)
+        }
+    horizon = now - timedelta(hours=48)
+    assert abs(bounds[clamped] - horizon) < timedelta(minutes=1)
+    assert abs(bounds[by_id] - horizon) < timedelta(minutes=1)
+    assert bounds[kept] == last_week
+    assert bounds[recent] == now - timedelta(hours=1)
+
+@pytest.mark.asyncio
+async def test_catch_up_commits_state_page_by_page(async_session_factory, mock_telegram_message, tmp_path):
+    # Messages 3-13 are new, album 100 spans 5-7 across the first page edge
+    history = {
+        i: mock_telegram_message(id=i, text=f"Post {i}", grouped_id=100 if 5 <= i <= 7 else None, media_type='photo')
+        for i in range(1, 14)
+    }
+    calls = {'pages': 0, 'largest': 0}
+
+    class FakeClient:
+        def is_connected(self):
+            return True
+
+        async def get_messages(self, channel, limit=None, min_id=0, max_id=0, reverse=False, ids=None):
+            if ids is not None:
+                return [history.get(i) for i in ids]
+            if not reverse:
+                return [history[max(history)]]
+            calls['pages'] += 1
+            if calls['pages'] == 3:
+                raise ConnectionError("connection lost")
+            page = [history[i] for i in sorted(history) if min_id < i < max_id][:limit]
+            calls['largest'] = max(calls['largest'], len(page))
+            return page
+
+        async def download_media(self, media, file=None, thumb=None):
+            return b'photo-bytes'
+
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=FakeClient())
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    parser.page_size = 3
+    await parser.start()
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    parser.entity_cache.get = Mock(return_value=channel)
+
+    async with async_session_factory() as db:
+        db.add(ChannelState(channel_id=42, channel_name="rentals", last_message_id=2))
+        await db.commit()
+
+    # The connection drops on the third page; the first two pages are kept
+    with patch('src.parser.telegram_parser.CHANNEL_NAMES', ['rentals']):
+        await parser.parse_channels()
+    async with async_session_factory() as db:
+        assert await db.scalar(select(ChannelState.last_message_id)) == 8
+
+        with patch('src.parser.telegram_parser.CHANNEL_NAMES', ['rentals']):
+            await parser.parse_channels()
+        assert await db.scalar(select(ChannelState.last_message_id)) == 12
+        first_ids = await db.scalars(select(MessageGroup.first_message_id).order_by(MessageGroup.first_message_id))
+        assert list(first_ids) == [3, 4, 5, 8, 9, 10, 11, 12]
+        assert await db.scalar(select(func.count(Message.id))) == 10
+    assert calls['largest'] == 3
+
+@pytest.mark.asyncio
+async def test_photos_get_thumbnail_and_perceptual_hash(async_session_factory, mock_telegram_message, tmp_path):
+    photo = Image.effect_mandelbrot((800, 600), (-2.0, -1.2, 1.0, 1.2), 64).convert('RGB')
+    downloads = []
+    for size, quality in (((800, 600), 95), ((640, 480), 70)):
+        data = io.BytesIO()
+        photo.resize(size).save(data, format='JPEG', quality=quality)
+        downloads.append(data.getvalue())
+
+    client = AsyncMock()
+    client.download_media.side_effect = downloads
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+    store = LocalBlobStore(tmp_path)
+    parser = TelegramParser(session_manager, blob_store=store, session_factory=async_session_factory)
+    parser.image_processor = ImageProcessor(workers=0)
+    await parser.start()
+
+    # The same photo, recompressed, is posted in a second channel
+    for channel_id, username in ((42, "rentals"), (43, "flats")):
+        channel = Channel(id=channel_id, title=username, photo=ChatPhotoEmpty(), date=None, access_hash=1, username=username)
+        async with async_session_factory() as db:
+            message = mock_telegram_message(id=5, text="2+1, 65 m2", media_type='photo')
+            assert await parser._process_groups_pipelined(channel, [[message]], db) == [5]
+
+    async with async_session_factory() as db:
+        first, repost = (await db.scalars(select(MediaItem).order_by(MediaItem.id))).all()
+    assert first.thumbnail_hash != first.content_hash
+    assert Image.open(io.BytesIO(store.get(first.thumbnail_hash))).size == (320, 240)
+    assert repost.group_id != first.group_id
+    assert {group_id for group_id, _ in parser.image_index.find(repost.phash)} == {first.group_id, repost.group_id}
+
+@pytest.mark.asyncio
+async def test_non_listings_are_kept_out_of_the_llm_queue(async_session_factory, mock_telegram_message, tmp_path):
+    client = AsyncMock()
+    client.download_media.return_value = b'photo-bytes'
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=client)
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    notice = [mock_telegram_message(id=7, text="Rented!", grouped_id=100, media_type='photo')]
+    late_caption = mock_telegram_message(id=8, text="2+1 for rent, $600, +995 555 12 34 56", grouped_id=100,
+                                         media_type='photo')
+
+    async with async_session_factory() as db:
+        await parser._process_message_group(channel, notice[0], db, messages=notice)
+        group = (await db.scalars(select(MessageGroup))).one()
+        assert group.processing_state == STATE_SKIPPED
+        assert group.relevance_score < parser.relevance.min_score
+
+    # The album's caption arrives late; the group is scored again
+    async with async_session_factory() as db:
+        await parser._process_message_group(channel, late_caption, db, messages=notice + [late_caption])
+        group = (await db.scalars(select(MessageGroup))).one()
+        assert group.processing_state == STATE_PENDING
+        assert group.relevance_score > 0.5
+
+@pytest.mark.asyncio
+async def test_reposts_join_the_cluster_of_the_listing(async_session_factory, mock_telegram_message, tmp_path):
+    session_manager = Mock()
+    client = AsyncMock()
+    client.download_media.return_value = b'photo-bytes'
+    session_manager.get_client = AsyncMock(return_value=client)
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+
+    text = "2+1 for rent in Vake, 65 m2, 5/9 floor\nNear the metro and the park\n$600 per month\n+995 555 12 34 56"
+    posts = [
+        mock_telegram_message(id=1, text=text, media_type='photo'),
+        mock_telegram_message(id=2, text="Studio for rent in Saburtalo, 35 m2, $350, call 599 11 22 33",
+                              media_type='photo'),
+        mock_telegram_message(id=3, text="🔥 " + text.replace("$600", "$550"), media_type='photo'),
+    ]
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    for post in posts:
+        async with async_session_factory() as db:
+            await parser._process_message_group(channel, post, db, messages=[post])
+
+    async with async_session_factory() as db:
+        groups = (await db.scalars(select(MessageGroup).order_by(MessageGroup.id))).all()
+    assert [group.cluster_id for group in groups] == [groups[0].id, groups[1].id, groups[0].id]
+    assert len(parser.text_index) == 3
+
+@pytest.mark.asyncio
+async def test_live_messages_leave_the_gap_to_polling(async_session_factory, mock_telegram_message, tmp_path):
+    # Messages 11-14 were posted while disconnected; 15 arrives live after reconnecting
+    history = {i: mock_telegram_message(id=i, text=f"Post {i}", media_type='photo') for i in range(11, 16)}
+    fetched = []
+
+    class FakeClient:
+        def is_connected(self):
+            return True
+
+        async def get_messages(self, channel, limit=None, min_id=0, max_id=0, reverse=False, ids=None):
+            if not reverse:
+                return [history[max(history)]]
+            page = [history[i] for i in sorted(history) if min_id < i < max_id][:limit]
+            fetched.extend(message.id for message in page)
+            return page
+
+        async def download_media(self, media, file=None, thumb=None):
+            return b'photo-bytes'
+
+    session_manager = Mock()
+    session_manager.get_client = AsyncMock(return_value=FakeClient())
+    parser = TelegramParser(session_manager, blob_store=LocalBlobStore(tmp_path), session_factory=async_session_factory)
+    await parser.start()
+    channel = Channel(id=42, title="Rentals", photo=ChatPhotoEmpty(), date=None, access_hash=777, username="rentals")
+    parser.entity_cache.get = Mock(return_value=channel)
+    parser._live_channels = {channel.id: channel}
+    async with async_session_factory() as db:
+        db.add(ChannelState(channel_id=42, channel_name="rentals", last_message_id=10))
+        await db.commit()
+
+    event = Mock()
+    event.chat_id = -1000000000042
+    event.message = history[15]
+    await parser._on_new_message(event)
+    async with async_session_factory() as db:
+        assert await db.scalar(select(ChannelState.last_message_id)) == 10
+
+    # Gap repair fetches 11-14, and 14 is the newest message it asks for
+    with patch('src.parser.telegram_parser.CHANNEL_NAMES', ['rentals']):
+        await parser.parse_channels()
+    assert fetched == [11, 12, 13, 14]
+    async with async_session_factory() as db:
+        first_ids = await db.scalars(select(MessageGroup.first_message_id).order_by(MessageGroup.first_message_id))
+        assert list(first_ids) == [11, 12, 13, 14, 15]
+        assert await db.scalar(select(ChannelState.last_message_id)) == 14
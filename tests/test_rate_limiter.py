@@ -0,0 +1,47 @@
+import pytest
+import sys
+import time
+from pathlib import Path
+from unittest.mock import AsyncMock
+
+# Add the project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from telethon.errors import FloodWaitError
+from src.telegram.rate_limiter import AdaptiveRateLimiter, RateLimitedClient
+
+@pytest.mark.asyncio
+async def test_limiter_paces_requests_beyond_burst():
+    limiter = AdaptiveRateLimiter(rate=100, min_rate=1, max_rate=100, burst=2, increase_step=0)
+    started = time.monotonic()
+    for _ in range(5):
+        await limiter.acquire()
+
+    # Two requests pass at once, the remaining three wait ~10ms each
+    assert time.monotonic() - started >= 0.025
+    assert limiter.stats()['requests'] == 5
+    assert limiter.stats()['throttle_wait_seconds'] > 0
+
+@pytest.mark.asyncio
+async def test_client_retries_after_flood_wait_and_slows_down():
+    limiter = AdaptiveRateLimiter(rate=10, min_rate=0.5, max_rate=20, burst=10)
+    client = AsyncMock()
+    client.get_messages.side_effect = [FloodWaitError(request=None, capture=0), ['message']]
+    wrapped = RateLimitedClient(client, limiter, max_flood_retries=2)
+
+    assert await wrapped.get_messages('channel', limit=1) == ['message']
+    assert client.get_messages.await_count == 2
+    stats = limiter.stats()
+    assert stats['flood_waits'] == 1
+    assert stats['rate'] < 10
+
+@pytest.mark.asyncio
+async def test_client_raises_when_flood_wait_is_too_long():
+    limiter = AdaptiveRateLimiter(rate=10, min_rate=0.5, max_rate=20, burst=10)
+    client = AsyncMock()
+    client.get_entity.side_effect = FloodWaitError(request=None, capture=3600)
+    wrapped = RateLimitedClient(client, limiter, max_flood_wait=600)
+
+    with pytest.raises(FloodWaitError):
+        await wrapped.get_entity('channel')
+    assert limiter.stats()['flood_wait_seconds'] == 3600
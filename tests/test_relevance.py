@@ -0,0 +1,68 @@
+import pytest
+import sys
+from pathlib import Path
+from datetime import datetime
+
+# Add the project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from sqlalchemy import select
+
+from src.database.models import MessageGroup, CleanedListing, STATE_DONE, STATE_FAILED, STATE_PENDING, STATE_SKIPPED
+from src.parser.relevance import RelevanceClassifier, evaluate, labelled_groups, apply
+
+LISTINGS = [
+    "2+1 for rent in Vake, 65 m², $600, +995 555 12 34 56",
+    "Сдается квартира 1+1, 40 кв.м, 400$, 599 11 22 33",
+    "ქირავდება 3+1 ბინა, 1800 ლარი, 577 12 34 56",
+    "Studio for rent near the metro, 350 USD, @owner",
+    "New renovated flat for rent, 80 m2, 900$",
+]
+OTHERS = [
+    "Rented!",
+    "Продается квартира 3+1, 120000$",
+    "Subscribe to our channel for daily deals",
+    "",
+    "Happy new year to all our subscribers!",
+]
+
+def test_keyword_model_skips_non_listings():
+    classifier = RelevanceClassifier(min_score=0.1)
+
+    assert all(classifier.is_listing(classifier.score(text)) for text in LISTINGS)
+    assert not any(classifier.is_listing(classifier.score(text)) for text in OTHERS[:4])
+    assert RelevanceClassifier(min_score=0).is_listing(classifier.score("Rented!"))
+
+@pytest.mark.asyncio
+async def test_classifier_trains_on_finished_groups(async_session_factory, tmp_path):
+    async with async_session_factory() as session:
+        for i, text in enumerate(LISTINGS * 4 + OTHERS * 4):
+            is_listing = i < len(LISTINGS) * 4
+            group = MessageGroup(channel_id=1, group_id=i, combined_text=text, posted_date=datetime.utcnow(),
+                                 processing_state=STATE_DONE if is_listing else STATE_FAILED)
+            if is_listing:
+                group.cleaned_listing = CleanedListing(address=text)
+            session.add(group)
+        session.add(MessageGroup(channel_id=2, group_id=1, combined_text="Rented, thanks!", posted_date=datetime.utcnow()))
+        await session.commit()
+
+        samples = [(text, is_listing) async for _, text, is_listing in labelled_groups(session)]
+    assert len(samples) == 40
+    assert sum(is_listing for _, is_listing in samples) == 20
+
+    classifier = RelevanceClassifier.train(samples, min_count=2, min_score=0.5)
+    assert evaluate(classifier, samples) == {
+        'groups': 40, 'skipped': 20, 'precision': 1.0, 'recall': 1.0, 'listings_skipped': 0
+    }
+
+    classifier.save(tmp_path / 'model.json')
+    loaded = RelevanceClassifier.load(tmp_path / 'model.json', min_score=0.5)
+    assert loaded.score(LISTINGS[0]) == pytest.approx(classifier.score(LISTINGS[0]))
+    assert RelevanceClassifier.load(tmp_path / 'missing.json').weights == RelevanceClassifier().weights
+
+    # Pending groups saved before the classifier are scored in place
+    assert await apply(RelevanceClassifier(min_score=0.1), async_session_factory, chunk_size=1) == 1
+    async with async_session_factory() as session:
+        group = (await session.scalars(select(MessageGroup).where(MessageGroup.channel_id == 2))).one()
+        assert group.processing_state == STATE_SKIPPED
+        assert group.relevance_score < 0.1
@@ -0,0 +1,66 @@
+import pytest
+import os
+import sys
+from pathlib import Path
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, delete
+
+# Add the project root directory to Python path
+sys.path.append(str(Path(__file__).parent.parent))
+
+from src.database.models import MessageGroup, Message, MediaItem, CleanedListing
+from src.database.retention import RetentionEngine
+from src.storage.blob_store import LocalBlobStore
+
+def make_group(group_id, posted_date, content_hash):
+    group = MessageGroup(channel_id=1, group_id=group_id, combined_text=f"Post {group_id}", posted_date=posted_date)
+    group.messages = [Message(message_id=group_id, text=f"Post {group_id}")]
+    group.media_items = [MediaItem(media_type='photo', content_hash=content_hash)]
+    group.cleaned_listing = CleanedListing(original_text=f"Post {group_id}")
+    return group
+
+async def count(session_factory, model):
+    async with session_factory() as db:
+        return await db.scalar(select(func.count(model.id)))
+
+@pytest.mark.asyncio
+async def test_retention_deletes_expired_groups_in_chunks(async_session_factory, tmp_path):
+    store = LocalBlobStore(tmp_path / 'media')
+    expired_photo = store.put(b'expired photo')
+    shared_photo = store.put(b'reposted photo')
+    # Blobs younger than an hour are kept by the garbage collector
+    for key in (expired_photo, shared_photo):
+        os.utime(store.path_for(key), (0, 0))
+
+    now = datetime.utcnow()
+    async with async_session_factory() as db:
+        db.add_all(make_group(i, now - timedelta(hours=72), expired_photo) for i in range(4))
+        db.add(make_group(4, now - timedelta(hours=72), shared_photo))
+        db.add(make_group(5, now - timedelta(hours=1), shared_photo))
+        await db.commit()
+
+    engine = RetentionEngine(async_session_factory, retention_hours=48, chunk_size=2, blob_store=store)
+    stats = await engine.run(now=now)
+
+    assert stats['message_groups'] == stats['messages'] == stats['media_items'] == stats['cleaned_listings'] == 5
+    assert stats['chunks'] == 3
+    assert stats['blobs'] == 1
+    assert await count(async_session_factory, MessageGroup) == 1
+    assert await count(async_session_factory, MediaItem) == 1
+    assert not store.exists(expired_photo)
+    assert store.exists(shared_photo)
+
+    # Nothing is left to delete on the next run
+    stats = await engine.run(now=now)
+    assert (stats['message_groups'], stats['chunks']) == (0, 0)
+
+@pytest.mark.asyncio
+async def test_deleting_a_group_cascades_in_the_database(async_session_factory):
+    async with async_session_factory() as db:
+        db.add(make_group(1, datetime.utcnow(), None))
+        await db.commit()
+        await db.execute(delete(MessageGroup))
+        await db.commit()
+
+    for model in (Message, MediaItem, CleanedListing):
+        assert await count(async_session_factory, model) == 0